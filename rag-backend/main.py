@@ -4,20 +4,59 @@ main - fastapi 入口文件
 Author: lsy
 Date: 2026/1/22
 """
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from typing import Literal, Optional
 import json
 import asyncio
 import time
-
-from src.api_requests import APIProcessor
-from src.retrieval import HybridRetriever,BM25Retriever,VectorRetriever
-from src.reranking import LLMReranker
+from concurrent.futures import ThreadPoolExecutor
+
+import src.config as config
+from src.api_requests import APIProcessor, generation_latency
+from src.registry import RetrieverRegistry
+from src.answer_cache import get_answer_cache
+from src.single_flight import SingleFlight
+from src.context_packing import ContextPacker, log_packing
+from src.cache import normalize_text
+from src.async_dashscope import get_async_client
+from src.streaming import coalesce_deltas
+from src.deadline import RequestDeadline, deadline_stats, wait_within
+from src.candidates import Candidates
+from src.admission import AdmissionController, AdmissionRejected
+from src.question_router import QuestionRouter, DIRECT_KINDS, DIRECT_REPLIES, KIND_LABELS, kind_preset
 from pathlib import Path
 
-app = FastAPI()
+vector_db_dir = Path('data/stock_data/databases/vector_dbs')
+vector_index_path = vector_db_dir / 'all_reports.faiss'
+
+# 进程级共享的检索器，启动时加载一次，请求中只读使用
+registry = RetrieverRegistry(vector_index_path, vector_db_dir)
+# 有界线程池：同步的检索代码（FAISS、jieba+BM25、重排调度）在这里执行，事件循环保持空闲
+retrieval_executor = ThreadPoolExecutor(max_workers=config.RETRIEVAL_WORKERS, thread_name_prefix='retrieval')
+# 语义答案缓存（RAG_ANSWER_CACHE=1 时启用）：相似问题直接回放缓存的重排结果和答案
+answer_cache = get_answer_cache()
+# 相同问题的在途请求合并（RAG_SINGLE_FLIGHT=1）：只执行一次检索和生成，其余请求订阅同一个事件流
+single_flight = SingleFlight()
+# 上下文打包（RAG_CONTEXT_PACKING=1）：合并相邻块、去重、控制送给生成模型的 token 数
+context_packer = ContextPacker()
+# 问题路由（RAG_QUESTION_ROUTER=1）：问候/无关问题直接回复，其余问题按类型选择提示词和候选深度
+question_router = QuestionRouter()
+# 准入控制：限制同时执行的 /query 数和各阶段并发，超出的请求有界排队，队列满时快速拒绝
+admission = AdmissionController()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    registry.load()
+    question_router.fit()
+    yield
+    await get_async_client().close()
+    retrieval_executor.shutdown(wait=False)
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -25,42 +64,75 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # 允许所有 HTTP 方法
     allow_headers=["*"],  # 允许所有请求头
+    expose_headers=["Retry-After"],  # 准入控制拒绝时前端需要读取重试等待秒数
 )
 
-vector_index_path = Path('data/stock_data/databases/vector_dbs/all_reports.faiss')
-metadata_path = Path('data/stock_data/databases/vector_dbs/all_metadata.json')
-
 # 1. 定义请求体的数据模型
 class QuestionRequest(BaseModel):
     question: str
-
-async def search_vector(question):
-    vector_retriever = VectorRetriever(vector_index_path, metadata_path)
-    vector_results = vector_retriever.get_relevant_chunks(question, top_n=20)
+    # 混合检索融合方式与候选保留策略，可按请求选择
+    fusion_method: Literal["weighted", "rrf"] = config.FUSION_METHOD
+    fusion_policy: Literal["union", "intersection", "primary"] = config.FUSION_POLICY
+    # 排队优先级：执行名额不足时 high 先于 normal 先于 low，同优先级先到先执行
+    priority: Literal["high", "normal", "low"] = "normal"
+    # 延迟档位：fast 跳过重排、balanced 级联重排、accurate 完整流程，各档位参数见 config.MODE_PRESETS
+    mode: Literal["fast", "balanced", "accurate"] = config.DEFAULT_MODE
+    # 请求截止秒数，不传时使用 config.REQUEST_DEADLINE；阶段超时时降级（见 src.deadline）
+    deadline: Optional[float] = Field(None, gt=0)
+    # 问题类型，不传时由问题路由判断（见 src.question_router）
+    kind: Optional[Literal["fact", "reasoning", "compare", "summary", "greeting", "other"]] = None
+
+async def search_vector(question, top_n=config.RETRIEVAL_TOP_N):
+    # embedding 请求走异步客户端的连接池，只有 FAISS 检索占用线程池；同时向量化的请求数受 embedding 阶段名额限制
+    async with admission.stage("embedding").slot():
+        vector_results = await registry.vector_retriever.asearch(
+            question, top_n=top_n, executor=retrieval_executor)
     return vector_results
 
-async def search_bm25(question):
-    bm25_retriever = BM25Retriever(metadata_path)
-    bm25_results = bm25_retriever.retrieve(question, top_n=20)
+async def embed_question(question):
+    async with admission.stage("embedding").slot():
+        return await registry.vector_retriever.embedding_cache.aembed(question)
+
+def search_bm25(question, top_n=config.RETRIEVAL_TOP_N):
+    bm25_results = registry.bm25_retriever.search(question, top_n=top_n)
     return bm25_results
 
-def hybrid_chunks(vector_results,bm25_results):
-    hybrid_retriever = HybridRetriever(vector_index_path=vector_index_path,metadata_path=metadata_path)
-    hybrid_results = hybrid_retriever._merge_hybrid_results(vector_results, bm25_results, 0.6)
+def hybrid_chunks(vector_results,bm25_results,method=config.FUSION_METHOD,policy=config.FUSION_POLICY,
+                  top_n=config.RERANK_CANDIDATES):
+    hybrid_results = registry.hybrid_retriever._merge_hybrid_results(
+        vector_results, bm25_results, config.FUSION_VECTOR_WEIGHT,
+        method=method, policy=policy, top_n=top_n,
+    )
     return hybrid_results
 
-def rerank_chunks(question,hybrid_results,top_n=8,rerank_batch_size=4):
-    reranker = LLMReranker()
-    reranked_results = reranker.rerank_chunks(
+def rerank_chunks(question,hybrid_results,top_n=8,rerank_batch_size=None,cascade=None):
+    reranked_results = registry.reranker.rerank_chunks(
         question=question,
         retrieved_chunks=hybrid_results,
         top_n=top_n,
         rerank_batch_size=rerank_batch_size,
+        cascade=cascade,
     )
     return reranked_results
 
-def format_retrieval_results(retrieval_results) -> str:
+def new_chunk_summaries(candidates, sent_ids: set) -> dict:
+    """本次流中尚未发送过的块的摘要（块id -> 正文开头和元数据），已发送的块只传id和分数"""
+    summaries = {}
+    for chunk_id in candidates.ids.tolist():
+        if chunk_id not in sent_ids:
+            sent_ids.add(chunk_id)
+            summaries[chunk_id] = registry.chunk_store.summary(chunk_id, config.STREAM_SNIPPET_CHARS)
+    return summaries
+
+
+def format_retrieval_results(retrieval_results, token_budget: int = None) -> str:
     """将检索结果转化为RAG上下文字符串，优化大模型理解"""
+    if config.CONTEXT_PACKING:
+        # 打包：合并相邻/重叠块、去重、填入 token 预算；节省的 token 由打包器按块估算，不再拼接逐块上下文
+        packed_text, stats = context_packer.pack(retrieval_results, token_budget=token_budget)
+        log_packing(stats)
+        return packed_text
+
     context_parts = []
 
     # 遍历检索出的每一个块
@@ -94,13 +166,60 @@ def format_retrieval_results(retrieval_results) -> str:
     return rag_text
 
 
+def route_question(question: str, kind: str = None) -> dict:
+    """确定问题类型：请求指定 > 问题路由 > 默认 summary"""
+    if kind is not None:
+        return {"kind": kind, "label": KIND_LABELS[kind], "confidence": 1.0, "source": "request"}
+    if config.QUESTION_ROUTER:
+        return question_router.route(question)
+    return {"kind": "summary", "label": KIND_LABELS["summary"], "confidence": 1.0, "source": "default"}
+
+
+async def replay_cached_answer(cached: dict, t0: float, mode: str, kind: str):
+    """命中答案缓存：把缓存的重排结果和答案按与正常流程相同的事件格式发送"""
+    candidates, answer = cached["payload"]["candidates"], cached["payload"]["answer"]
+    yield {
+        "type": "rerank",
+        "content": {
+            "type": "rerank",
+            "title": '⚡ 答案缓存',
+            "description": f'✅ 命中相似问题「{cached["question"]}」（相似度 {cached["similarity"]:.3f}），复用重排结果和答案',
+            "results": candidates.rows(),
+            "time": f"耗时 {time.time() - t0:.2f} s"
+        },
+        "chunks": new_chunk_summaries(candidates, set()),
+    }
+    for i in range(0, len(answer), config.STREAM_FLUSH_CHARS):
+        yield {
+            "type": "answer",
+            "data": answer[i:i + config.STREAM_FLUSH_CHARS]
+        }
+    total = time.time() - t0
+    yield {
+        "type": "done",
+        "timing": f"总耗时 {total:.2f} s",
+        "mode": mode,
+        "kind": kind,
+        "timings": {"total": round(total, 3)},
+        "cached": True
+    }
+
+
 # 2. 模拟一个流式生成数据的函数 (你可以把这里替换成真实的 LLM 调用)
-async def generate_rag_response(question: str):
+async def generate_rag_response(question: str, fusion_method: str = config.FUSION_METHOD,
+                                fusion_policy: str = config.FUSION_POLICY, mode: str = config.DEFAULT_MODE,
+                                deadline_seconds: float = None, kind: str = None):
     """
     适配 RAGInterface.vue 的后端流式生成函数
+    :param mode: 延迟档位，决定候选深度、重排方式和上下文预算（config.MODE_PRESETS），done 事件中回传档位和各阶段耗时
+    :param deadline_seconds: 请求截止秒数，默认 config.REQUEST_DEADLINE；阶段超时时发送 degraded 事件并降级，
+                             done 事件中回传全部降级措施
+    :param kind: 问题类型，不指定时由问题路由判断；问候/无关问题直接回复，其余类型决定提示词和候选深度（config.KIND_DEPTH_SCALES）
     """
+    timings = {}
 
     t0 = time.time()
+    deadline = RequestDeadline(deadline_seconds, start=t0)
     # --- 步骤 1: 接收问题 ---
     yield {
         "type": "input",
@@ -111,9 +230,58 @@ async def generate_rag_response(question: str):
         }
     }
 
+    # --- 问题路由：规则 + 本地模型，微秒级，问候和无关问题不检索 ---
+    route = route_question(question, kind)
+    kind = route["kind"]
+    source_labels = {"rule": "规则", "model": "模型", "default": "默认", "request": "请求指定"}
+    yield {
+        "type": "route",
+        "content": {
+            "type": "route",
+            "title": "🧭 问题分类",
+            "kind": kind,
+            "description": f'✅ {route["label"]}类问题（{source_labels[route["source"]]}，置信度 {route["confidence"]:.2f}）',
+            "time": f'耗时 {route.get("latency_us", 0):.0f} μs'
+        }
+    }
+    if kind in DIRECT_KINDS:
+        yield {
+            "type": "answer",
+            "data": DIRECT_REPLIES[kind]
+        }
+        total = time.time() - t0
+        yield {
+            "type": "done",
+            "timing": f"总耗时 {total:.2f} s",
+            "mode": mode,
+            "kind": kind,
+            "timings": {"total": round(total, 3)},
+            "degradations": []
+        }
+        return
+    preset = kind_preset(config.MODE_PRESETS[mode], kind)
+
+    # --- 语义答案缓存：与历史问题足够相似时跳过检索、重排和生成 ---
+    question_vector = None
+    cache_scope = f"{mode}:{kind}:{fusion_method}:{fusion_policy}:{registry.reranker.name}"
+    if config.ANSWER_CACHE:
+        answer_cache.set_version(registry.index_version)
+        # 问题向量会进入向量缓存，随后的向量检索直接复用；检索阶段到期仍未返回则跳过缓存查找
+        try:
+            question_vector = await wait_within(embed_question(question), deadline.remaining("retrieval"))
+        except asyncio.TimeoutError:
+            question_vector = None
+        cached = None
+        if question_vector is not None:
+            cached = answer_cache.lookup(question_vector, question, scope=cache_scope)
+        if cached is not None:
+            async for event in replay_cached_answer(cached, t0, mode, kind):
+                yield event
+            return
+
     # --- 步骤 2: 检索 ---
-    data = []
-    description = []
+    # 增量事件：每个事件只携带本阶段新增的结果（块id和分数），块摘要在整个流中只发送一次
+    sent_ids = set()
 
     # 初始显示
     yield {
@@ -121,122 +289,266 @@ async def generate_rag_response(question: str):
         "content": {
             "type": "retrieval",
             "title": "🔍 检索阶段",
-            "data": data,
-            "description": description,
         }
     }
+    # 向量检索与BM25检索同时执行，哪个先完成就先更新卡片
     t1 = time.time()
-    vector_results = await search_vector(question=question)
-    t2 = time.time()
-    description.append('✅ 向量检索完成')
-    data.append(vector_results)
-    # 更新同一个卡片
-    yield {
-        "type": "retrieval",
-        "content": {
-            "type": "retrieval",
-            "title": "🔍 检索阶段",
-            "data": data,
-            "description": description,
-            "time": f"耗时 {t2-t1:.2f} s"
-        }
+    loop = asyncio.get_running_loop()
+    vector_task = asyncio.ensure_future(search_vector(question, preset["retrieval_top_n"]))
+    bm25_task = loop.run_in_executor(retrieval_executor, search_bm25, question, preset["retrieval_top_n"])
+    task_stages = {
+        vector_task: ('vector', '✅ 向量检索完成'),
+        bm25_task: ('bm25', '✅ BM25关键词检索完成'),
     }
+    retrieval_results = {}
+    pending = set(task_stages)
+    while pending:
+        done, pending = await asyncio.wait(pending, timeout=deadline.remaining("retrieval"),
+                                           return_when=asyncio.FIRST_COMPLETED)
+        if not done:
+            # 检索阶段到期：已有一路结果时不再等待另一路，两路都没有返回时只能等最先返回的一路
+            if retrieval_results:
+                break
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            stage, description = task_stages[task]
+            t2 = time.time()
+            if stage == 'vector' and task.exception() is not None:
+                # 向量检索失败（embedding 服务报错/超时）时与超时一样降级为只用 BM25 结果
+                yield {"type": "degraded", "content": deadline.degrade(
+                    "retrieval", "bm25_only", f"向量检索失败（{type(task.exception()).__name__}），仅使用BM25结果")}
+                continue
+            retrieval_results[stage] = task.result()
+            # 追加到同一个卡片，耗时为并行阶段的真实墙钟时间
+            yield {
+                "type": "retrieval",
+                "content": {
+                    "type": "retrieval",
+                    "stage": stage,
+                    "description": description,
+                    "results": task.result().rows(),
+                    "time": f"耗时 {t2-t1:.2f} s"
+                },
+                "chunks": new_chunk_summaries(task.result(), sent_ids),
+            }
+    for task in pending:
+        # 未按时返回的一路：向量检索取消 embedding 请求；BM25 在线程中执行，无法中断，结果丢弃
+        task.cancel()
+        if task is vector_task:
+            action, reason = "bm25_only", f"向量检索超过 {time.time() - t1:.1f} s 未返回，仅使用BM25结果"
+        else:
+            action, reason = "vector_only", f"BM25检索超过 {time.time() - t1:.1f} s 未返回，仅使用向量检索结果"
+        yield {"type": "degraded", "content": deadline.degrade("retrieval", action, reason)}
+    vector_results = retrieval_results.get('vector', Candidates.empty())
+    bm25_results = retrieval_results.get('bm25', Candidates.empty())
+    timings["retrieval"] = time.time() - t1
+
+    # 只有一路结果时按并集融合，避免 intersection/primary 策略把结果全部过滤掉
+    hybrid_results = hybrid_chunks(vector_results, bm25_results, method=fusion_method,
+                                   policy=fusion_policy if len(retrieval_results) == 2 else "union",
+                                   top_n=preset["rerank_candidates"])
     t3 = time.time()
-    bm25_results = await search_bm25(question=question)
-    t4 = time.time()
-    description.append('✅ BM25关键词检索完成')
-    data.append(bm25_results)
-    # 更新同一个卡片
-    yield {
-        "type": "retrieval",
-        "content": {
-            "type": "retrieval",
-            "title": "🔍 检索阶段",
-            "data": data,
-            "description": description,
-            "time": f"耗时 {t4-t3+t2-t1:.2f} s"
-        }
-    }
-
-    t5 = time.time()
-    hybrid_results = hybrid_chunks(vector_results, bm25_results)
-    t6 = time.time()
-    description.append('✅ 混合合并完成')
-    data.append(hybrid_results)
-    # 更新同一个卡片
+    timings["fusion"] = t3 - t1 - timings["retrieval"]
+    # 追加到同一个卡片（融合结果的块都已随两路检索结果发送过）
     yield {
         "type": "retrieval",
         "content": {
             "type": "retrieval",
-            "title": "🔍 检索阶段",
-            "data": data,
-            "description": description,
-            "time": f"耗时 {t6-t5+t4-t3+t2-t1:.2f} s"
-        }
+            "stage": "hybrid",
+            "description": '✅ 混合合并完成',
+            "results": hybrid_results.rows(),
+            "time": f"耗时 {t3-t1:.2f} s"
+        },
+        "chunks": new_chunk_summaries(hybrid_results, sent_ids),
     }
 
     t7 = time.time()
-    rerank_results = rerank_chunks(question=question,hybrid_results=hybrid_results,top_n=8,rerank_batch_size=4)
+    if preset["rerank"] == "none":
+        # fast 档位：不重排，直接取融合分数最高的块
+        rerank_results = hybrid_results.sort_by('final_score', top_n=preset["context_top_n"])
+        title = '⚡ 融合排序（快速模式）'
+        description = f'✅ 跳过重排，按融合分数取前 {len(rerank_results)} 个块'
+    else:
+        # balanced 档位对本次请求开启级联（LLM 后端只把不确定的块送 LLM），accurate 按重排器自身配置
+        cascade = True if preset["rerank"] == "cascade" else None
+        label = registry.reranker.label + ('级联' if cascade and registry.reranker.name == 'llm' else '')
+        rerank_slot = admission.stage("rerank")
+        try:
+            # 等待重排名额的时间计入重排阶段，名额不足等到阶段截止时同样按融合分数降级
+            await rerank_slot.acquire(timeout=deadline.remaining("rerank"))
+            # 重排在线程中等待各批次完成（批次本身在共享的重排线程池中并发、限流执行），不阻塞事件循环
+            rerank_future = loop.run_in_executor(
+                retrieval_executor, lambda: rerank_chunks(question=question, hybrid_results=hybrid_results,
+                                                          top_n=preset["context_top_n"], cascade=cascade))
+            # 名额在重排真正结束时归还（超时降级后重排仍在后台执行）
+            rerank_future.add_done_callback(lambda _: rerank_slot.release())
+            # shield：超时后重排在后台继续完成，已算出的分数仍会写入重排缓存
+            rerank_results = await wait_within(asyncio.shield(rerank_future), deadline.remaining("rerank"))
+            title = f'🧠 {label}重排阶段'
+            description = f'✅ {label} 重排完成'
+        except asyncio.TimeoutError:
+            rerank_results = hybrid_results.sort_by('final_score', top_n=preset["context_top_n"])
+            title = '⚡ 融合排序（重排超时）'
+            description = f'⚠️ {label}重排未按时完成，按融合分数取前 {len(rerank_results)} 个块'
+            yield {"type": "degraded", "content": deadline.degrade(
+                "rerank", "fused_order", f"{label}重排超过 {time.time() - t7:.1f} s 未完成，按融合分数排序")}
     t8 = time.time()
+    timings["rerank"] = t8 - t7
 
     # --- 发送参考文档 ---
     yield {
         "type": "rerank",
         "content": {
             "type": "rerank",
-            "title": '🧠 LLM重排阶段',
-            "description": '✅ LLM 重排完成',
-            "data": rerank_results,
+            "title": title,
+            "description": description,
+            "results": rerank_results.rows(),
             "time": f"耗时 {t8-t7:.2f} s"
-        }
+        },
+        "chunks": new_chunk_summaries(rerank_results, sent_ids),
     }
 
     # --- 步骤 3: 生成答案 (打字机效果) ---
     api_processor = APIProcessor()
-    rag_context = format_retrieval_results(rerank_results)
+    # 剩余时间不足生成阶段的份额时缩小上下文：token 预算和块数按同一比例减少
+    token_budget = deadline.context_budget(preset["context_token_budget"])
+    context_results = rerank_results
+    if token_budget < preset["context_token_budget"]:
+        keep = max(1, round(len(rerank_results) * token_budget / preset["context_token_budget"]))
+        context_results = rerank_results.take(list(range(min(keep, len(rerank_results)))))
+        yield {"type": "degraded", "content": deadline.degrade(
+            "generation", "short_context",
+            f"剩余 {deadline.remaining():.1f} s，上下文缩减为 {len(context_results)} 个块、{token_budget} tokens")}
+    rag_context = format_retrieval_results(context_results.materialize(registry.chunk_store),
+                                           token_budget=token_budget)
+    t_context = time.time()
+    timings["context"] = t_context - t8
     
-    # 获取真实的LLM流式响应
-    responses = api_processor.get_answer_from_rag_context(
+    # 获取真实的LLM流式响应（异步客户端，等待数据块时不阻塞事件循环）
+    responses = api_processor.stream_answer_from_rag_context(
         question=question,
         rag_context=rag_context,
-        kind="summary",  # 添加缺失的参数
+        kind=kind,  # 路由得到的问题类型，决定提示词模版
         model='qwen-turbo-latest',  # 使用实际模型名称而不是'dashscope'
-        stream=True  # 启用流式输出
     )
-    
-    # 处理流式响应
-    full_answer = ""
-    for response in responses:
-        if hasattr(response, 'output') and hasattr(response.output, 'choices'):
-            content = response.output.choices[0].message.content or ""
-        else:
-            content = ""
-        
-        # 将每个响应内容逐字符发送
-        for char in content:
-            full_answer += char
-            yield {
-                "type": "answer",
-                "data": char
-            }
+
+    # 处理流式响应：增量按时间窗口/字符数合并后发送，打字效果由前端逐字渲染
+    answer_parts = []
+    generation_error = None
+    async with admission.stage("generation").slot():
+        try:
+            async for content in coalesce_deltas(responses):
+                answer_parts.append(content)
+                yield {
+                    "type": "answer",
+                    "data": content
+                }
+        except Exception as e:
+            # 生成报错或两个数据块之间超时：保留已输出的部分，降级后照常发送 done 事件
+            generation_error = e
+    if generation_error is not None:
+        action = "partial_answer" if answer_parts else "no_answer"
+        yield {"type": "degraded", "content": deadline.degrade(
+            "generation", action, f"答案生成失败（{type(generation_error).__name__}），"
+                                  f"{'答案可能不完整' if answer_parts else '未生成答案'}")}
+    full_answer = "".join(answer_parts)
 
     t9 = time.time()
+    timings["generation"] = t9 - t_context
+    timings["total"] = t9 - t0
     print("最终答案:", full_answer)
+    # 降级得到的答案不写入答案缓存，避免相似问题一直复用降级结果
+    if question_vector is not None and full_answer and not deadline.degraded:
+        answer_cache.add(question_vector, question, {"candidates": rerank_results, "answer": full_answer},
+                         scope=cache_scope)
 
     # --- 结束 ---
     yield {
         "type": "done",
-        "timing": f"总耗时 {t9 - t0:.2f} s"
+        "timing": f"总耗时 {t9 - t0:.2f} s",
+        "mode": mode,
+        "kind": kind,
+        "timings": {stage: round(seconds, 3) for stage, seconds in timings.items()},
+        "deadline": deadline.seconds,
+        "deadline_exceeded": deadline.enabled and t9 - t0 > deadline.seconds,
+        "degradations": deadline.degradations
     }
 
 
 # 辅助函数：将字典转换为 SSE 格式 (data: {...}\n\n)
-async def event_generator(question: str):
+def to_sse(chunk: dict) -> str:
+    json_str = json.dumps(chunk, ensure_ascii=False)
+    # 标准 SSE 格式
+    return f"data: {json_str}\n\n"
+
+
+async def sse_events(request: QuestionRequest):
     """生成 SSE 格式的流数据"""
-    async for chunk in generate_rag_response(question):
-        json_str = json.dumps(chunk, ensure_ascii=False)
-        # 标准 SSE 格式
-        yield f"data: {json_str}\n\n"
+    async for chunk in generate_rag_response(request.question, request.fusion_method, request.fusion_policy,
+                                             request.mode, request.deadline, request.kind):
+        yield to_sse(chunk)
+
+
+def flight_key(request: QuestionRequest) -> str:
+    """在途请求合并的键：归一化问题 + 索引版本 + 影响结果的请求选项"""
+    return "\0".join([normalize_text(request.question), registry.index_version, request.fusion_method,
+                      request.fusion_policy, request.mode, str(request.deadline), str(request.kind)])
+
+
+async def event_generator(request: QuestionRequest, ticket):
+    """
+    相同问题的并发请求共享一个 SSE 流（事件只序列化一次），后到的请求先回放已发送的事件
+    执行名额由共享的执行任务持有，执行结束时才归还，不随发起执行的请求断开而提前归还
+    """
+    if not config.SINGLE_FLIGHT:
+        async for event in sse_events(request):
+            yield event
+        return
+    subscription = single_flight.subscribe(flight_key(request), lambda: sse_events(request))
+    if subscription.leader:
+        admission.hold(ticket, subscription.task)
+    else:
+        # 排队期间相同问题已开始执行：只订阅，不产生新的执行，名额立即归还
+        admission.leave(ticket)
+    try:
+        async for event in subscription.events():
+            yield event
+    finally:
+        subscription.close()
+
+
+class ClosingStreamingResponse(StreamingResponse):
+    """
+    响应结束、出错或客户端断开时关闭事件流并调用 on_close
+    客户端在开始读取前断开时事件流不会被迭代，生成器里的 finally 不会执行，归还名额等清理必须放在这里
+    """
+    def __init__(self, content, on_close, **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            try:
+                aclose = getattr(self.body_iterator, "aclose", None)
+                if aclose is not None:
+                    await aclose()
+            finally:
+                self.on_close()
+
+
+async def admitted_events(ticket, request: QuestionRequest):
+    """排队期间发送 queue 事件（排队位置、预计等待秒数），拿到执行名额后输出正常的事件流"""
+    try:
+        async for status in admission.wait(ticket):
+            yield to_sse({"type": "queue", "content": status})
+    except AdmissionRejected as e:
+        yield to_sse({"type": "rejected", "status": e.status_code, "retry_after": e.retry_after,
+                      "message": e.message})
+        return
+    async for event in event_generator(request, ticket):
+        yield event
 
 
 # 3. 定义接口
@@ -244,13 +556,55 @@ async def event_generator(question: str):
 async def chat_endpoint(request: QuestionRequest):
     """
     流式聊天接口 - 边生成边传输
+    执行名额已满时排队（流中先发送 queue 事件），队列已满返回 429、预计排队过久返回 503，均带 Retry-After
     """
-    return StreamingResponse(
-        event_generator(request.question),  # 传入用户的问题
+    subscription = single_flight.join(flight_key(request)) if config.SINGLE_FLIGHT else None
+    if subscription is not None:
+        # 相同问题正在执行：订阅已有的流，不产生新的执行，该执行的名额由发起它的共享任务持有
+        return ClosingStreamingResponse(subscription.events(), on_close=subscription.close,
+                                        media_type="text/event-stream")
+    try:
+        ticket = admission.enter(request.priority)
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message,
+                            headers={"Retry-After": str(e.retry_after)})
+    # 名额在响应结束时归还（包括客户端在开始读取前就断开的情况）
+    return ClosingStreamingResponse(
+        admitted_events(ticket, request),  # 传入用户的问题及检索选项
+        on_close=lambda: admission.leave(ticket),
         media_type="text/event-stream"  # 指定媒体类型为 SSE
     )
 
 
+@app.get("/chunks/{chunk_id}")
+async def get_chunk(chunk_id: int):
+    """按块id获取全文和元数据，前端查看检索结果全文时按需调用"""
+    if not registry.loaded or not 0 <= chunk_id < len(registry.chunk_store):
+        raise HTTPException(status_code=404, detail=f"块 {chunk_id} 不存在")
+    return {"chunk_id": chunk_id, **registry.chunk_store.get(chunk_id)}
+
+
+@app.get("/metrics")
+async def metrics():
+    """检索器加载耗时、内存占用、问题向量缓存、重排调度、生成调用延迟等运行指标"""
+    metrics = {"registry": registry.stats()}
+    if registry.loaded:
+        metrics["rerank"] = {"backend": registry.reranker.name, **registry.reranker.metrics()}
+        metrics["embedding"] = registry.vector_retriever.embedding_cache.metrics()
+    if config.ANSWER_CACHE:
+        metrics["answer_cache"] = answer_cache.stats()
+    if config.SINGLE_FLIGHT:
+        metrics["single_flight"] = single_flight.stats()
+    metrics["deadline"] = deadline_stats()
+    metrics["admission"] = admission.stats()
+    if config.QUESTION_ROUTER:
+        metrics["router"] = question_router.stats()
+    if config.CONTEXT_PACKING:
+        metrics["context_packing"] = context_packer.metrics()
+    metrics["generation"] = generation_latency.stats()
+    return metrics
+
+
 # 运行服务器
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,271 @@
+"""
+admission - /query 准入控制：同时执行的请求数上限 + 有界的优先级等待队列（同优先级先进先出），
+队列满或预计等待过长时快速拒绝；各阶段（embedding/rerank/generation）另有并发上限
+
+Author: lsy
+Date: 2026/10/18
+"""
+import math
+import time
+import heapq
+import asyncio
+import itertools
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict
+
+import numpy as np
+
+import src.config as config
+
+# 请求优先级 -> 排队顺序，数值小的先执行
+PRIORITIES = {"high": 0, "normal": 1, "low": 2}
+
+
+class AdmissionRejected(Exception):
+    """请求未被接纳：队列已满（429）或预计/实际排队时间超过上限（503）"""
+    def __init__(self, status_code: int, retry_after: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.message = message
+
+
+class _Waiter:
+    """一个排队中的请求，future 完成表示名额已移交给它"""
+    __slots__ = ("key", "future", "enqueued")
+
+    def __init__(self, key: tuple, future: asyncio.Future):
+        self.key = key
+        self.future = future
+        self.enqueued = time.monotonic()
+
+
+class PriorityLimiter:
+    """
+    并发上限 + 按 (优先级, 到达顺序) 排队的等待者（只在同一个事件循环中使用），limit <= 0 不限制
+    名额释放时直接移交给队首等待者，新到的请求不能插队
+    """
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = limit
+        self.active = 0
+        self._waiters = []
+        self._seq = itertools.count()
+        self._waits = deque(maxlen=500)
+        self._stats = {"admitted": 0, "queued": 0, "cancelled": 0}
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def try_acquire(self) -> bool:
+        """有空闲名额且没有人排队时立即占用"""
+        if self.limit <= 0 or (self.active < self.limit and not self._waiters):
+            self.active += 1
+            self._stats["admitted"] += 1
+            self._waits.append(0.0)
+            return True
+        return False
+
+    def enqueue(self, priority: str = "normal") -> _Waiter:
+        waiter = _Waiter((PRIORITIES[priority], next(self._seq)), asyncio.get_running_loop().create_future())
+        heapq.heappush(self._waiters, (waiter.key, waiter))
+        self._stats["queued"] += 1
+        return waiter
+
+    def position(self, waiter: _Waiter) -> int:
+        """等待者在队列中的位置（从1开始），已拿到名额时为0"""
+        if waiter.future.done():
+            return 0
+        return 1 + sum(1 for key, _ in self._waiters if key < waiter.key)
+
+    def ahead(self, priority: str = "normal") -> int:
+        """按该优先级新排队时前面的等待者数量"""
+        rank = PRIORITIES[priority]
+        return sum(1 for (waiter_rank, _), _ in self._waiters if waiter_rank <= rank)
+
+    def release(self):
+        """归还名额：有等待者时直接移交给队首，否则空出一个名额"""
+        while self._waiters:
+            _, waiter = heapq.heappop(self._waiters)
+            if not waiter.future.done():
+                waiter.future.set_result(None)
+                self._stats["admitted"] += 1
+                self._waits.append(time.monotonic() - waiter.enqueued)
+                return
+        self.active -= 1
+
+    def cancel(self, waiter: _Waiter):
+        """放弃排队；名额已经移交给它时归还"""
+        if waiter.future.done():
+            self.release()
+            return
+        waiter.future.cancel()
+        self._waiters = [item for item in self._waiters if item[1] is not waiter]
+        heapq.heapify(self._waiters)
+        self._stats["cancelled"] += 1
+
+    async def acquire(self, priority: str = "normal", timeout: float = None):
+        """等待名额，超过 timeout 秒抛出 asyncio.TimeoutError；超时或被取消时退出队列（名额已移交时归还）"""
+        if self.try_acquire():
+            return
+        waiter = self.enqueue(priority)
+        try:
+            # asyncio.wait 不会取消 waiter.future，也不会像 wait_for 那样在名额恰好移交时吞掉外层的取消
+            await asyncio.wait({waiter.future}, timeout=timeout)
+        except asyncio.CancelledError:
+            self.cancel(waiter)
+            raise
+        if not waiter.future.done():
+            self.cancel(waiter)
+            raise asyncio.TimeoutError
+
+    @asynccontextmanager
+    async def slot(self, priority: str = "normal"):
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> dict:
+        waits = np.asarray(self._waits)
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "waiting": self.waiting,
+            **self._stats,
+            "wait_s_avg": round(float(waits.mean()), 4) if len(waits) else None,
+            "wait_s_p95": round(float(np.percentile(waits, 95)), 4) if len(waits) else None,
+            "wait_s_max": round(float(waits.max()), 4) if len(waits) else None,
+        }
+
+
+class AdmissionTicket:
+    """一次 /query 请求的准入状态；holder 为持有执行名额的共享任务（见 AdmissionController.hold）"""
+    def __init__(self, priority: str):
+        self.priority = priority
+        self.waiter = None
+        self.admitted_at = None
+        self.holder = None
+        self.released = False
+
+
+class AdmissionController:
+    """
+    /query 的准入控制：
+    - 同时执行的请求数不超过 max_active，其余请求按优先级排队，队列最多 queue_size 个（满时 429）
+    - 按近期请求的平均执行时间预计排队时间，超过 max_wait 秒时直接 503；排队中实际等待超过 max_wait 同样放弃
+    - 检索/重排/生成各阶段另有并发上限（stage_limits），阶段名额只在执行该阶段时占用
+    """
+    def __init__(self, max_active: int = None, queue_size: int = None, max_wait: float = None,
+                 stage_limits: Dict[str, int] = None):
+        self.gate = PriorityLimiter("query", config.ADMISSION_MAX_ACTIVE if max_active is None else max_active)
+        self.queue_size = config.ADMISSION_QUEUE_SIZE if queue_size is None else queue_size
+        self.max_wait = config.ADMISSION_MAX_WAIT if max_wait is None else max_wait
+        stage_limits = config.STAGE_CONCURRENCY if stage_limits is None else stage_limits
+        self.stages = {name: PriorityLimiter(name, limit) for name, limit in stage_limits.items()}
+        self._durations = deque(maxlen=200)
+        self._stats = {"rejected_429": 0, "rejected_503": 0, "queue_timeouts": 0}
+
+    def stage(self, name: str) -> PriorityLimiter:
+        """阶段的并发限制器，未配置的阶段不限制"""
+        if name not in self.stages:
+            self.stages[name] = PriorityLimiter(name, 0)
+        return self.stages[name]
+
+    def service_time(self) -> float:
+        """近期请求的平均执行秒数，没有样本时使用 ADMISSION_DEFAULT_SERVICE_TIME"""
+        return float(np.mean(self._durations)) if self._durations else config.ADMISSION_DEFAULT_SERVICE_TIME
+
+    def estimate_wait(self, position: int) -> float:
+        """排在第 position 位时预计的等待秒数"""
+        return position * self.service_time() / max(1, self.gate.limit)
+
+    def _reject(self, status_code: int, position: int, message: str) -> AdmissionRejected:
+        self._stats[f"rejected_{status_code}"] += 1
+        return AdmissionRejected(status_code, max(1, math.ceil(self.estimate_wait(position))), message)
+
+    def enter(self, priority: str = "normal") -> AdmissionTicket:
+        """
+        请求到达时同步判断：有空闲名额直接放行，队列未满且预计等待不超过上限时排队，否则抛出 AdmissionRejected
+        """
+        ticket = AdmissionTicket(priority)
+        if self.gate.try_acquire():
+            ticket.admitted_at = time.monotonic()
+            return ticket
+        position = self.gate.ahead(priority) + 1
+        if self.gate.waiting >= self.queue_size:
+            raise self._reject(429, position, f"请求过多，等待队列已满（{self.queue_size}）")
+        if 0 < self.max_wait < self.estimate_wait(position):
+            raise self._reject(503, position, f"服务繁忙，预计排队超过 {self.max_wait:g} 秒")
+        ticket.waiter = self.gate.enqueue(priority)
+        return ticket
+
+    async def wait(self, ticket: AdmissionTicket, poll_interval: float = 0.5) -> AsyncIterator[dict]:
+        """
+        等待执行名额，排队位置变化时产出 {"position", "queue_depth", "estimated_wait"}，拿到名额后结束
+        排队超过 max_wait 秒时退出队列并抛出 AdmissionRejected(503)
+        """
+        if ticket.waiter is None:
+            return
+        future = ticket.waiter.future
+        last_position = None
+        while not future.done():
+            position = self.gate.position(ticket.waiter)
+            if position != last_position:
+                last_position = position
+                yield {"position": position, "queue_depth": self.gate.waiting,
+                       "estimated_wait": round(self.estimate_wait(position), 1)}
+            waited = time.monotonic() - ticket.waiter.enqueued
+            if 0 < self.max_wait <= waited:
+                self.gate.cancel(ticket.waiter)
+                ticket.waiter = None
+                self._stats["queue_timeouts"] += 1
+                raise self._reject(503, position, f"排队超过 {self.max_wait:g} 秒，请稍后重试")
+            timeout = poll_interval if self.max_wait <= 0 else min(poll_interval, self.max_wait - waited)
+            await asyncio.wait({future}, timeout=timeout)
+        ticket.admitted_at = time.monotonic()
+
+    def hold(self, ticket: AdmissionTicket, task: asyncio.Future):
+        """
+        执行名额改由 task 持有（在途合并中多个请求共享的执行）：请求结束时不归还，task 结束或被取消时归还
+        """
+        ticket.holder = task
+        task.add_done_callback(lambda _: self._release(ticket))
+
+    def leave(self, ticket: AdmissionTicket):
+        """请求结束或客户端断开：归还执行名额或退出队列；可重复调用，名额由共享任务持有时不归还"""
+        if ticket.holder is not None and not ticket.holder.done():
+            return
+        self._release(ticket)
+
+    def _release(self, ticket: AdmissionTicket):
+        if ticket.released:
+            return
+        ticket.released = True
+        if ticket.admitted_at is not None:
+            self._durations.append(time.monotonic() - ticket.admitted_at)
+            self.gate.release()
+        elif ticket.waiter is not None:
+            self.gate.cancel(ticket.waiter)
+
+    def stats(self) -> dict:
+        gate = self.gate.stats()
+        return {
+            "max_active": self.gate.limit,
+            "active": gate["active"],
+            "queue_size": self.queue_size,
+            "queue_depth": gate["waiting"],
+            "max_wait_s": self.max_wait,
+            "admitted": gate["admitted"],
+            "queued": gate["queued"],
+            "cancelled": gate["cancelled"],
+            **self._stats,
+            "wait_s_avg": gate["wait_s_avg"],
+            "wait_s_p95": gate["wait_s_p95"],
+            "wait_s_max": gate["wait_s_max"],
+            "service_s_avg": round(self.service_time(), 3),
+            "stages": {name: limiter.stats() for name, limiter in self.stages.items()},
+        }
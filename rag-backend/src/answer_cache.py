@@ -0,0 +1,157 @@
+"""
+answer_cache - 语义答案缓存：用一个小的 FAISS 索引保存历史问题向量，近似重复的问题直接复用重排结果和答案
+
+Author: lsy
+Date: 2026/10/18
+"""
+import re
+import time
+import threading
+from typing import Optional
+
+import faiss
+import numpy as np
+
+import src.config as config
+
+_NUMBER_PATTERN = re.compile(r'\d+(?:\.\d+)?')
+
+
+def question_numbers(question: str) -> tuple:
+    """问题中的数字（年份、季度、金额等），措辞相近但数字不同的问题答案不同，不能互相复用"""
+    return tuple(sorted(set(_NUMBER_PATTERN.findall(question))))
+
+
+class SemanticAnswerCache:
+    """
+    问题向量（已 L2 归一化）-> 缓存条目，内积即余弦相似度
+    - scope: 影响答案的其他条件（如回答类型、模型、融合方式），只在相同 scope 的条目间复用
+    - 每个 (scope, 问题中的数字) 单独一个子索引，先按条件选子索引再做近邻搜索，
+      在线接口和离线流水线等不同 scope 的条目不会占满彼此的近邻名额
+    - 条目超过 maxsize 时淘汰最久未命中的，超过 ttl 秒的条目视为过期
+    - 条目绑定索引版本，版本变化时全部清空
+    """
+    # 每次查询取的近邻数，在其中找第一个未过期的条目
+    SEARCH_K = 8
+
+    def __init__(self, threshold: float = None, maxsize: int = None, ttl: float = None):
+        self.threshold = config.ANSWER_CACHE_THRESHOLD if threshold is None else threshold
+        self.maxsize = config.ANSWER_CACHE_SIZE if maxsize is None else maxsize
+        self.ttl = config.ANSWER_CACHE_TTL if ttl is None else ttl
+        self.version = ''
+        self._dim = None
+        self._indexes = {}
+        self._entries = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._stats = {"lookups": 0, "hits": 0, "evictions": 0, "expired": 0, "invalidations": 0}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def set_version(self, version: str):
+        """绑定索引版本，与当前版本不同时清空全部条目"""
+        with self._lock:
+            if version == self.version:
+                return
+            previous, self.version = self.version, version
+            self._clear()
+            if previous:
+                self._stats["invalidations"] += 1
+
+    def _clear(self):
+        self._indexes.clear()
+        self._entries.clear()
+
+    def _remove(self, entry_ids: list):
+        by_key = {}
+        for entry_id in entry_ids:
+            entry = self._entries.pop(entry_id, None)
+            if entry is not None:
+                by_key.setdefault(entry["key"], []).append(entry_id)
+        for key, ids in by_key.items():
+            index = self._indexes[key]
+            index.remove_ids(np.asarray(ids, dtype=np.int64))
+            if index.ntotal == 0:
+                del self._indexes[key]
+
+    def lookup(self, vector: np.ndarray, question: str, scope: str = '') -> Optional[dict]:
+        """
+        查找相似问题的缓存条目
+        :return: 命中时返回 {"question", "similarity", "payload"}，否则 None
+        """
+        with self._lock:
+            self._stats["lookups"] += 1
+            index = self._indexes.get((scope, question_numbers(question)))
+            if index is None:
+                return None
+            k = min(self.SEARCH_K, index.ntotal)
+            similarities, entry_ids = index.search(np.asarray(vector, dtype='float32').reshape(1, -1), k)
+            now = time.time()
+            expired = []
+            hit = None
+            for similarity, entry_id in zip(similarities[0], entry_ids[0]):
+                if entry_id < 0 or similarity < self.threshold:
+                    break
+                entry = self._entries[int(entry_id)]
+                if self.ttl > 0 and now - entry["created_at"] > self.ttl:
+                    expired.append(int(entry_id))
+                    continue
+                entry["last_used"] = now
+                hit = {"question": entry["question"], "similarity": float(similarity),
+                       "payload": entry["payload"]}
+                break
+            self._stats["expired"] += len(expired)
+            self._remove(expired)
+            if hit is not None:
+                self._stats["hits"] += 1
+            return hit
+
+    def add(self, vector: np.ndarray, question: str, payload: dict, scope: str = ''):
+        """写入一个条目，payload 为复用时需要的内容（如重排结果和答案）"""
+        if self.maxsize <= 0:
+            return
+        vector = np.asarray(vector, dtype='float32').reshape(1, -1)
+        with self._lock:
+            if self._dim != vector.shape[1]:
+                self._clear()
+                self._dim = vector.shape[1]
+            key = (scope, question_numbers(question))
+            if key not in self._indexes:
+                self._indexes[key] = faiss.IndexIDMap2(faiss.IndexFlatIP(self._dim))
+            entry_id = self._next_id
+            self._next_id += 1
+            now = time.time()
+            self._entries[entry_id] = {
+                "question": question, "key": key, "payload": payload, "created_at": now, "last_used": now,
+            }
+            self._indexes[key].add_with_ids(vector, np.asarray([entry_id], dtype=np.int64))
+            if len(self._entries) > self.maxsize:
+                # 淘汰最久未命中的条目（一次淘汰 1/10，避免每次写入都重建索引的 id 映射）
+                n_evict = max(1, len(self._entries) - self.maxsize + self.maxsize // 10)
+                oldest = sorted(self._entries, key=lambda key: self._entries[key]["last_used"])[:n_evict]
+                self._stats["evictions"] += len(oldest)
+                self._remove(oldest)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+            stats["scopes"] = len(self._indexes)
+        stats["hit_rate"] = round(stats["hits"] / stats["lookups"], 4) if stats["lookups"] else 0.0
+        stats["threshold"] = self.threshold
+        stats["version"] = self.version
+        return stats
+
+
+_shared_cache = None
+_shared_lock = threading.Lock()
+
+
+def get_answer_cache() -> SemanticAnswerCache:
+    """进程级共享的语义答案缓存：在线接口和离线流水线（每个问题新建一个 QuestionsProcessor）都复用同一份"""
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = SemanticAnswerCache()
+        return _shared_cache
@@ -5,9 +5,18 @@ Author: lsy
 Date: 2026/1/8
 """
 import dashscope
+import src.config as config
 import src.prompts as prompts
+from src.hedging import LatencyTracker, DeadlineExceeded, call_with_deadline
+from src.async_dashscope import get_async_client
 import os
 import json
+import asyncio
+
+# 非流式生成调用的延迟统计，进程内共享，用于计算对冲延迟
+generation_latency = LatencyTracker('generation')
+# 生成超时时返回的兜底答案
+TIMEOUT_FINAL_ANSWER = "生成超时，请稍后重试"
 
 class APIProcessor:
     # "openai" "dashscope" "gemini"
@@ -31,13 +40,32 @@ class APIProcessor:
 
         return answer_dict
 
+    async def stream_answer_from_rag_context(self, question, rag_context, kind, model):
+        """异步流式生成答案，逐个产出增量文本，不阻塞事件循环"""
+        system_prompt, response_format, user_prompt = self._build_rag_context_prompts(kind)
+
+        async for content in self.processor.astream_message(
+            model=model,
+            system_prompt=system_prompt,
+            human_content=user_prompt.format(context=rag_context, question=question),
+        ):
+            yield content
+
     def _build_rag_context_prompts(self,kind):
         """根据给定的问题类型生成对应的提示词模版"""
         # use_schema_prompt = True if self.provider == "ibm" or self.provider == "gemini" else False
-        if kind == "summary":
-            system_prompt = prompts.AnswerWithRAGContextStringPrompt.system_prompt
-            response_format = prompts.AnswerWithRAGContextStringPrompt.AnswerSchema
-            user_prompt = prompts.AnswerWithRAGContextStringPrompt.user_prompt
+        prompt_classes = {
+            "fact": prompts.AnswerWithRAGContextFactPrompt,
+            "reasoning": prompts.AnswerWithRAGContextReasoningPrompt,
+            "compare": prompts.AnswerWithRAGContextComparePrompt,
+            "summary": prompts.AnswerWithRAGContextStringPrompt,
+        }
+        if kind not in prompt_classes:
+            raise ValueError(f"不支持的问题类型: {kind}，可选: {list(prompt_classes)}")
+        prompt = prompt_classes[kind]
+        system_prompt = prompt.system_prompt
+        response_format = prompt.AnswerSchema
+        user_prompt = prompt.user_prompt
 
         return system_prompt,response_format,user_prompt
 
@@ -64,16 +92,14 @@ class BaseDashscopeProcessor:
         """
         发送消息到DashScope Qwen大模型，支持 system_content + human_content 拼接为 messages。
         支持流式输出。
+        非流式调用有截止时间（config.GENERATION_TIMEOUT），超过历史 p95 延迟未返回时补发对冲请求；
+        流式调用的 request_timeout 为两个数据块之间的最大间隔。
         """
         if model is None:
             model = self.default_model
         # 拼接 messages
-        messages = []
-        if system_content:
-            messages.append({"role": "system", "content": system_content})
-        if human_content:
-            messages.append({"role": "user", "content": human_content})
-        
+        messages = self._build_messages(system_content, human_content)
+
         if stream:
             # 流式输出模式
             responses = dashscope.Generation.call(
@@ -82,17 +108,29 @@ class BaseDashscopeProcessor:
                 temperature=temperature,
                 result_format='message',
                 stream=True,
-                incremental_output=True
+                incremental_output=True,
+                request_timeout=config.GENERATION_TIMEOUT,
             )
             return responses
         else:
             # 同步输出模式
-            response = dashscope.Generation.call(
-                model=model,
-                messages=messages,
-                temperature=temperature,
-                result_format='message'
-            )
+            try:
+                response = call_with_deadline(
+                    lambda: dashscope.Generation.call(
+                        model=model,
+                        messages=messages,
+                        temperature=temperature,
+                        result_format='message',
+                        request_timeout=config.GENERATION_TIMEOUT,
+                    ),
+                    config.GENERATION_TIMEOUT,
+                    tracker=generation_latency,
+                    hedge=config.GENERATION_HEDGE,
+                )
+            except DeadlineExceeded:
+                self.response_data = {"model": model, "input_tokens": None, "output_tokens": None}
+                return {"final_answer": TIMEOUT_FINAL_ANSWER, "step_by_step_analysis": "",
+                        "reasoning_summary": "", "relevant_pages": []}
             # 兼容 openai/gemini 返回格式，始终返回 dict
             if hasattr(response, 'output') and hasattr(response.output, 'choices'):
                 content = response.output.choices[0].message.content
@@ -105,28 +143,77 @@ class BaseDashscopeProcessor:
                                   "output_tokens": response.usage.output_tokens if hasattr(response, 'usage') and hasattr(
                                       response.usage, 'output_tokens') else None}
 
-            # 尝试解析 content 为 JSON，如果是结构化响应
-            try:
-                # 先尝试移除可能的markdown代码块标记
-                content_str = content.strip()
-                if content_str.startswith('```') and '```' in content_str[3:]:
-                    # 找到第一个 ``` 和 最后一个 ``` 之间的内容
-                    first_backtick = content_str.find('```') + 3
-                    next_newline = content_str.find('\n', first_backtick)
-                    if next_newline > 0:
-                        first_backtick = next_newline + 1
-                    last_backtick = content_str.rfind('```')
-                    if last_backtick > first_backtick:
-                        json_str = content_str[first_backtick:last_backtick].strip()
-                    else:
-                        json_str = content_str
+            return self._parse_structured_content(content)
+
+    @staticmethod
+    def _parse_structured_content(content):
+        """尝试把模型输出解析为 json 字典，失败时包装成基本格式"""
+        try:
+            # 先尝试移除可能的markdown代码块标记
+            content_str = content.strip()
+            if content_str.startswith('```') and '```' in content_str[3:]:
+                # 找到第一个 ``` 和 最后一个 ``` 之间的内容
+                first_backtick = content_str.find('```') + 3
+                next_newline = content_str.find('\n', first_backtick)
+                if next_newline > 0:
+                    first_backtick = next_newline + 1
+                last_backtick = content_str.rfind('```')
+                if last_backtick > first_backtick:
+                    json_str = content_str[first_backtick:last_backtick].strip()
                 else:
                     json_str = content_str
+            else:
+                json_str = content_str
+
+            # 尝试解析 JSON
+            parsed_content = json.loads(json_str)
+            return parsed_content
+        except (json.JSONDecodeError, TypeError):
+            # 如果不是有效的JSON，返回基本格式
+            # print(f"Content is not valid JSON, returning basic format: {content}")
+            return {"final_answer": content, "step_by_step_analysis": "", "reasoning_summary": "", "relevant_pages": []}
 
-                # 尝试解析 JSON
-                parsed_content = json.loads(json_str)
-                return parsed_content
-            except (json.JSONDecodeError, TypeError):
-                # 如果不是有效的JSON，返回基本格式
-                # print(f"Content is not valid JSON, returning basic format: {content}")
-                return {"final_answer": content, "step_by_step_analysis": "", "reasoning_summary": "", "relevant_pages": []}
+    def _build_messages(self, system_content, human_content):
+        messages = []
+        if system_content:
+            messages.append({"role": "system", "content": system_content})
+        if human_content:
+            messages.append({"role": "user", "content": human_content})
+        return messages
+
+    async def asend_message(
+            self,
+            model="qwen-turbo-latest",
+            temperature=0.1,
+            system_content='You are a helpful assistant.',
+            human_content='Hello!',
+            **kwargs
+    ):
+        """异步非流式调用（连接池 + 并发上限），超过 config.GENERATION_TIMEOUT 秒返回超时提示"""
+        messages = self._build_messages(system_content, human_content)
+        try:
+            result = await asyncio.wait_for(
+                get_async_client().generate(messages, model=model or self.default_model, temperature=temperature),
+                config.GENERATION_TIMEOUT,
+            )
+        except asyncio.TimeoutError:
+            return {"final_answer": TIMEOUT_FINAL_ANSWER, "step_by_step_analysis": "",
+                    "reasoning_summary": "", "relevant_pages": []}
+        usage = result["usage"] or {}
+        self.response_data = {"model": model, "input_tokens": usage.get("input_tokens"),
+                              "output_tokens": usage.get("output_tokens")}
+        return self._parse_structured_content(result["content"])
+
+    async def astream_message(
+            self,
+            model="qwen-turbo-latest",
+            temperature=0.1,
+            system_content='You are a helpful assistant.',
+            human_content='Hello!',
+            **kwargs
+    ):
+        """异步流式调用，逐个产出增量文本；两个数据块间隔超过 config.GENERATION_TIMEOUT 秒时中断"""
+        messages = self._build_messages(system_content, human_content)
+        async for content in get_async_client().stream_generate(
+                messages, model=model or self.default_model, temperature=temperature):
+            yield content
@@ -0,0 +1,141 @@
+"""
+async_dashscope - 基于 aiohttp 的异步 DashScope 客户端：连接池复用 keep-alive 连接，按调用类型限制并发，
+支持文本向量、文本生成和流式生成（异步迭代增量文本），不阻塞 FastAPI 事件循环
+
+Author: lsy
+Date: 2026/10/18
+"""
+import os
+import json
+import asyncio
+from typing import List, AsyncIterator
+
+import aiohttp
+
+import src.config as config
+
+GENERATION_PATH = '/services/aigc/text-generation/generation'
+EMBEDDING_PATH = '/services/embeddings/text-embedding/text-embedding'
+
+
+class DashScopeError(RuntimeError):
+    """DashScope 返回非 200 状态或错误事件"""
+    def __init__(self, status_code: int, code: str = None, message: str = None):
+        super().__init__(f"DashScope请求失败: status={status_code} code={code} message={message}")
+        self.status_code = status_code
+        self.code = code
+        self.message = message
+
+    @property
+    def throttled(self) -> bool:
+        return self.status_code == 429 or str(self.code or '').startswith('Throttling')
+
+
+class AsyncDashScopeClient:
+    """
+    一个进程一个实例，会话和并发信号量在首次使用时绑定到当前事件循环
+    base_url 默认读取 DASHSCOPE_HTTP_BASE_URL（与 dashscope SDK 一致），便于指向本地模拟服务
+    """
+    def __init__(self, api_key: str = None, base_url: str = None, max_connections: int = None,
+                 embedding_concurrency: int = None, generation_concurrency: int = None,
+                 keepalive_timeout: float = 30):
+        self.api_key = api_key or os.getenv('DASHSCOPE_API_KEY')
+        self.base_url = (base_url or os.getenv('DASHSCOPE_HTTP_BASE_URL')
+                         or 'https://dashscope.aliyuncs.com/api/v1').rstrip('/')
+        self.max_connections = max_connections or config.ASYNC_HTTP_MAX_CONNECTIONS
+        self.embedding_concurrency = embedding_concurrency or config.ASYNC_EMBEDDING_CONCURRENCY
+        self.generation_concurrency = generation_concurrency or config.ASYNC_GENERATION_CONCURRENCY
+        self.keepalive_timeout = keepalive_timeout
+        self._session = None
+        self._limits = None
+
+    def _ensure_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=self.keepalive_timeout)
+            self._session = aiohttp.ClientSession(connector=connector, headers={
+                "Authorization": f"Bearer {self.api_key}",
+                "Content-Type": "application/json",
+            })
+            self._limits = {
+                "embedding": asyncio.Semaphore(self.embedding_concurrency),
+                "generation": asyncio.Semaphore(self.generation_concurrency),
+            }
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    @staticmethod
+    async def _raise_for_error(response: aiohttp.ClientResponse):
+        if response.status == 200:
+            return
+        try:
+            error = await response.json(content_type=None)
+        except (json.JSONDecodeError, aiohttp.ContentTypeError):
+            error = {"message": await response.text()}
+        raise DashScopeError(response.status, error.get("code"), error.get("message"))
+
+    async def _post(self, kind: str, path: str, body: dict, timeout: float) -> dict:
+        session = self._ensure_session()
+        async with self._limits[kind]:
+            async with session.post(self.base_url + path, json=body,
+                                    timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                await self._raise_for_error(response)
+                return await response.json(content_type=None)
+
+    async def embed(self, texts: List[str], model: str = 'text-embedding-v1', timeout: float = None) -> List[List[float]]:
+        """批量获取文本向量，返回顺序与 texts 一致"""
+        body = {"model": model, "input": {"texts": list(texts)}, "parameters": {}}
+        data = await self._post("embedding", EMBEDDING_PATH, body, timeout or config.EMBEDDING_TIMEOUT)
+        embeddings = sorted(data["output"]["embeddings"], key=lambda item: item["text_index"])
+        return [item["embedding"] for item in embeddings]
+
+    async def generate(self, messages: list, model: str, temperature: float = 0.1,
+                       timeout: float = None, **parameters) -> dict:
+        """非流式生成，返回 {"content": 文本, "usage": 用量}"""
+        body = {"model": model, "input": {"messages": messages},
+                "parameters": {"result_format": "message", "temperature": temperature, **parameters}}
+        data = await self._post("generation", GENERATION_PATH, body, timeout or config.GENERATION_TIMEOUT)
+        return {"content": data["output"]["choices"][0]["message"]["content"], "usage": data.get("usage")}
+
+    async def stream_generate(self, messages: list, model: str, temperature: float = 0.1,
+                              timeout: float = None, **parameters) -> AsyncIterator[str]:
+        """
+        流式生成，逐个产出增量文本
+        :param timeout: 两个数据块之间的最大间隔秒数
+        """
+        session = self._ensure_session()
+        body = {"model": model, "input": {"messages": messages},
+                "parameters": {"result_format": "message", "temperature": temperature,
+                               "incremental_output": True, **parameters}}
+        headers = {"Accept": "text/event-stream", "X-DashScope-SSE": "enable"}
+        client_timeout = aiohttp.ClientTimeout(total=None, sock_read=timeout or config.GENERATION_TIMEOUT)
+        async with self._limits["generation"]:
+            async with session.post(self.base_url + GENERATION_PATH, json=body, headers=headers,
+                                    timeout=client_timeout) as response:
+                await self._raise_for_error(response)
+                is_error = False
+                async for line in response.content:
+                    line = line.decode('utf-8').rstrip('\r\n')
+                    if line.startswith('event:'):
+                        is_error = line[len('event:'):].strip() == 'error'
+                    elif line.startswith('data:'):
+                        data = json.loads(line[len('data:'):])
+                        if is_error:
+                            raise DashScopeError(response.status, data.get("code"), data.get("message"))
+                        content = data["output"]["choices"][0]["message"].get("content") or ""
+                        if content:
+                            yield content
+
+
+_client = None
+
+
+def get_async_client() -> AsyncDashScopeClient:
+    """进程级共享的异步客户端"""
+    global _client
+    if _client is None:
+        _client = AsyncDashScopeClient()
+    return _client
@@ -0,0 +1,217 @@
+"""
+bm25_index - 预分词的BM25倒排索引，入库时构建并落盘，检索服务启动时内存映射加载
+
+Author: lsy
+Date: 2026/10/18
+"""
+import json
+import math
+import hashlib
+from pathlib import Path
+from typing import List, Iterable
+
+import numpy as np
+import jieba
+
+ARTIFACT_VERSION = 1
+
+
+def tokenize(text: str) -> List[str]:
+    """BM25 统一分词入口，入库和查询必须使用同一种分词"""
+    return list(jieba.cut(text))
+
+
+def corpus_fingerprint(texts: Iterable[str]) -> str:
+    """语料指纹，用于校验BM25索引与元数据文件是否对应"""
+    sha1 = hashlib.sha1()
+    for text in texts:
+        sha1.update(text.encode('utf-8'))
+        sha1.update(b'\0')
+    return sha1.hexdigest()
+
+
+class BM25Index:
+    """
+    按词项组织的倒排表（CSR结构）：
+    - vocab: 词项 -> 词项id
+    - indptr: 词项id 对应倒排表在 postings_doc/postings_tf 中的起止位置
+    - postings_doc / postings_tf: 包含该词项的文档id及词频
+    - doc_len / idf: 文档长度、词项IDF
+    打分公式与 rank_bm25.BM25Okapi 完全一致
+    """
+    def __init__(self, vocab, indptr, postings_doc, postings_tf, doc_len, idf, meta):
+        self.vocab = vocab
+        self.indptr = indptr
+        self.postings_doc = postings_doc
+        self.postings_tf = postings_tf
+        self.doc_len = doc_len
+        self.idf = idf
+        self.meta = meta
+
+        self.k1 = meta['k1']
+        self.b = meta['b']
+        self.avgdl = meta['avgdl']
+        # 每个文档的长度归一化项只和文档有关，提前算好
+        self._length_norm = self.k1 * (1 - self.b + self.b * np.asarray(self.doc_len) / self.avgdl)
+
+    @property
+    def n_docs(self) -> int:
+        return int(self.meta['n_docs'])
+
+    @property
+    def fingerprint(self) -> str:
+        return self.meta.get('fingerprint')
+
+    @classmethod
+    def build(cls, corpus_tokens: List[List[str]], k1: float = 1.5, b: float = 0.75,
+              epsilon: float = 0.25, fingerprint: str = None):
+        """从分好词的语料构建索引"""
+        vocab = {}
+        term_ids, doc_ids, tfs = [], [], []
+        doc_len = np.zeros(len(corpus_tokens), dtype=np.int32)
+        for doc_id, tokens in enumerate(corpus_tokens):
+            doc_len[doc_id] = len(tokens)
+            freqs = {}
+            for token in tokens:
+                freqs[token] = freqs.get(token, 0) + 1
+            for token, tf in freqs.items():
+                term_ids.append(vocab.setdefault(token, len(vocab)))
+                doc_ids.append(doc_id)
+                tfs.append(tf)
+
+        # 按词项id稳定排序，得到每个词项连续存放、文档id递增的倒排表
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+        order = np.argsort(term_ids, kind='stable')
+        postings_doc = np.asarray(doc_ids, dtype=np.int32)[order]
+        postings_tf = np.asarray(tfs, dtype=np.int32)[order]
+        doc_freq = np.bincount(term_ids, minlength=len(vocab))
+        indptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(doc_freq, out=indptr[1:])
+
+        # IDF 与 BM25Okapi 一致：负值IDF替换为 epsilon * 平均IDF
+        # 逐项用 math.log 并按词表顺序累加，保证与 BM25Okapi 的浮点结果逐位相同
+        n_docs = len(corpus_tokens)
+        idf = np.array([math.log(n_docs - df + 0.5) - math.log(df + 0.5) for df in doc_freq.tolist()])
+        idf_sum = 0.0
+        for value in idf.tolist():
+            idf_sum += value
+        average_idf = idf_sum / len(idf) if len(idf) else 0.0
+        idf[idf < 0] = epsilon * average_idf
+
+        meta = {
+            "version": ARTIFACT_VERSION,
+            "n_docs": n_docs,
+            "avgdl": float(doc_len.sum() / n_docs) if n_docs else 0.0,
+            "k1": k1,
+            "b": b,
+            "epsilon": epsilon,
+            "fingerprint": fingerprint,
+        }
+        return cls(vocab, indptr, postings_doc, postings_tf, doc_len, idf, meta)
+
+    def save(self, index_dir: Path):
+        """落盘：数组存为 .npy 以便内存映射，词表和元信息存为 json"""
+        index_dir = Path(index_dir)
+        index_dir.mkdir(parents=True, exist_ok=True)
+        np.save(index_dir / 'indptr.npy', self.indptr)
+        np.save(index_dir / 'postings_doc.npy', self.postings_doc)
+        np.save(index_dir / 'postings_tf.npy', self.postings_tf)
+        np.save(index_dir / 'doc_len.npy', self.doc_len)
+        np.save(index_dir / 'idf.npy', self.idf)
+        # 词表按词项id顺序存成列表，比存dict更紧凑
+        terms = [None] * len(self.vocab)
+        for term, term_id in self.vocab.items():
+            terms[term_id] = term
+        with open(index_dir / 'vocab.json', 'w', encoding='utf-8') as f:
+            json.dump(terms, f, ensure_ascii=False)
+        # meta 最后写入，作为索引完整的标志
+        with open(index_dir / 'meta.json', 'w', encoding='utf-8') as f:
+            json.dump(self.meta, f, ensure_ascii=False, indent=2)
+
+    @classmethod
+    def load(cls, index_dir: Path, mmap: bool = True):
+        """加载索引，mmap=True 时数组按需从页缓存读取，多进程可共享"""
+        index_dir = Path(index_dir)
+        meta_path = index_dir / 'meta.json'
+        if not meta_path.exists():
+            raise FileNotFoundError(f"BM25索引不存在: {index_dir}")
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('version') != ARTIFACT_VERSION:
+            raise ValueError(f"BM25索引版本不匹配: {meta.get('version')} != {ARTIFACT_VERSION}")
+
+        mmap_mode = 'r' if mmap else None
+        arrays = {name: np.load(index_dir / f'{name}.npy', mmap_mode=mmap_mode)
+                  for name in ('indptr', 'postings_doc', 'postings_tf', 'doc_len', 'idf')}
+        with open(index_dir / 'vocab.json', 'r', encoding='utf-8') as f:
+            vocab = {term: term_id for term_id, term in enumerate(json.load(f))}
+        return cls(vocab=vocab, meta=meta, **arrays)
+
+    def _score_candidates(self, query_tokens: List[str]):
+        """
+        拼接问题词项的倒排表，一次向量化计算所有posting的得分，再按文档累加
+        返回 (候选文档id, 原始分数)，只包含至少命中一个词项的文档
+        """
+        term_ids = [self.vocab[token] for token in query_tokens if token in self.vocab]
+        if not term_ids:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        starts = self.indptr[term_ids]
+        ends = self.indptr[np.asarray(term_ids) + 1]
+        docs = np.concatenate([self.postings_doc[s:e] for s, e in zip(starts, ends)])
+        tf = np.concatenate([self.postings_tf[s:e] for s, e in zip(starts, ends)])
+        idf = np.repeat(self.idf[term_ids], ends - starts)
+
+        contributions = idf * (tf * (self.k1 + 1) / (tf + self._length_norm[docs]))
+        # bincount 按posting顺序累加，与逐词项累加的结果逐位一致
+        if len(docs) * 32 < self.n_docs:
+            # posting 很少时只对命中文档排序去重，不触碰全语料
+            candidates, inverse = np.unique(docs, return_inverse=True)
+            scores = np.bincount(inverse, weights=contributions, minlength=len(candidates))
+        else:
+            # posting 较多时直接在全语料长度的数组上累加，比排序去重快得多
+            dense_scores = np.bincount(docs, weights=contributions, minlength=self.n_docs)
+            hit = np.zeros(self.n_docs, dtype=bool)
+            hit[docs] = True
+            candidates = np.flatnonzero(hit)
+            scores = dense_scores[candidates]
+        return candidates.astype(np.int64), scores
+
+    def top_k(self, query_tokens: List[str], k: int, normalize: bool = True):
+        """
+        只对候选文档打分并部分排序取前k个
+        :param normalize: 是否按全语料做 Min-Max 归一化（未命中的文档分数视为0），与全量打分后归一化结果一致
+        :return: (文档id, 分数)，按分数从高到低排列；只返回至少命中一个查询词的文档，命中的文档不足k个时返回的结果少于k个
+        """
+        candidates, scores = self._score_candidates(query_tokens)
+        if len(candidates) == 0:
+            return candidates, scores
+
+        if normalize:
+            min_score, max_score = scores.min(), scores.max()
+            if len(candidates) < self.n_docs:
+                min_score, max_score = min(min_score, 0.0), max(max_score, 0.0)
+            if max_score == min_score:
+                scores = np.zeros_like(scores)
+            else:
+                scores = (scores - min_score) / (max_score - min_score)
+
+        if k < len(candidates):
+            selected = np.argpartition(-scores, k - 1)[:k]
+        else:
+            selected = np.arange(len(candidates))
+        order = selected[np.argsort(-scores[selected], kind='stable')]
+        return candidates[order], scores[order]
+
+    def get_scores(self, query_tokens: List[str]) -> np.ndarray:
+        """计算问题对全部文档的BM25分数，只遍历问题词项的倒排表"""
+        scores = np.zeros(self.n_docs)
+        for token in query_tokens:
+            term_id = self.vocab.get(token)
+            if term_id is None:
+                continue
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            docs = self.postings_doc[start:end]
+            tf = self.postings_tf[start:end]
+            scores[docs] += self.idf[term_id] * (tf * (self.k1 + 1) / (tf + self._length_norm[docs]))
+        return scores
@@ -0,0 +1,187 @@
+"""
+cache - 两级缓存：进程内 LRU + 可选的 SQLite 磁盘层，支持 TTL 和按索引版本失效
+
+Author: lsy
+Date: 2026/10/18
+"""
+import re
+import time
+import sqlite3
+import threading
+import unicodedata
+from pathlib import Path
+from collections import OrderedDict
+from typing import Dict, Iterable
+
+_SPACE_PATTERN = re.compile(r'\s+')
+_TRAILING_PUNCTUATION = '?？!！。.，,；;：: '
+
+
+def normalize_text(text: str) -> str:
+    """问题归一化，用作缓存键：全角转半角、小写、合并空白、去掉结尾标点"""
+    text = unicodedata.normalize('NFKC', text or '').lower()
+    text = _SPACE_PATTERN.sub(' ', text).strip()
+    return text.rstrip(_TRAILING_PUNCTUATION)
+
+
+class LRUCache:
+    """线程安全的进程内 LRU 缓存，条目超过 ttl 秒视为过期（ttl<=0 不过期）"""
+    def __init__(self, maxsize: int, ttl: float = 0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at and expires_at < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        expires_at = time.time() + self.ttl if self.ttl > 0 else 0
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class SQLiteCache:
+    """SQLite 磁盘缓存，值为 bytes，多个线程共用一个连接（加锁）"""
+    def __init__(self, path: Path, table: str, ttl: float = 0):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.table = table
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} "
+                f"(key TEXT PRIMARY KEY, value BLOB, version TEXT, expires_at REAL)")
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def get_many(self, keys: list, version: str) -> Dict[str, bytes]:
+        if not keys:
+            return {}
+        now = time.time()
+        results = {}
+        with self._lock:
+            # SQLite 单条语句的参数个数有上限，分段查询
+            for i in range(0, len(keys), 500):
+                part = keys[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM {self.table} WHERE key IN ({','.join('?' * len(part))}) "
+                    f"AND version = ? AND (expires_at = 0 OR expires_at > ?)",
+                    (*part, version, now)).fetchall()
+                results.update(rows)
+        return results
+
+    def set_many(self, items: Dict[str, bytes], version: str):
+        if not items:
+            return
+        expires_at = time.time() + self.ttl if self.ttl > 0 else 0
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, version, expires_at) VALUES (?, ?, ?, ?)",
+                [(key, value, version, expires_at) for key, value in items.items()])
+
+    def purge(self, version: str):
+        """删除其他索引版本的条目和已过期的条目"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"DELETE FROM {self.table} WHERE version != ? OR (expires_at != 0 AND expires_at < ?)",
+                (version, time.time()))
+
+
+class TieredCache:
+    """
+    LRU + SQLite 两级缓存，按批读写：
+    - 先查内存，未命中再查磁盘，磁盘命中的条目回填内存
+    - 条目绑定索引版本，版本变化（索引重建）时内存层清空、磁盘层旧版本条目删除
+    - encode/decode 负责值与磁盘 bytes 之间的转换
+    """
+    def __init__(self, name: str, maxsize: int, ttl: float = 0, sqlite_path: Path = None,
+                 encode=None, decode=None, version: str = ''):
+        self.name = name
+        self.memory = LRUCache(maxsize, ttl)
+        self.disk = SQLiteCache(sqlite_path, name, ttl) if sqlite_path else None
+        self.encode = encode or (lambda value: value)
+        self.decode = decode or (lambda data: data)
+        self.version = version
+        self._stats_lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "memory_hits": 0, "disk_hits": 0, "invalidations": 0}
+
+    def set_version(self, version: str):
+        """绑定索引版本，与当前版本不同时使旧条目失效"""
+        if version == self.version:
+            return
+        previous, self.version = self.version, version
+        self.memory.clear()
+        # 磁盘层可能保留着上次运行时旧索引的条目，首次绑定版本时也要清理
+        if self.disk is not None:
+            self.disk.purge(version)
+        if previous:
+            with self._stats_lock:
+                self._stats["invalidations"] += 1
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, object]:
+        """返回命中的 键 -> 值，未命中的键不在结果中"""
+        keys = list(keys)
+        results, missing = {}, []
+        for key in keys:
+            value = self.memory.get(key)
+            if value is None:
+                missing.append(key)
+            else:
+                results[key] = value
+        memory_hits = len(results)
+
+        if self.disk is not None and missing:
+            for key, data in self.disk.get_many(missing, self.version).items():
+                value = self.decode(data)
+                self.memory.set(key, value)
+                results[key] = value
+
+        with self._stats_lock:
+            self._stats["hits"] += len(results)
+            self._stats["misses"] += len(keys) - len(results)
+            self._stats["memory_hits"] += memory_hits
+            self._stats["disk_hits"] += len(results) - memory_hits
+        return results
+
+    def set_many(self, items: Dict[str, object]):
+        for key, value in items.items():
+            self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set_many({key: self.encode(value) for key, value in items.items()}, self.version)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        stats["memory_size"] = len(self.memory)
+        stats["disk_size"] = len(self.disk) if self.disk is not None else None
+        stats["version"] = self.version
+        return stats
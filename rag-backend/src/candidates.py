@@ -0,0 +1,72 @@
+"""
+candidates - 检索候选集，各阶段之间只传递整数块id和分数数组，正文在最终组装时才读取
+
+Author: lsy
+Date: 2026/10/18
+"""
+from typing import Dict, List
+
+import numpy as np
+
+
+class Candidates:
+    """
+    一组候选块：
+    - ids: 块id（即分块存储/向量索引中的下标），int64 数组
+    - scores: 分数名 -> 与 ids 等长的 float 数组，如 vector_score、bm25_score、final_score、relevance_score；
+      某个检索器没有命中的块该项为 NaN
+    - extras: 其他逐块字段 -> 与 ids 等长的列表，如 LLM 重排给出的 reasoning
+    """
+    __slots__ = ('ids', 'scores', 'extras')
+
+    def __init__(self, ids, scores: Dict[str, np.ndarray] = None, extras: Dict[str, list] = None):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.scores = {key: np.asarray(value, dtype=np.float64) for key, value in (scores or {}).items()}
+        self.extras = dict(extras or {})
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __repr__(self):
+        return f"Candidates(n={len(self)}, scores={list(self.scores)}, extras={list(self.extras)})"
+
+    @classmethod
+    def empty(cls):
+        return cls(np.empty(0, dtype=np.int64))
+
+    def take(self, positions) -> 'Candidates':
+        """按位置取子集/重排，返回新的候选集"""
+        positions = np.asarray(positions, dtype=np.int64)
+        return Candidates(
+            self.ids[positions],
+            {key: value[positions] for key, value in self.scores.items()},
+            {key: [value[i] for i in positions] for key, value in self.extras.items()},
+        )
+
+    def sort_by(self, key: str, top_n: int = None) -> 'Candidates':
+        """按某项分数从高到低排序（NaN 排最后），可只保留前 top_n 个"""
+        values = self.scores[key]
+        values = -np.where(np.isnan(values), -np.inf, values)
+        if top_n is not None and top_n < len(values):
+            # 只需要前 top_n 个时先部分选择，再对选出的部分排序
+            selected = np.argpartition(values, top_n - 1)[:top_n]
+            order = selected[np.argsort(values[selected])]
+        else:
+            order = np.argsort(values)
+        return self.take(order)
+
+    def rows(self) -> List[Dict]:
+        """只含块id、分数和逐块字段的字典列表，不读取正文（推送给前端的检索结果）"""
+        results = []
+        for i, chunk_id in enumerate(self.ids.tolist()):
+            item = {"chunk_id": chunk_id}
+            for key, value in self.scores.items():
+                item[key] = None if np.isnan(value[i]) else float(value[i])
+            for key, value in self.extras.items():
+                item[key] = value[i]
+            results.append(item)
+        return results
+
+    def materialize(self, chunk_store) -> List[Dict]:
+        """从分块存储读取正文和元数据，组装成上下文使用的字典列表"""
+        return [{"chunk_id": row["chunk_id"], **chunk_store.get(row["chunk_id"]), **row} for row in self.rows()]
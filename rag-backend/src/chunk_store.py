@@ -0,0 +1,182 @@
+"""
+chunk_store - 紧凑的列式分块存储，替代 all_metadata.json，按块id随机读取，支持内存映射
+
+用法（迁移已有的 all_metadata.json，在 rag-backend 目录下）：
+    python -m src.chunk_store ../data/stock_data/databases/vector_dbs/all_metadata.json
+
+Author: lsy
+Date: 2026/10/18
+"""
+import json
+import argparse
+from pathlib import Path
+from typing import List, Dict, Iterator
+
+import numpy as np
+
+from src.bm25_index import corpus_fingerprint
+
+STORE_VERSION = 1
+STORE_DIR_NAME = 'chunk_store'
+
+
+class ChunkStore:
+    """
+    按列存储全部块，块id即块在向量库/BM25索引中的下标：
+    - texts.bin: 全部块正文的 utf-8 字节拼接，text_offsets.npy 记录第 i 块的起止字节
+    - file_ids.npy + files.json: 来源文件（字典编码，每块只存一个int）
+    - page_ranges.npy: (N, 2) 起止页，单页时起止相同
+    - meta.json: 块数、语料指纹（与BM25索引校验用）
+    """
+    def __init__(self, text_buffer, text_offsets, file_ids, files, page_ranges, meta):
+        self._text_buffer = text_buffer
+        self.text_offsets = text_offsets
+        self.file_ids = file_ids
+        self.files = files
+        self.page_ranges = page_ranges
+        self.meta = meta
+
+    def __len__(self):
+        return int(self.meta['n_chunks'])
+
+    @property
+    def fingerprint(self) -> str:
+        return self.meta['fingerprint']
+
+    @staticmethod
+    def _columns(chunks: List[Dict]):
+        """把块字典列表拆成各列"""
+        encoded = [chunk['text'].encode('utf-8') for chunk in chunks]
+        text_offsets = np.zeros(len(chunks) + 1, dtype=np.int64)
+        np.cumsum([len(data) for data in encoded], out=text_offsets[1:])
+
+        files, file_index = [], {}
+        file_ids = np.empty(len(chunks), dtype=np.int32)
+        page_ranges = np.empty((len(chunks), 2), dtype=np.int32)
+        for i, chunk in enumerate(chunks):
+            file_origin = chunk['file_origin']
+            if file_origin not in file_index:
+                file_index[file_origin] = len(files)
+                files.append(file_origin)
+            file_ids[i] = file_index[file_origin]
+            page_range = chunk['page_range']
+            page_ranges[i] = (page_range[0], page_range[-1])
+
+        meta = {
+            "version": STORE_VERSION,
+            "n_chunks": len(chunks),
+            "fingerprint": corpus_fingerprint(chunk['text'] for chunk in chunks),
+        }
+        return b''.join(encoded), text_offsets, file_ids, files, page_ranges, meta
+
+    @classmethod
+    def from_chunks(cls, chunks: List[Dict]):
+        """在内存中由块字典列表构建（用于尚未迁移的 json 元数据）"""
+        return cls(*cls._columns(chunks))
+
+    @classmethod
+    def write(cls, chunks: List[Dict], store_dir: Path):
+        """写入存储目录并返回内存映射打开的实例"""
+        store_dir = Path(store_dir)
+        store_dir.mkdir(parents=True, exist_ok=True)
+        text_bytes, text_offsets, file_ids, files, page_ranges, meta = cls._columns(chunks)
+        with open(store_dir / 'texts.bin', 'wb') as f:
+            f.write(text_bytes)
+        np.save(store_dir / 'text_offsets.npy', text_offsets)
+        np.save(store_dir / 'file_ids.npy', file_ids)
+        np.save(store_dir / 'page_ranges.npy', page_ranges)
+        with open(store_dir / 'files.json', 'w', encoding='utf-8') as f:
+            json.dump(files, f, ensure_ascii=False)
+        # meta 最后写入，作为存储完整的标志
+        with open(store_dir / 'meta.json', 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+        return cls.open(store_dir)
+
+    @classmethod
+    def open(cls, store_dir: Path, mmap: bool = True):
+        """打开存储，mmap=True 时正文和各列按需从页缓存读取，多进程共享同一份物理内存"""
+        store_dir = Path(store_dir)
+        with open(store_dir / 'meta.json', 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('version') != STORE_VERSION:
+            raise ValueError(f"分块存储版本不匹配: {meta.get('version')} != {STORE_VERSION}")
+        with open(store_dir / 'files.json', 'r', encoding='utf-8') as f:
+            files = json.load(f)
+
+        mmap_mode = 'r' if mmap else None
+        text_path = store_dir / 'texts.bin'
+        # 空文件无法内存映射
+        if mmap and text_path.stat().st_size > 0:
+            text_buffer = np.memmap(text_path, dtype=np.uint8, mode='r')
+        else:
+            text_buffer = text_path.read_bytes()
+        return cls(
+            text_buffer=text_buffer,
+            text_offsets=np.load(store_dir / 'text_offsets.npy', mmap_mode=mmap_mode),
+            file_ids=np.load(store_dir / 'file_ids.npy', mmap_mode=mmap_mode),
+            files=files,
+            page_ranges=np.load(store_dir / 'page_ranges.npy', mmap_mode=mmap_mode),
+            meta=meta,
+        )
+
+    @classmethod
+    def from_vector_db_dir(cls, vector_db_dir: Path, mmap: bool = True):
+        """打开向量库目录下入库时写入的 chunk_store/；旧版向量库需先用 python -m src.chunk_store 迁移 all_metadata.json"""
+        store_dir = Path(vector_db_dir) / STORE_DIR_NAME
+        if not (store_dir / 'meta.json').exists():
+            raise FileNotFoundError(f"分块存储不存在: {store_dir}，旧版向量库请先运行 python -m src.chunk_store 迁移 all_metadata.json")
+        return cls.open(store_dir, mmap=mmap)
+
+    def text(self, chunk_id: int) -> str:
+        start, end = self.text_offsets[chunk_id], self.text_offsets[chunk_id + 1]
+        return bytes(self._text_buffer[start:end]).decode('utf-8')
+
+    def file_origin(self, chunk_id: int) -> str:
+        return self.files[self.file_ids[chunk_id]]
+
+    def page_range(self, chunk_id: int) -> List[int]:
+        start, end = (int(page) for page in self.page_ranges[chunk_id])
+        return [start, end] if start != end else [start]
+
+    def get(self, chunk_id: int) -> Dict:
+        """读取单个块，返回与原 all_metadata.json 相同结构的字典"""
+        chunk_id = int(chunk_id)
+        return {
+            "text": self.text(chunk_id),
+            "file_origin": self.file_origin(chunk_id),
+            "page_range": self.page_range(chunk_id),
+        }
+
+    def summary(self, chunk_id: int, snippet_chars: int) -> Dict:
+        """块的摘要：正文开头 snippet_chars 个字符和元数据，全文按需另取"""
+        chunk_id = int(chunk_id)
+        text = self.text(chunk_id)
+        return {
+            "snippet": text[:snippet_chars],
+            "truncated": len(text) > snippet_chars,
+            "file_origin": self.file_origin(chunk_id),
+            "page_range": self.page_range(chunk_id),
+        }
+
+    def texts(self) -> Iterator[str]:
+        for chunk_id in range(len(self)):
+            yield self.text(chunk_id)
+
+
+def convert_metadata_json(metadata_path: Path, store_dir: Path = None) -> ChunkStore:
+    """一次性把 all_metadata.json 迁移为分块存储"""
+    metadata_path = Path(metadata_path)
+    store_dir = Path(store_dir) if store_dir else metadata_path.parent / STORE_DIR_NAME
+    with open(metadata_path, 'r', encoding='utf-8') as f:
+        chunks = json.load(f)
+    store = ChunkStore.write(chunks, store_dir)
+    print(f"已迁移 {len(store)} 个块: {metadata_path} -> {store_dir}")
+    return store
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="将 all_metadata.json 迁移为分块存储")
+    parser.add_argument("metadata_path", help="all_metadata.json 路径")
+    parser.add_argument("--store-dir", help="输出目录，默认为同目录下的 chunk_store/")
+    args = parser.parse_args()
+    convert_metadata_json(Path(args.metadata_path), args.store_dir)
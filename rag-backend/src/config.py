@@ -0,0 +1,169 @@
+"""
+config - 服务运行配置，均可通过环境变量覆盖
+
+Author: lsy
+Date: 2026/10/18
+"""
+import os
+
+# 检索线程池大小：向量检索和BM25检索在线程池中并行执行，避免阻塞事件循环
+RETRIEVAL_WORKERS = int(os.getenv('RAG_RETRIEVAL_WORKERS', '8'))
+
+# 向量检索参数覆盖（IVF的nprobe、HNSW的efSearch），不设置则使用索引构建时保存的值
+VECTOR_NPROBE = int(os.getenv('RAG_VECTOR_NPROBE')) if os.getenv('RAG_VECTOR_NPROBE') else None
+VECTOR_EF_SEARCH = int(os.getenv('RAG_VECTOR_EF_SEARCH')) if os.getenv('RAG_VECTOR_EF_SEARCH') else None
+
+# 每路检索召回的候选数量，以及融合后送入重排的候选数量
+RETRIEVAL_TOP_N = int(os.getenv('RAG_RETRIEVAL_TOP_N', '20'))
+RERANK_CANDIDATES = int(os.getenv('RAG_RERANK_CANDIDATES', '20'))
+
+# 混合检索融合：weighted（加权归一化分数）/ rrf（倒数排名融合）；union / intersection / primary
+FUSION_METHOD = os.getenv('RAG_FUSION_METHOD', 'weighted')
+FUSION_POLICY = os.getenv('RAG_FUSION_POLICY', 'union')
+FUSION_VECTOR_WEIGHT = float(os.getenv('RAG_FUSION_VECTOR_WEIGHT', '0.6'))
+
+# 重排后端：llm 远程大模型打分 / feature 本地CPU特征打分
+RERANK_BACKEND = os.getenv('RAG_RERANK_BACKEND', 'llm')
+
+# LLM重排调度：批次并发数、全局限流（所有在途请求共享）、限流后的重试退避
+RERANK_MAX_CONCURRENCY = int(os.getenv('RAG_RERANK_MAX_CONCURRENCY', '4'))
+RERANK_REQUESTS_PER_SECOND = float(os.getenv('RAG_RERANK_RPS', '5'))
+RERANK_TOKENS_PER_MINUTE = float(os.getenv('RAG_RERANK_TPM', '300000'))
+RERANK_MAX_RETRIES = int(os.getenv('RAG_RERANK_MAX_RETRIES', '3'))
+RERANK_BACKOFF_SECONDS = float(os.getenv('RAG_RERANK_BACKOFF_SECONDS', '0.5'))
+
+# 重排分数缓存：进程内LRU条数、过期秒数（0为不过期）、SQLite磁盘层路径（为空则只用内存）
+RERANK_CACHE_SIZE = int(os.getenv('RAG_RERANK_CACHE_SIZE', '20000'))
+RERANK_CACHE_TTL = float(os.getenv('RAG_RERANK_CACHE_TTL', '86400'))
+RERANK_CACHE_PATH = os.getenv('RAG_RERANK_CACHE_PATH', '')
+
+# 级联重排：本地特征初筛分数 >= ACCEPT 直接通过、<= REJECT 直接淘汰，只有中间段送 LLM
+RERANK_CASCADE = os.getenv('RAG_RERANK_CASCADE', '0') == '1'
+RERANK_CASCADE_ACCEPT = float(os.getenv('RAG_RERANK_CASCADE_ACCEPT', '0.75'))
+RERANK_CASCADE_REJECT = float(os.getenv('RAG_RERANK_CASCADE_REJECT', '0.25'))
+
+# 重排批次规划：每次调用的输入token预算，单块送给LLM的最大token数（表格先压缩为纯文本，超出截断）
+RERANK_BATCH_TOKEN_BUDGET = int(os.getenv('RAG_RERANK_BATCH_TOKEN_BUDGET', '3000'))
+RERANK_MAX_CHUNK_TOKENS = int(os.getenv('RAG_RERANK_MAX_CHUNK_TOKENS', '600'))
+RERANK_MAX_BATCH_SIZE = int(os.getenv('RAG_RERANK_MAX_BATCH_SIZE', '8'))
+
+# 远程调用截止时间与对冲：超过最近成功调用延迟的 HEDGE_PERCENTILE 分位数仍未返回时补发一份请求，
+# 样本不足时使用 HEDGE_DEFAULT_DELAY 秒。重排批次直接在 RERANK_MAX_CONCURRENCY 个线程的调用线程池中执行，
+# 对冲请求使用另一个同样大小的线程池，每个在途批次最多占用两个线程；LLM_CALL_WORKERS 只用于答案生成等单次调用
+LLM_CALL_WORKERS = int(os.getenv('RAG_LLM_CALL_WORKERS', '16'))
+HEDGE_PERCENTILE = float(os.getenv('RAG_HEDGE_PERCENTILE', '95'))
+HEDGE_DEFAULT_DELAY = float(os.getenv('RAG_HEDGE_DEFAULT_DELAY', '3.0'))
+# 单次重排调用的 HTTP 超时秒数、整个重排阶段的截止秒数（含限流等待和重试，未完成的批次按融合分数兜底）
+RERANK_CALL_TIMEOUT = float(os.getenv('RAG_RERANK_CALL_TIMEOUT', '20'))
+RERANK_DEADLINE = float(os.getenv('RAG_RERANK_DEADLINE', '30'))
+RERANK_HEDGE = os.getenv('RAG_RERANK_HEDGE', '1') == '1'
+# 答案生成的截止秒数（流式输出为两个数据块之间的最大间隔）
+GENERATION_TIMEOUT = float(os.getenv('RAG_GENERATION_TIMEOUT', '60'))
+# 非流式答案生成的对冲默认关闭：对冲会再发一次完整的生成调用，慢请求的输出 token 费用和 TPM 配额都翻倍；
+# 重排批次（输出很短）和向量请求代价小，对冲收益更明显
+GENERATION_HEDGE = os.getenv('RAG_GENERATION_HEDGE', '0') == '1'
+
+# 异步 DashScope 客户端：连接池大小、各类调用的并发上限、向量请求的截止秒数
+ASYNC_HTTP_MAX_CONNECTIONS = int(os.getenv('RAG_ASYNC_HTTP_MAX_CONNECTIONS', '32'))
+ASYNC_EMBEDDING_CONCURRENCY = int(os.getenv('RAG_ASYNC_EMBEDDING_CONCURRENCY', '16'))
+ASYNC_GENERATION_CONCURRENCY = int(os.getenv('RAG_ASYNC_GENERATION_CONCURRENCY', '8'))
+EMBEDDING_TIMEOUT = float(os.getenv('RAG_EMBEDDING_TIMEOUT', '10'))
+
+# 答案流式输出合并：缓冲的增量文本每 STREAM_FLUSH_MS 毫秒或累计 STREAM_FLUSH_CHARS 个字符发送一次，
+# STREAM_FLUSH_MS=0 时不合并，模型返回的增量原样发送
+STREAM_FLUSH_MS = float(os.getenv('RAG_STREAM_FLUSH_MS', '30'))
+STREAM_FLUSH_CHARS = int(os.getenv('RAG_STREAM_FLUSH_CHARS', '64'))
+# 检索结果事件中每个块只发送一次摘要（正文开头字符数），全文由 /chunks/{id} 按需获取
+STREAM_SNIPPET_CHARS = int(os.getenv('RAG_STREAM_SNIPPET_CHARS', '120'))
+
+# 问题向量缓存：按 (模型, 归一化文本) 缓存，内存LRU + 可选SQLite磁盘层（float32 存储），批量请求每次最多 EMBEDDING_BATCH_SIZE 条
+EMBEDDING_CACHE_SIZE = int(os.getenv('RAG_EMBEDDING_CACHE_SIZE', '10000'))
+EMBEDDING_CACHE_TTL = float(os.getenv('RAG_EMBEDDING_CACHE_TTL', '604800'))
+EMBEDDING_CACHE_PATH = os.getenv('RAG_EMBEDDING_CACHE_PATH', '')
+EMBEDDING_BATCH_SIZE = int(os.getenv('RAG_EMBEDDING_BATCH_SIZE', '25'))
+
+# 语义答案缓存：新问题与历史问题的向量相似度 >= ANSWER_CACHE_THRESHOLD（且问题中的数字相同）时直接复用重排结果和答案，
+# 条目数上限（超出淘汰最久未用）、过期秒数，索引版本变化时全部失效
+ANSWER_CACHE = os.getenv('RAG_ANSWER_CACHE', '0') == '1'
+ANSWER_CACHE_THRESHOLD = float(os.getenv('RAG_ANSWER_CACHE_THRESHOLD', '0.95'))
+ANSWER_CACHE_SIZE = int(os.getenv('RAG_ANSWER_CACHE_SIZE', '1000'))
+ANSWER_CACHE_TTL = float(os.getenv('RAG_ANSWER_CACHE_TTL', '3600'))
+
+# 相同问题的在途请求合并：同一时刻相同（归一化问题 + 索引版本 + 检索选项）的请求只执行一次，后到的请求订阅同一个事件流
+SINGLE_FLIGHT = os.getenv('RAG_SINGLE_FLIGHT', '1') == '1'
+
+# 上下文打包：合并同一文件相邻/重叠的块、去掉近似重复的段落，按相关性顺序填入 token 预算后再送给生成模型
+CONTEXT_PACKING = os.getenv('RAG_CONTEXT_PACKING', '1') == '1'
+CONTEXT_TOKEN_BUDGET = int(os.getenv('RAG_CONTEXT_TOKEN_BUDGET', '3000'))
+CONTEXT_DUPLICATE_THRESHOLD = float(os.getenv('RAG_CONTEXT_DUPLICATE_THRESHOLD', '0.9'))
+
+# 请求级延迟档位（QuestionRequest.mode）：
+# - fast: 跳过重排，按融合分数取前 context_top_n 个块，上下文预算更小
+# - balanced: 级联重排，LLM 后端时只把本地特征初筛不确定的块送 LLM（本地后端直接特征重排）
+# - accurate: 完整流程，按 RAG_RERANK_BACKEND 重排
+# 各档位的候选深度可用环境变量调整
+DEFAULT_MODE = os.getenv('RAG_DEFAULT_MODE', 'accurate')
+MODE_PRESETS = {
+    "fast": {
+        "retrieval_top_n": int(os.getenv('RAG_FAST_RETRIEVAL_TOP_N', '10')),
+        "rerank_candidates": int(os.getenv('RAG_FAST_RERANK_CANDIDATES', '10')),
+        "rerank": "none",
+        "context_top_n": int(os.getenv('RAG_FAST_CONTEXT_TOP_N', '5')),
+        "context_token_budget": int(os.getenv('RAG_FAST_CONTEXT_TOKEN_BUDGET', '1500')),
+    },
+    "balanced": {
+        "retrieval_top_n": int(os.getenv('RAG_BALANCED_RETRIEVAL_TOP_N', '20')),
+        "rerank_candidates": int(os.getenv('RAG_BALANCED_RERANK_CANDIDATES', '15')),
+        "rerank": "cascade",
+        "context_top_n": int(os.getenv('RAG_BALANCED_CONTEXT_TOP_N', '6')),
+        "context_token_budget": int(os.getenv('RAG_BALANCED_CONTEXT_TOKEN_BUDGET', '2500')),
+    },
+    "accurate": {
+        "retrieval_top_n": RETRIEVAL_TOP_N,
+        "rerank_candidates": RERANK_CANDIDATES,
+        "rerank": "full",
+        "context_top_n": int(os.getenv('RAG_ACCURATE_CONTEXT_TOP_N', '8')),
+        "context_token_budget": CONTEXT_TOKEN_BUDGET,
+    },
+}
+
+# 请求截止时间（秒，默认 0 不限制，QuestionRequest.deadline 可按请求覆盖），按份额依次划分给检索、重排、生成阶段，
+# 前面阶段节省的时间顺延给后面阶段；阶段超时时降级而不是等待：
+# - 向量检索未按时返回：只用 BM25 结果
+# - 重排未按时返回：按融合分数排序
+# - 进入生成时剩余时间少于生成份额：按比例缩小上下文 token 预算（不低于 DEADLINE_MIN_CONTEXT_TOKENS）
+# 开启后重排阶段只有 REQUEST_DEADLINE * 重排份额 秒（如 20 秒时约 7~10 秒），比 RERANK_CALL_TIMEOUT/RERANK_DEADLINE 更早截止，
+# 因此默认关闭，需要按请求控制尾延迟时再设置
+REQUEST_DEADLINE = float(os.getenv('RAG_REQUEST_DEADLINE', '0'))
+DEADLINE_STAGE_SHARES = {
+    "retrieval": float(os.getenv('RAG_DEADLINE_RETRIEVAL_SHARE', '0.15')),
+    "rerank": float(os.getenv('RAG_DEADLINE_RERANK_SHARE', '0.35')),
+    "generation": float(os.getenv('RAG_DEADLINE_GENERATION_SHARE', '0.5')),
+}
+DEADLINE_MIN_CONTEXT_TOKENS = int(os.getenv('RAG_DEADLINE_MIN_CONTEXT_TOKENS', '500'))
+
+# 问题路由：检索前用规则 + 本地朴素贝叶斯模型（jieba 分词）判断问题类型（QuestionRequest.kind 可指定），
+# 问候和与知识库无关的问题直接回复，不做检索和生成；模型判为无关的概率低于 ROUTER_OTHER_THRESHOLD 时仍按知识库问题处理
+QUESTION_ROUTER = os.getenv('RAG_QUESTION_ROUTER', '1') == '1'
+ROUTER_OTHER_THRESHOLD = float(os.getenv('RAG_ROUTER_OTHER_THRESHOLD', '0.5'))
+# 各问题类型的候选深度系数，乘到延迟档位的检索深度、重排候选数、上下文块数和 token 预算上
+KIND_DEPTH_SCALES = {
+    "fact": float(os.getenv('RAG_FACT_DEPTH_SCALE', '0.6')),
+    "reasoning": float(os.getenv('RAG_REASONING_DEPTH_SCALE', '1.2')),
+    "compare": float(os.getenv('RAG_COMPARE_DEPTH_SCALE', '1.5')),
+    "summary": float(os.getenv('RAG_SUMMARY_DEPTH_SCALE', '1.0')),
+}
+
+# /query 准入控制：同时执行的请求数上限（<=0 不限制），超出的请求按优先级排队（同优先级先进先出），
+# 队列满时返回 429，预计或实际排队超过 ADMISSION_MAX_WAIT 秒时返回 503（均带 Retry-After）；
+# 预计排队时间按近期请求的平均执行时间计算，没有样本时使用 ADMISSION_DEFAULT_SERVICE_TIME 秒
+ADMISSION_MAX_ACTIVE = int(os.getenv('RAG_ADMISSION_MAX_ACTIVE', '16'))
+ADMISSION_QUEUE_SIZE = int(os.getenv('RAG_ADMISSION_QUEUE_SIZE', '64'))
+ADMISSION_MAX_WAIT = float(os.getenv('RAG_ADMISSION_MAX_WAIT', '30'))
+ADMISSION_DEFAULT_SERVICE_TIME = float(os.getenv('RAG_ADMISSION_DEFAULT_SERVICE_TIME', '5'))
+# 各阶段同时执行的请求数上限（<=0 不限制）：问题向量化+向量检索、重排、答案生成
+STAGE_CONCURRENCY = {
+    "embedding": int(os.getenv('RAG_EMBEDDING_STAGE_CONCURRENCY', '16')),
+    "rerank": int(os.getenv('RAG_RERANK_STAGE_CONCURRENCY', '4')),
+    "generation": int(os.getenv('RAG_GENERATION_STAGE_CONCURRENCY', '8')),
+}
@@ -0,0 +1,177 @@
+"""
+context_packing - 上下文打包：合并同一文件中相邻/重叠的块、去掉近似重复的段落，按相关性顺序填入 token 预算
+
+Author: lsy
+Date: 2026/10/18
+"""
+import threading
+from typing import Dict, List
+
+import src.config as config
+from src.token_utils import estimate_tokens, compact_html_table, truncate_to_tokens
+
+# 相邻块之间按文本重叠拼接时检查的最大重叠长度（分块时重叠 50 个字符）
+MAX_OVERLAP_CHARS = 200
+# 重叠少于该长度视为巧合，不去重
+MIN_OVERLAP_CHARS = 8
+# 预算剩余不足该值时不再截断放入新的段落
+MIN_PASSAGE_TOKENS = 100
+SHINGLE_SIZE = 3
+# 未打包时逐块拼接的上下文中，每块的标题行（编号、各项分数、页码、分隔线）约占的 token 数，不含文件名
+BASELINE_HEADER_TOKENS = 40
+
+
+def merge_overlap(left: str, right: str, max_overlap: int = MAX_OVERLAP_CHARS) -> str:
+    """拼接相邻的两段文本，去掉 left 结尾与 right 开头重复的部分"""
+    for k in range(min(len(left), len(right), max_overlap), MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:k]):
+            return left + right[k:]
+    return left + '\n' + right
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> set:
+    text = ''.join(text.split())
+    return {text[i:i + size] for i in range(max(1, len(text) - size + 1))}
+
+
+def containment(a: set, b: set) -> float:
+    """较短一段的字符片段在另一段中出现的比例，近似包含关系"""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / min(len(a), len(b))
+
+
+def format_page_range(page_range: List[int]) -> str:
+    # 格式化页码信息 (例如：P34-35)
+    if not page_range:
+        return "未知页码"
+    page_info = f"P{page_range[0]}"
+    if len(page_range) > 1 and page_range[-1] != page_range[0]:
+        page_info += f"-{page_range[-1]}"
+    return page_info
+
+
+class ContextPacker:
+    """
+    输入按相关性排好序的块（materialize 后的字典，需含 chunk_id/file_origin/page_range/text），依次：
+    1. 合并：HTML 表格压缩为纯文本行；同一文件中块id连续的块合并为一个段落，去掉分块时的重叠文本，页码取并集，段落排名取其中最靠前的块
+    2. 去重：与排名更靠前的段落近似重复（字符片段包含度 >= duplicate_threshold）的段落丢弃
+    3. 填充：按排名依次放入 token 预算，放不下的截断或跳过
+    """
+    def __init__(self, token_budget: int = None, duplicate_threshold: float = None):
+        self.token_budget = token_budget or config.CONTEXT_TOKEN_BUDGET
+        self.duplicate_threshold = (config.CONTEXT_DUPLICATE_THRESHOLD if duplicate_threshold is None
+                                    else duplicate_threshold)
+        self._metrics_lock = threading.Lock()
+        self._metrics = {"requests": 0, "chunks": 0, "merged": 0, "duplicates": 0, "truncated": 0,
+                         "dropped": 0, "tokens_before": 0, "tokens_after": 0}
+
+    def _dedupe(self, passages: List[Dict]) -> List[Dict]:
+        kept, kept_shingles = [], []
+        for passage in passages:
+            passage_shingles = shingles(passage["text"])
+            if any(containment(passage_shingles, other) >= self.duplicate_threshold for other in kept_shingles):
+                continue
+            kept.append(passage)
+            kept_shingles.append(passage_shingles)
+        return kept
+
+    @staticmethod
+    def _merge_adjacent(chunks: List[Dict]) -> List[Dict]:
+        """返回段落列表：{"rank", "file_origin", "page_range", "text", "chunk_ids"}"""
+        ranked = sorted(enumerate(chunks), key=lambda item: (item[1].get('file_origin', ''), item[1]['chunk_id']))
+        passages = []
+        for rank, chunk in ranked:
+            text = compact_html_table(chunk.get('text', ''))
+            previous = passages[-1] if passages else None
+            if (previous is not None and previous["file_origin"] == chunk.get('file_origin', '')
+                    and chunk['chunk_id'] == previous["chunk_ids"][-1] + 1):
+                previous["text"] = merge_overlap(previous["text"], text)
+                previous["chunk_ids"].append(chunk['chunk_id'])
+                previous["rank"] = min(previous["rank"], rank)
+                pages = previous["page_range"] + list(chunk.get('page_range') or [])
+                previous["page_range"] = [min(pages), max(pages)] if pages else []
+                continue
+            passages.append({
+                "rank": rank,
+                "file_origin": chunk.get('file_origin', ''),
+                "page_range": list(chunk.get('page_range') or []),
+                "text": text,
+                "chunk_ids": [chunk['chunk_id']],
+            })
+        return sorted(passages, key=lambda passage: passage["rank"])
+
+    @staticmethod
+    def baseline_tokens(chunks: List[Dict]) -> int:
+        """逐块拼接（不打包）时的上下文 token 数：每块正文 + 文件名 + 标题行"""
+        return sum(estimate_tokens(chunk.get('text', '')) + estimate_tokens(chunk.get('file_origin', ''))
+                   + BASELINE_HEADER_TOKENS for chunk in chunks)
+
+    @staticmethod
+    def _render(idx: int, passage: Dict, text: str) -> str:
+        return (f"[参考文档 {idx}] 来源文件: {passage['file_origin'] or '未知文件'}，"
+                f"页码: {format_page_range(passage['page_range'])}\n{text}\n")
+
+    def pack(self, chunks: List[Dict], baseline_tokens: int = None, token_budget: int = None) -> (str, dict):
+        """
+        打包上下文
+        :param chunks: 按相关性从高到低排序的块
+        :param baseline_tokens: 未打包时的上下文 token 数，用于统计节省量，默认按逐块估算（见 baseline_tokens），
+            调用方不必为统计再拼接一遍逐块上下文
+        :param token_budget: 本次的 token 预算，默认 self.token_budget
+        :return: (上下文字符串, 本次统计)
+        """
+        token_budget = token_budget or self.token_budget
+        merged = self._merge_adjacent(chunks)
+        passages = self._dedupe(merged)
+
+        parts, used, truncated, dropped = [], 0, 0, 0
+        for passage in passages:
+            remaining = token_budget - used
+            text = passage["text"]
+            part = self._render(len(parts) + 1, passage, text)
+            tokens = estimate_tokens(part)
+            if tokens > remaining:
+                header_tokens = tokens - estimate_tokens(text)
+                # 第一段总要放入；其余段落预算不足时跳过，尝试后面更短的段落
+                if parts and remaining < MIN_PASSAGE_TOKENS:
+                    dropped += 1
+                    continue
+                text = truncate_to_tokens(text, max(0, remaining - header_tokens))
+                part = self._render(len(parts) + 1, passage, text)
+                tokens = estimate_tokens(part)
+                truncated += 1
+            parts.append(part)
+            used += tokens
+
+        if baseline_tokens is None:
+            baseline_tokens = self.baseline_tokens(chunks)
+        stats = {
+            "chunks": len(chunks),
+            "merged": len(chunks) - len(merged),
+            "duplicates": len(merged) - len(passages),
+            "passages": len(parts),
+            "truncated": truncated,
+            "dropped": dropped,
+            "tokens_before": baseline_tokens,
+            "tokens_after": used,
+        }
+        with self._metrics_lock:
+            self._metrics["requests"] += 1
+            for key in ("chunks", "merged", "duplicates", "truncated", "dropped", "tokens_before", "tokens_after"):
+                self._metrics[key] += stats[key]
+        return "\n".join(parts), stats
+
+    def metrics(self) -> dict:
+        with self._metrics_lock:
+            metrics = dict(self._metrics)
+        metrics["tokens_saved"] = metrics["tokens_before"] - metrics["tokens_after"]
+        metrics["token_budget"] = self.token_budget
+        return metrics
+
+
+def log_packing(stats: dict):
+    print(f"  -> 上下文打包：{stats['chunks']} 个块，合并 {stats['merged']} 个、去重 {stats['duplicates']} 段，"
+          f"{stats['passages']} 段（截断 {stats['truncated']}、放弃 {stats['dropped']}），"
+          f"{stats['tokens_before']} → {stats['tokens_after']} tokens，"
+          f"节省 {stats['tokens_before'] - stats['tokens_after']} tokens")
@@ -0,0 +1,103 @@
+"""
+deadline - 请求级截止时间：把整体截止时间按份额划分为各阶段的截止时刻，记录超时后采取的降级措施
+
+Author: lsy
+Date: 2026/10/18
+"""
+import time
+import asyncio
+import threading
+from collections import Counter
+from typing import Awaitable, Dict, Optional
+
+import src.config as config
+
+# 进程内的降级统计，/metrics 中导出
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+class RequestDeadline:
+    """
+    一次请求的截止时间。各阶段按 config.DEADLINE_STAGE_SHARES 的顺序依次占用份额，
+    阶段截止时刻是累计份额对应的绝对时刻，前面阶段提前完成时剩余时间自动留给后面阶段
+    seconds <= 0 时不限制，remaining 返回 None
+    """
+    def __init__(self, seconds: float = None, shares: Dict[str, float] = None, start: float = None):
+        self.seconds = config.REQUEST_DEADLINE if seconds is None else seconds
+        self.start = time.time() if start is None else start
+        shares = shares or config.DEADLINE_STAGE_SHARES
+        total = sum(shares.values())
+        self.shares = {stage: share / total for stage, share in shares.items()}
+        self.stage_ends = {}
+        elapsed = 0.0
+        for stage, share in self.shares.items():
+            elapsed += share
+            self.stage_ends[stage] = self.start + self.seconds * elapsed
+        self.degradations = []
+        with _stats_lock:
+            _stats["requests"] += 1
+
+    @property
+    def enabled(self) -> bool:
+        return self.seconds > 0
+
+    def remaining(self, stage: str = None) -> Optional[float]:
+        """距阶段截止时刻（不指定阶段时为整个请求的截止时刻）的剩余秒数"""
+        if not self.enabled:
+            return None
+        end = self.stage_ends[stage] if stage else self.start + self.seconds
+        return max(0.0, end - time.time())
+
+    def context_budget(self, token_budget: int) -> int:
+        """进入生成时剩余时间少于生成阶段份额，按剩余比例缩小上下文 token 预算"""
+        if not self.enabled:
+            return token_budget
+        ratio = self.remaining() / (self.seconds * self.shares["generation"])
+        if ratio >= 1:
+            return token_budget
+        return min(token_budget, max(config.DEADLINE_MIN_CONTEXT_TOKENS, int(token_budget * ratio)))
+
+    def degrade(self, stage: str, action: str, reason: str) -> dict:
+        """
+        记录一次降级
+        :param stage: 超时的阶段
+        :param action: 采取的降级措施，如 bm25_only / fused_order / short_context
+        :param reason: 展示给用户的说明
+        """
+        record = {"stage": stage, "action": action, "reason": reason,
+                  "elapsed": round(time.time() - self.start, 3)}
+        with _stats_lock:
+            if not self.degradations:
+                _stats["degraded_requests"] += 1
+            _stats[action] += 1
+        self.degradations.append(record)
+        print(f"[Deadline] {stage} 阶段降级: {action}（{reason}）")
+        return record
+
+    @property
+    def degraded(self) -> bool:
+        return bool(self.degradations)
+
+
+async def wait_within(aw: Awaitable, timeout: Optional[float]):
+    """
+    等待 aw 最多 timeout 秒（None 不限制），超时时取消 aw 并抛出 asyncio.TimeoutError
+    与 asyncio.wait_for 不同，外层被取消时总是抛出 CancelledError：Python 3.11 的 wait_for 在 aw 恰好同时完成时
+    返回结果、吞掉取消，所有订阅者都已断开的在途请求会继续执行到结束
+    """
+    future = asyncio.ensure_future(aw)
+    try:
+        done, _ = await asyncio.wait({future}, timeout=timeout)
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    if not done:
+        future.cancel()
+        raise asyncio.TimeoutError
+    return future.result()
+
+
+def deadline_stats() -> dict:
+    with _stats_lock:
+        return {"deadline_s": config.REQUEST_DEADLINE, **_stats}
@@ -0,0 +1,149 @@
+"""
+embedding_cache - 问题向量缓存：按 (模型, 归一化文本) 缓存 L2 归一化后的 float32 向量，相同问题不再重复请求 embedding 接口
+
+Author: lsy
+Date: 2026/10/18
+"""
+import time
+import asyncio
+import hashlib
+import threading
+from typing import List
+
+import dashscope
+import numpy as np
+
+import src.config as config
+from src.cache import TieredCache, normalize_text
+from src.async_dashscope import get_async_client
+
+
+def _create_vector_cache() -> TieredCache:
+    """向量缓存：磁盘层直接存 float32 字节（1536 维约 6KB）"""
+    return TieredCache(
+        name='query_embeddings',
+        maxsize=config.EMBEDDING_CACHE_SIZE,
+        ttl=config.EMBEDDING_CACHE_TTL,
+        sqlite_path=config.EMBEDDING_CACHE_PATH or None,
+        encode=lambda vector: vector.astype('<f4').tobytes(),
+        decode=lambda data: _readonly(np.frombuffer(data, dtype='<f4')),
+    )
+
+
+def _readonly(vector: np.ndarray) -> np.ndarray:
+    """缓存中的向量被多个请求共享，设为只读防止被就地修改"""
+    vector.flags.writeable = False
+    return vector
+
+
+def normalize_vector(embedding) -> np.ndarray:
+    vec = np.array(embedding, dtype='float32')
+    # L2 归一化
+    # 这一步让向量长度变为 1，以便与库里同样归一化的向量进行余弦相似度计算
+    norm = np.linalg.norm(vec)
+    if norm > 0:
+        vec = vec / norm
+    return vec
+
+
+class EmbeddingCache:
+    """
+    带缓存的文本向量接口，同步（dashscope SDK）和异步（异步客户端）两种调用方式共用一份缓存
+    - embed_many/aembed_many: 批量获取，只把未命中的文本（批内去重）按 batch_size 分批请求
+    - 返回的向量已 L2 归一化、float32、只读
+    """
+    def __init__(self, model: str = 'text-embedding-v1', cache: TieredCache = None, batch_size: int = None):
+        self.model = model
+        self.cache = cache or _create_vector_cache()
+        self.batch_size = batch_size or config.EMBEDDING_BATCH_SIZE
+        self._metrics_lock = threading.Lock()
+        self._metrics = {"requests": 0, "texts": 0, "latency_s_total": 0.0, "saved_latency_s": 0.0}
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha1(f"{self.model}\0{normalize_text(text)}".encode('utf-8')).hexdigest()
+
+    def _lookup(self, texts: List[str]):
+        """查缓存，返回 (各文本的键, 命中的 键->向量, 需要请求的 键->文本)"""
+        keys = [self._key(text) for text in texts]
+        cached = self.cache.get_many(set(keys))
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        # 按单次请求的平均延迟估算缓存省下的时间
+        with self._metrics_lock:
+            if self._metrics["requests"] and cached:
+                average = self._metrics["latency_s_total"] / self._metrics["requests"]
+                self._metrics["saved_latency_s"] += average * len(cached)
+        return keys, cached, missing
+
+    def _store(self, missing: dict, embeddings: list, latency: float, requests: int):
+        vectors = {key: _readonly(normalize_vector(embedding)) for key, embedding in zip(missing, embeddings)}
+        self.cache.set_many(vectors)
+        with self._metrics_lock:
+            self._metrics["requests"] += requests
+            self._metrics["texts"] += len(missing)
+            self._metrics["latency_s_total"] += latency
+        return vectors
+
+    def _batches(self, texts: list):
+        for i in range(0, len(texts), self.batch_size):
+            yield texts[i:i + self.batch_size]
+
+    def _call(self, batch: List[str]) -> list:
+        resp = dashscope.TextEmbedding.call(model=self.model, input=batch)
+        if resp.status_code != 200:
+            raise RuntimeError(f"Embedding请求失败: status={resp.status_code} code={resp.code} message={resp.message}")
+        embeddings = sorted(resp.output['embeddings'], key=lambda item: item['text_index'])
+        return [item['embedding'] for item in embeddings]
+
+    def embed_many(self, texts: List[str]) -> List[np.ndarray]:
+        """批量获取向量，返回顺序与 texts 一致"""
+        keys, vectors, missing = self._lookup(texts)
+        if missing:
+            t0 = time.time()
+            embeddings, requests = [], 0
+            for batch in self._batches(list(missing.values())):
+                embeddings.extend(self._call(batch))
+                requests += 1
+            vectors.update(self._store(missing, embeddings, time.time() - t0, requests))
+        return [vectors[key] for key in keys]
+
+    async def aembed_many(self, texts: List[str]) -> List[np.ndarray]:
+        """embed_many 的异步版本，未命中的批次并发请求"""
+        keys, vectors, missing = self._lookup(texts)
+        if missing:
+            t0 = time.time()
+            client = get_async_client()
+            batches = list(self._batches(list(missing.values())))
+            results = await asyncio.gather(*(client.embed(batch, model=self.model) for batch in batches))
+            embeddings = [embedding for result in results for embedding in result]
+            vectors.update(self._store(missing, embeddings, time.time() - t0, len(batches)))
+        return [vectors[key] for key in keys]
+
+    def embed(self, text: str) -> np.ndarray:
+        return self.embed_many([text])[0]
+
+    async def aembed(self, text: str) -> np.ndarray:
+        return (await self.aembed_many([text]))[0]
+
+    def metrics(self) -> dict:
+        with self._metrics_lock:
+            metrics = dict(self._metrics)
+        metrics["latency_s_avg"] = metrics["latency_s_total"] / metrics["requests"] if metrics["requests"] else 0.0
+        metrics = {key: round(value, 4) if isinstance(value, float) else value for key, value in metrics.items()}
+        metrics["model"] = self.model
+        metrics["cache"] = self.cache.stats()
+        return metrics
+
+
+_shared_caches = {}
+_shared_lock = threading.Lock()
+
+
+def get_embedding_cache(model: str = 'text-embedding-v1') -> EmbeddingCache:
+    """进程级共享的向量缓存（每个模型一个），每次新建的检索器也能复用之前请求过的问题向量"""
+    with _shared_lock:
+        if model not in _shared_caches:
+            _shared_caches[model] = EmbeddingCache(model=model)
+        return _shared_caches[model]
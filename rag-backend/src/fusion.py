@@ -0,0 +1,96 @@
+"""
+fusion - 多路检索结果融合，基于 numpy 数组向量化计算，支持加权归一化分数融合与RRF
+
+Author: lsy
+Date: 2026/10/18
+"""
+from typing import Dict
+
+import numpy as np
+
+from src.candidates import Candidates
+
+FUSION_METHODS = ("weighted", "rrf")
+# union: 任一路命中即保留；intersection: 所有路都命中才保留；primary: 只保留第一路（如向量检索）命中的块
+FUSION_POLICIES = ("union", "intersection", "primary")
+
+
+def _min_max(values: np.ndarray) -> np.ndarray:
+    """对单路检索的候选分数做 Min-Max 归一化，全部相同时视为满分"""
+    min_score, max_score = values.min(), values.max()
+    if max_score == min_score:
+        return np.ones_like(values)
+    return (values - min_score) / (max_score - min_score)
+
+
+def fuse(
+        results: Dict[str, Candidates],
+        method: str = "weighted",
+        policy: str = "union",
+        weights: Dict[str, float] = None,
+        normalize: bool = True,
+        rrf_k: int = 60,
+        top_n: int = None,
+) -> Candidates:
+    """
+    融合多路检索结果
+    :param results: 分数名 -> 该路检索结果，如 {"vector_score": 向量结果, "bm25_score": BM25结果}，
+                    每路结果按自身分数从高到低排列，分数从 Candidates.scores[分数名] 读取
+    :param method: weighted 加权分数融合 / rrf 倒数排名融合
+    :param policy: 候选保留策略，见 FUSION_POLICIES
+    :param weights: 各路权重，默认等权
+    :param normalize: weighted 模式下是否先对每路分数做 Min-Max 归一化
+    :param rrf_k: RRF 平滑常数，score = Σ w / (k + rank)
+    :param top_n: 只保留融合分数最高的前 top_n 个
+    :return: 融合后的候选集，保留每路的原始分数（未命中为 NaN），融合分数记为 final_score，按其从高到低排序
+    """
+    if method not in FUSION_METHODS:
+        raise ValueError(f"不支持的融合方式: {method}，可选: {FUSION_METHODS}")
+    if policy not in FUSION_POLICIES:
+        raise ValueError(f"不支持的融合策略: {policy}，可选: {FUSION_POLICIES}")
+
+    names = list(results)
+    weights = weights or {name: 1.0 / len(names) for name in names}
+    lengths = [len(results[name]) for name in names]
+    if sum(lengths) == 0:
+        # 保留分数列，后续按 final_score 排序/取值时不需要区分空结果
+        return Candidates(np.empty(0, dtype=np.int64), {name: np.empty(0) for name in [*names, "final_score"]})
+
+    # 把各路结果拼成一维数组，按块id去重，row 为每条命中在去重后候选中的行号
+    all_ids = np.concatenate([results[name].ids for name in names])
+    chunk_ids, row = np.unique(all_ids, return_inverse=True)
+    bounds = np.concatenate([[0], np.cumsum(lengths)])
+
+    # 逐路计算贡献分（一维切片上的向量运算），再用 bincount 按块累加
+    contributions = np.empty(len(all_ids))
+    scores = {}
+    hit_count = np.zeros(len(chunk_ids), dtype=np.int64)
+    for i, name in enumerate(names):
+        segment = slice(bounds[i], bounds[i + 1])
+        # 空结果（如某一路超时降级）可能不带该路分数列
+        raw_scores = results[name].scores[name] if lengths[i] else np.empty(0)
+        if method == "rrf":
+            contribution = 1.0 / (rrf_k + np.arange(1, lengths[i] + 1))
+        elif normalize and lengths[i]:
+            contribution = _min_max(raw_scores)
+        else:
+            contribution = raw_scores
+        contributions[segment] = weights.get(name, 0.0) * contribution
+
+        name_scores = np.full(len(chunk_ids), np.nan)
+        name_scores[row[segment]] = raw_scores
+        scores[name] = name_scores
+        hit_count[row[segment]] += 1
+    final_scores = np.bincount(row, weights=contributions, minlength=len(chunk_ids))
+
+    if policy == "intersection":
+        keep = np.flatnonzero(hit_count == len(names))
+    elif policy == "primary":
+        keep = np.flatnonzero(~np.isnan(scores[names[0]]))
+    else:
+        keep = None
+
+    fused = Candidates(chunk_ids, dict(scores, final_score=final_scores))
+    if keep is not None:
+        fused = fused.take(keep)
+    return fused.sort_by("final_score", top_n=top_n)
@@ -0,0 +1,165 @@
+"""
+hedging - 远程调用的截止时间与对冲请求：超过历史 p95 延迟仍未返回时补发一份相同请求，先返回者胜出
+
+Author: lsy
+Date: 2026/10/18
+"""
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+
+import src.config as config
+
+# 进程级共享的调用线程池（答案生成等单次调用）：被放弃的慢请求会继续占用线程直到 SDK 的 request_timeout 到期
+_call_executor = ThreadPoolExecutor(max_workers=config.LLM_CALL_WORKERS, thread_name_prefix='llm-call')
+
+
+class DeadlineExceeded(TimeoutError):
+    """调用在截止时间内没有返回"""
+
+
+class LatencyTracker:
+    """
+    记录某类调用最近 window 次的成功延迟，用于计算对冲延迟，并统计对冲/超时次数
+    样本不足 min_samples 时使用 default_delay
+    """
+    def __init__(self, name: str, window: int = 200, min_samples: int = 20,
+                 percentile: float = None, default_delay: float = None):
+        self.name = name
+        self.min_samples = min_samples
+        self.percentile = config.HEDGE_PERCENTILE if percentile is None else percentile
+        self.default_delay = config.HEDGE_DEFAULT_DELAY if default_delay is None else default_delay
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._counters = {"calls": 0, "hedged": 0, "hedge_wins": 0, "deadline_exceeded": 0, "errors": 0}
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def count(self, key: str, value: int = 1):
+        with self._lock:
+            self._counters[key] += value
+
+    def hedge_delay(self) -> float:
+        """对冲延迟：最近成功调用延迟的 p95（可配置分位数）"""
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return self.default_delay
+            return float(np.percentile(self._latencies, self.percentile))
+
+    def stats(self) -> dict:
+        with self._lock:
+            latencies = list(self._latencies)
+            stats = dict(self._counters)
+        if latencies:
+            stats["p50_s"] = round(float(np.percentile(latencies, 50)), 3)
+            stats["p95_s"] = round(float(np.percentile(latencies, 95)), 3)
+        stats["hedge_delay_s"] = round(self.hedge_delay(), 3)
+        return stats
+
+
+def call_with_deadline(fn, deadline: float, tracker: LatencyTracker = None, hedge: bool = True,
+                       hedge_fn=None, executor: ThreadPoolExecutor = None):
+    """
+    在截止时间内执行一次远程调用，必要时发出对冲请求
+    :param fn: 无参调用，返回结果或抛出异常
+    :param deadline: 截止秒数，到期仍未返回抛出 DeadlineExceeded（后台线程中的请求无法中断，结果被丢弃）
+    :param tracker: 延迟统计，提供对冲延迟并记录本次延迟，为空时不对冲
+    :param hedge: 是否对冲
+    :param hedge_fn: 对冲时补发的调用（如需要重新申请限流配额），默认与 fn 相同
+    :param executor: 执行调用的线程池，默认使用进程级共享线程池
+    """
+    result = call_all_with_deadline([fn], deadline, tracker=tracker, hedge=hedge,
+                                    hedge_fns=[hedge_fn] if hedge_fn is not None else None, executor=executor)[0]
+    if isinstance(result, BaseException):
+        raise result
+    return result
+
+
+def call_all_with_deadline(fns, deadline: float, tracker: LatencyTracker = None, hedge: bool = True,
+                           hedge_fns=None, executor: ThreadPoolExecutor = None,
+                           hedge_executor: ThreadPoolExecutor = None) -> list:
+    """
+    并发执行一组远程调用（如一次重排的全部批次），每次调用各自有截止时间并可对冲。
+    调用方线程只负责等待和补发对冲请求，不需要再为每次调用占用一个等待线程；每次调用最多同时占用
+    executor 和 hedge_executor 中各一个线程。放弃的调用（超时、另一份已返回）还未开始执行时直接取消，
+    已在执行的无法中断，最多占用线程到 SDK 的 request_timeout 到期
+    :param fns: 无参调用列表
+    :param deadline: 每次调用的截止秒数
+    :param hedge_fns: 各调用对冲时补发的调用，默认与原调用相同
+    :param executor: 执行调用的线程池，默认使用进程级共享线程池
+    :param hedge_executor: 执行对冲请求的线程池，默认与 executor 相同
+    :return: 与 fns 等长的列表，元素为调用结果，或调用失败时的异常（超时为 DeadlineExceeded）
+    """
+    executor = executor or _call_executor
+    hedge_executor = hedge_executor or executor
+    hedge_fns = hedge_fns or [None] * len(fns)
+    hedge_delay = tracker.hedge_delay() if tracker is not None and hedge else None
+    if tracker is not None:
+        tracker.count("calls", len(fns))
+
+    start = time.monotonic()
+    results = [None] * len(fns)
+    unfinished = set(range(len(fns)))
+    running = [set() for _ in fns]
+    owners = {}
+    hedged = set()
+    last_errors = {}
+    for index, fn in enumerate(fns):
+        future = executor.submit(fn)
+        owners[future] = (index, False)
+        running[index].add(future)
+
+    def finish(index, result):
+        results[index] = result
+        unfinished.discard(index)
+        for future in running[index]:
+            # 还在队列中的调用不再执行，不占用线程
+            future.cancel()
+        running[index].clear()
+
+    while unfinished:
+        elapsed = time.monotonic() - start
+        if elapsed >= deadline:
+            if tracker is not None:
+                tracker.count("deadline_exceeded", len(unfinished))
+            for index in list(unfinished):
+                finish(index, DeadlineExceeded(f"调用超过 {deadline:.1f} 秒未返回"))
+            break
+        if hedge_delay is not None and elapsed >= hedge_delay:
+            for index in unfinished - hedged:
+                future = hedge_executor.submit(hedge_fns[index] or fns[index])
+                owners[future] = (index, True)
+                running[index].add(future)
+                hedged.add(index)
+                if tracker is not None:
+                    tracker.count("hedged")
+
+        timeout = deadline - elapsed
+        if hedge_delay is not None and unfinished - hedged:
+            timeout = min(timeout, max(0.0, hedge_delay - elapsed))
+        done, _ = wait(set().union(*(running[index] for index in unfinished)), timeout=timeout,
+                       return_when=FIRST_COMPLETED)
+        for future in done:
+            index, is_hedge = owners[future]
+            if index not in unfinished:
+                continue
+            running[index].discard(future)
+            if future.exception() is None:
+                if tracker is not None:
+                    tracker.record(time.monotonic() - start)
+                    if is_hedge:
+                        tracker.count("hedge_wins")
+                finish(index, future.result())
+                continue
+            last_errors[index] = future.exception()
+            if not running[index]:
+                # 所有请求都失败（错误不是慢，不再对冲，由调用方决定是否重试）
+                if tracker is not None:
+                    tracker.count("errors")
+                finish(index, last_errors[index])
+    return results
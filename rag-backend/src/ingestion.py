@@ -14,11 +14,98 @@ from dashscope import TextEmbedding
 from typing import Dict,List
 from tqdm import tqdm
 from pathlib import Path
+from src.bm25_index import BM25Index, tokenize
+from src.chunk_store import ChunkStore, STORE_DIR_NAME
+
+
+# 支持的索引类型：精确暴力检索、倒排、HNSW图、倒排+乘积量化（可选OPQ旋转）
+INDEX_TYPES = ("flat", "ivf_flat", "hnsw", "ivf_pq", "opq_ivf_pq")
+
+
+def _default_nlist(n_vectors: int) -> int:
+    """倒排聚类中心数：约 4*sqrt(N)，同时保证每个中心至少有39个训练样本"""
+    return max(1, min(int(4 * np.sqrt(n_vectors)), n_vectors // 39))
+
+
+def build_faiss_index(
+        embeddings_array: np.ndarray,
+        index_type: str = "flat",
+        nlist: int = None,
+        pq_m: int = 64,
+        pq_nbits: int = 8,
+        hnsw_m: int = 32,
+        ef_construction: int = 200,
+        nprobe: int = 16,
+        ef_search: int = 64,
+        train_size: int = 100000,
+        seed: int = 1234,
+):
+    """
+    构建内积（余弦）FAISS索引，embeddings_array 需已做 L2 归一化
+    :param index_type: INDEX_TYPES 之一
+    :param nlist: 倒排聚类中心数，默认按数据量估算
+    :param pq_m / pq_nbits: 乘积量化子空间数（需整除维度）及每个子空间的编码位数
+    :param hnsw_m / ef_construction: HNSW 每个节点的邻居数和建图时的搜索宽度
+    :param nprobe / ef_search: 默认检索参数，随索引一起写入文件，检索时自动生效
+    :param train_size: 需要训练的索引从全部向量中随机抽样的训练集大小
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"不支持的索引类型: {index_type}，可选: {INDEX_TYPES}")
+
+    n_vectors, dimension = embeddings_array.shape
+    nlist = nlist or _default_nlist(n_vectors)
+    factory_strings = {
+        "flat": "Flat",
+        "ivf_flat": f"IVF{nlist},Flat",
+        "hnsw": f"HNSW{hnsw_m},Flat",
+        "ivf_pq": f"IVF{nlist},PQ{pq_m}x{pq_nbits}",
+        "opq_ivf_pq": f"OPQ{pq_m},IVF{nlist},PQ{pq_m}x{pq_nbits}",
+    }
+    index = faiss.index_factory(dimension, factory_strings[index_type], faiss.METRIC_INNER_PRODUCT)
+
+    if index_type == "hnsw":
+        faiss.downcast_index(index).hnsw.efConstruction = ef_construction
+
+    # 倒排/量化类索引需要先在抽样数据上训练聚类中心和码本
+    if not index.is_trained:
+        rng = np.random.default_rng(seed)
+        if n_vectors > train_size:
+            train_ids = np.sort(rng.choice(n_vectors, size=train_size, replace=False))
+            train_vectors = embeddings_array[train_ids]
+        else:
+            train_vectors = embeddings_array
+        index.train(train_vectors)
+
+    index.add(embeddings_array)
+    set_search_params(index, nprobe=nprobe, ef_search=ef_search)
+    return index
+
+
+def set_search_params(index, nprobe: int = None, ef_search: int = None):
+    """设置检索参数（对不适用的索引类型自动忽略），返回实际生效的参数"""
+    applied = {}
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        if nprobe is not None:
+            ivf.nprobe = min(nprobe, ivf.nlist)
+        applied["nprobe"] = int(ivf.nprobe)
+    hnsw_index = faiss.downcast_index(index)
+    if hasattr(hnsw_index, "hnsw"):
+        if ef_search is not None:
+            hnsw_index.hnsw.efSearch = ef_search
+        applied["ef_search"] = int(hnsw_index.hnsw.efSearch)
+    return applied
 
 
 class VectorDBIngestor:
-    def __init__(self):
+    def __init__(self, index_type: str = "flat", **index_params):
+        """
+        :param index_type: FAISS索引类型，见 INDEX_TYPES
+        :param index_params: 传给 build_faiss_index 的构建/检索参数，如 nlist、nprobe、ef_search
+        """
         dashscope.api_key = os.getenv("DASHSCOPE_API_KEY")
+        self.index_type = index_type
+        self.index_params = index_params
 
     def _get_embeddings(self, text_list, model:str = "text-embedding-v1") -> List[float]:
         # 获取文本或文本块的嵌入向量
@@ -35,16 +122,14 @@ class VectorDBIngestor:
         return embeddings
 
     def _create_vector_db(self,embeddings:List[float]):
-        """用faiss构建向量库，采用内积（余弦距离）"""
+        """用faiss构建向量库，采用内积（余弦距离），索引类型由 index_type 决定"""
         # List 转换成 NumPy 的多维数组（Matrix）
         # FAISS是C++写的，只认float32类型的numpy数组，如果不转，FAISS 会报错或极慢
         embeddings_array = np.array(embeddings,dtype=np.float32)
         faiss.normalize_L2(embeddings_array) # 归一化
-        dimension = len(embeddings_array[0]) # 获取维度
-        # FAISS 索引对象，“余弦相似度”索引， "Flat" 意思是暴力穷举（精确）， "IP" 意思是 Inner Product（内积）
-        index = faiss.IndexFlatIP(dimension) # 开空间
+        # 默认 "flat" 为暴力穷举（精确），数据量大时可选 ivf_flat / hnsw / ivf_pq / opq_ivf_pq
+        index = build_faiss_index(embeddings_array, self.index_type, **self.index_params)
         # FAISS 就在内存中建立好了这些向量的结构，准备好被搜索了
-        index.add(embeddings_array)
         return index # 调用 index.search() 去查找相似的向量
 
     def _extract_report_data(self,report_data:Dict):
@@ -90,9 +175,18 @@ class VectorDBIngestor:
         faiss_file_path = output_dir / "all_reports.faiss"
         faiss.write_index(index, str(faiss_file_path))
 
-        # 保存元数据文件 (保存对应文件和页码)
-        metadata_file_path = output_dir / "all_metadata.json"
-        with open(metadata_file_path, "w", encoding='utf-8') as f:
-            json.dump(all_metadata, f, ensure_ascii=False, indent=2)
+        # 保存分块存储 (正文、对应文件和页码按列存放，块id即向量在索引中的下标)
+        chunk_store = ChunkStore.write(all_metadata, output_dir / STORE_DIR_NAME)
+
+        # 保存预分词的BM25索引，检索服务启动时直接加载，不再现场分词
+        self.create_bm25_index(chunk_store, output_dir / "bm25_index")
+
+        print(f'报告已存入向量库中！')
 
-        print(f'报告已存入向量库中！')
\ No newline at end of file
+    @staticmethod
+    def create_bm25_index(chunk_store: ChunkStore, index_dir: Path):
+        """对全部块分词并构建BM25倒排索引，与分块存储的块id一一对应"""
+        corpus_tokens = [tokenize(text) for text in tqdm(chunk_store.texts(), total=len(chunk_store), desc="构建BM25索引中")]
+        bm25_index = BM25Index.build(corpus_tokens, fingerprint=chunk_store.fingerprint)
+        bm25_index.save(index_dir)
+        return bm25_index
@@ -0,0 +1,164 @@
+"""
+local_reranking - 本地CPU重排，基于向量/BM25/词项覆盖/词项邻近度特征打分，不调用远程模型
+
+Author: lsy
+Date: 2026/10/18
+"""
+import re
+import time
+import threading
+from typing import List
+
+import numpy as np
+
+from src.bm25_index import tokenize
+from src.candidates import Candidates
+from src.reranking import BaseReranker
+
+# 问题中不携带检索信息的虚词/疑问词
+STOP_WORDS = {
+    '的', '了', '是', '在', '和', '与', '及', '或', '吗', '呢', '啊', '请问', '什么', '哪些', '哪个',
+    '多少', '如何', '怎么', '怎样', '为什么', '是否', '有', '有没有', '一下', '介绍', '公司',
+}
+_WORD_PATTERN = re.compile(r'[0-9a-zA-Z一-鿿]')
+FEATURE_NAMES = {"vector": "向量", "bm25": "BM25", "coverage": "词项覆盖", "proximity": "邻近度"}
+# 每个词项最多记录的出现位置数，控制长文本上的邻近度计算开销
+MAX_POSITIONS_PER_TERM = 64
+
+
+def query_terms(question: str) -> List[str]:
+    """问题分词后去掉标点、空白和虚词，保留顺序去重"""
+    terms = []
+    for token in tokenize(question.lower()):
+        token = token.strip()
+        if token and token not in STOP_WORDS and _WORD_PATTERN.search(token) and token not in terms:
+            terms.append(token)
+    return terms
+
+
+def _min_max_or_zero(values: np.ndarray) -> np.ndarray:
+    """候选间 Min-Max 归一化，NaN（该路未命中）记为 0"""
+    result = np.zeros(len(values))
+    hit = ~np.isnan(values)
+    if not hit.any():
+        return result
+    min_score, max_score = values[hit].min(), values[hit].max()
+    result[hit] = 1.0 if max_score == min_score else (values[hit] - min_score) / (max_score - min_score)
+    return result
+
+
+def term_proximity(text: str, terms: List[str]) -> float:
+    """
+    词项邻近度：覆盖文中所有命中词项的最短窗口，命中词项总长 / 窗口长度，取值 (0, 1]
+    命中词项不足 2 个时无法衡量邻近度，只有问题本身只有 1 个词项时记为 1
+    """
+    occurrences = []
+    for term_idx, term in enumerate(terms):
+        positions = [m.start() for m in re.finditer(re.escape(term), text)][:MAX_POSITIONS_PER_TERM]
+        occurrences.extend((position, term_idx) for position in positions)
+    matched = {term_idx for _, term_idx in occurrences}
+    if len(matched) < 2:
+        return 1.0 if len(terms) == 1 and matched else 0.0
+
+    # 滑动窗口求覆盖全部命中词项的最短区间
+    occurrences.sort()
+    counts, covered, left = {}, 0, 0
+    best_span = None
+    for position, term_idx in occurrences:
+        counts[term_idx] = counts.get(term_idx, 0) + 1
+        if counts[term_idx] == 1:
+            covered += 1
+        while covered == len(matched):
+            start, start_term = occurrences[left]
+            span = position + len(terms[term_idx]) - start
+            if best_span is None or span < best_span:
+                best_span = span
+            counts[start_term] -= 1
+            if counts[start_term] == 0:
+                covered -= 1
+            left += 1
+    matched_length = sum(len(terms[term_idx]) for term_idx in matched)
+    return min(1.0, matched_length / best_span)
+
+
+class FeatureReranker(BaseReranker):
+    """
+    特征加权重排：对全部候选一次性计算
+    - vector: 向量相似度（候选间归一化）
+    - bm25: BM25 分数（候选间归一化）
+    - coverage: 问题词项在块中出现的比例
+    - proximity: 命中词项在块中的紧凑程度
+    relevance_score 为各特征加权和，取值 0-1，与 LLM 重排分数同一量纲
+    """
+    name = 'feature'
+    label = '本地特征'
+    DEFAULT_WEIGHTS = {"vector": 0.35, "bm25": 0.25, "coverage": 0.25, "proximity": 0.15}
+
+    def __init__(self, chunk_store=None, weights: dict = None):
+        """
+        :param chunk_store: 分块存储，重排时按块id读取正文
+        :param weights: 各特征权重，默认 DEFAULT_WEIGHTS
+        """
+        self.chunk_store = chunk_store
+        self.weights = dict(weights or self.DEFAULT_WEIGHTS)
+        self._metrics_lock = threading.Lock()
+        self._metrics = {"calls": 0, "chunks": 0, "latency_s_total": 0.0}
+
+    def score(self, question, retrieved_chunks: Candidates):
+        """计算全部候选的特征和相关性分数，返回 (relevance_scores, features)"""
+        n = len(retrieved_chunks)
+        terms = query_terms(question)
+        texts = [self.chunk_store.text(chunk_id).lower() for chunk_id in retrieved_chunks.ids.tolist()]
+
+        features = {
+            "coverage": np.array([sum(term in text for term in terms) / len(terms) if terms else 0.0
+                                  for text in texts]),
+            "proximity": np.array([term_proximity(text, terms) if terms else 0.0 for text in texts]),
+        }
+        weights = {name: self.weights.get(name, 0.0) for name in features}
+        # 只对候选集中实际存在的检索分数计权，缺失的特征不拉低分数
+        for name, score_key in (("vector", "vector_score"), ("bm25", "bm25_score")):
+            if score_key in retrieved_chunks.scores:
+                features[name] = _min_max_or_zero(retrieved_chunks.scores[score_key])
+                weights[name] = self.weights.get(name, 0.0)
+
+        total_weight = sum(weights.values()) or 1.0
+        relevance_scores = np.zeros(n)
+        for name, values in features.items():
+            relevance_scores += weights[name] / total_weight * values
+        return relevance_scores, features
+
+    def rerank_chunks(self, question, retrieved_chunks: Candidates, top_n, rerank_batch_size=None,
+                      cascade=None) -> Candidates:
+        """
+        对全部候选一次性打分重排，rerank_batch_size/cascade 仅为与 LLMReranker 接口兼容，不起作用
+
+        Returns:
+            Candidates: 重排后的候选块，增加 relevance_score 分数和 reasoning 字段，按相关性分数从高到低排序
+        """
+        if not len(retrieved_chunks):
+            return Candidates.empty()
+
+        t0 = time.time()
+        relevance_scores, features = self.score(question, retrieved_chunks)
+        reasonings = []
+        for i in range(len(retrieved_chunks)):
+            parts = [f"{FEATURE_NAMES[name]} {values[i]:.2f}" for name, values in features.items()]
+            reasonings.append(f"本地特征打分（{'，'.join(parts)}）")
+
+        reranked = retrieved_chunks.take(np.arange(len(retrieved_chunks)))
+        reranked.scores['relevance_score'] = np.round(relevance_scores, 4)
+        reranked.extras['reasoning'] = reasonings
+
+        latency = time.time() - t0
+        with self._metrics_lock:
+            self._metrics["calls"] += 1
+            self._metrics["chunks"] += len(retrieved_chunks)
+            self._metrics["latency_s_total"] += latency
+        return reranked.sort_by('relevance_score', top_n=top_n)
+
+    def metrics(self) -> dict:
+        with self._metrics_lock:
+            metrics = dict(self._metrics)
+        metrics["latency_s_avg"] = metrics["latency_s_total"] / metrics["calls"] if metrics["calls"] else 0.0
+        return {key: round(value, 4) if isinstance(value, float) else value for key, value in metrics.items()}
@@ -11,6 +11,7 @@ from pyprojroot import here
 from src.text_splitter import TextSplitter
 from pathlib import Path
 from src.ingestion import VectorDBIngestor
+from src.chunk_store import ChunkStore, convert_metadata_json
 from src.questions_processing import QuestionsProcessor
 
 class Pipeline:
@@ -28,21 +29,36 @@ class Pipeline:
             output_dir=output_dir,
         )
 
-    def create_vector_dbs(self):
-        """从分块报告创建向量数据库"""
+    def create_vector_dbs(self, index_type: str = "flat", **index_params):
+        """
+        从分块报告创建向量数据库
+        :param index_type: FAISS索引类型 flat/ivf_flat/hnsw/ivf_pq/opq_ivf_pq，可先用 tools/bench_ann.py 评估
+        :param index_params: 索引构建/检索参数，如 nlist=1024, nprobe=32, ef_search=128
+        """
         input_dir = Path('../data/stock_data/databases/chunked_reports')
         output_dir = Path('../data/stock_data/databases/vector_dbs')
 
         # ingestor 提取器
-        vdb_ingestor = VectorDBIngestor()
+        vdb_ingestor = VectorDBIngestor(index_type=index_type, **index_params)
         vdb_ingestor.process_reports(input_dir=input_dir, output_dir=output_dir)
         print(f'向量数据库已经创建到{output_dir}中')
 
-    def answer_single_question(self,question:str,kind:str="summary"):
+    def create_bm25_index(self):
+        """为已有的分块存储单独构建BM25索引（无需重新向量化）"""
+        vector_db_dir = Path('../data/stock_data/databases/vector_dbs')
+        chunk_store = ChunkStore.from_vector_db_dir(vector_db_dir)
+        VectorDBIngestor.create_bm25_index(chunk_store, vector_db_dir / 'bm25_index')
+        print(f'BM25索引已经创建到{vector_db_dir / "bm25_index"}中')
+
+    def migrate_metadata(self):
+        """一次性把旧版 all_metadata.json 迁移为分块存储"""
+        convert_metadata_json(Path('../data/stock_data/databases/vector_dbs/all_metadata.json'))
+
+    def answer_single_question(self,question:str,kind:str=None):
         """
         单条问题即时推理
         kind问题类型：'fact','reasoning','compare','summary','greeting','other'
-        事实，原因，对比，总结，闲聊，其他（无关的）
+        事实，原因，对比，总结，闲聊，其他（无关的）；不指定时由问题路由判断
         """
         t0=time.time()
         processor = QuestionsProcessor(
@@ -50,7 +66,7 @@ class Pipeline:
             api_provider="dashscope",
             answering_model="qwen-turbo",
             vector_index_path=Path("../data/stock_data/databases/vector_dbs/all_reports.faiss"),
-            metadata_path=Path("../data/stock_data/databases/vector_dbs/all_metadata.json")
+            vector_db_dir=Path("../data/stock_data/databases/vector_dbs")
         )
         answer = processor.process_single_question(question,kind=kind)
         t1=time.time()
@@ -71,6 +87,9 @@ if __name__ == '__main__':
 
     # 3. 从分块报告中创建向量数据库，输出到 database/vector_dbs/对应文件名.faiss
     # pipeline.create_vector_dbs()
+    # 已有旧版向量库时，可将 all_metadata.json 迁移为分块存储，并单独补建BM25索引
+    # pipeline.migrate_metadata()
+    # pipeline.create_bm25_index()
 
     # 4. 处理问题并生成答案
     pipeline.answer_single_question('中芯国际在晶圆制造行业中的地位如何？其服务范围和全球布局是怎样的？',kind="summary")
@@ -82,6 +82,93 @@ class AnswerWithRAGContextStringPrompt:
     system_prompt = build_system_prompt(instruction, example)
     system_prompt_with_schema = build_system_prompt(instruction, example, pydantic_schema)
 
+class AnswerWithRAGContextFactPrompt:
+    instruction = AnswerWithRAGContextSharedPrompt.instruction + '''
+这是一个事实类问题（数值、日期、名称等）：
+- 最终答案直接给出所问的数值或事实，带上单位、币种和对应的报告期，不展开无关内容。
+- 上下文中找不到确切数据时明确说明，不要估算或编造。
+'''
+    user_prompt = AnswerWithRAGContextSharedPrompt.user_prompt
+    AnswerSchema = AnswerWithRAGContextStringPrompt.AnswerSchema
+    pydantic_schema = AnswerWithRAGContextStringPrompt.pydantic_schema
+
+    example = r'''
+示例：
+问题：
+"中芯国际2023年的研发投入是多少？"
+
+答案：
+```
+{
+  "step_by_step_analysis": "1. 问题询问中芯国际2023年的研发投入金额。\n2. 年报第45页研发投入情况表列出了本期研发投入合计。\n3. 表中数值单位为万元，换算为亿元表述。\n4. 同页给出了研发投入占营业收入的比例，可作为补充。\n5. 答案直接给出金额及占比。",
+  "reasoning_summary": "年报45页研发投入表直接给出了2023年研发投入金额。",
+  "relevant_pages": [45],
+  "final_answer": "中芯国际2023年研发投入为49.9亿元，占营业收入的比例约为11.0%。"
+}
+```
+'''
+
+    system_prompt = build_system_prompt(instruction, example)
+    system_prompt_with_schema = build_system_prompt(instruction, example, pydantic_schema)
+
+class AnswerWithRAGContextReasoningPrompt:
+    instruction = AnswerWithRAGContextSharedPrompt.instruction + '''
+这是一个原因分析类问题：
+- 最终答案先给出结论，再分点列出上下文中提到的主要原因或影响因素，每点说明依据。
+- 只使用年报中管理层讨论与分析等内容给出的原因，不要补充上下文之外的推测。
+'''
+    user_prompt = AnswerWithRAGContextSharedPrompt.user_prompt
+    AnswerSchema = AnswerWithRAGContextStringPrompt.AnswerSchema
+    pydantic_schema = AnswerWithRAGContextStringPrompt.pydantic_schema
+
+    example = r'''
+示例：
+问题：
+"公司2023年毛利率下降的原因是什么？"
+
+答案：
+```
+{
+  "step_by_step_analysis": "1. 问题要求分析2023年毛利率下降的原因。\n2. 年报第30页管理层讨论中说明毛利率同比下降。\n3. 第30页指出产能利用率下降，折旧成本摊薄不足。\n4. 第31页提到产品平均售价下降。\n5. 归纳为两个主要原因。",
+  "reasoning_summary": "年报30-31页管理层讨论给出了产能利用率和售价两方面原因。",
+  "relevant_pages": [30, 31],
+  "final_answer": "2023年毛利率下降主要有两方面原因：\n1. 产能利用率下降，固定的折旧成本摊薄不足；\n2. 行业需求疲软导致产品平均售价下降。"
+}
+```
+'''
+
+    system_prompt = build_system_prompt(instruction, example)
+    system_prompt_with_schema = build_system_prompt(instruction, example, pydantic_schema)
+
+class AnswerWithRAGContextComparePrompt:
+    instruction = AnswerWithRAGContextSharedPrompt.instruction + '''
+这是一个对比类问题：
+- 最终答案分别列出每个比较对象（公司、年份或业务）的对应数据或情况，注明来源，再给出对比结论。
+- 某个对象在上下文中缺少数据时明确指出，不要只根据一方的数据下结论。
+'''
+    user_prompt = AnswerWithRAGContextSharedPrompt.user_prompt
+    AnswerSchema = AnswerWithRAGContextStringPrompt.AnswerSchema
+    pydantic_schema = AnswerWithRAGContextStringPrompt.pydantic_schema
+
+    example = r'''
+示例：
+问题：
+"公司2022年和2023年的营业收入相比有什么变化？"
+
+答案：
+```
+{
+  "step_by_step_analysis": "1. 问题要求对比2022年和2023年的营业收入。\n2. 年报第8页主要会计数据表列出了两年的营业收入。\n3. 2023年营业收入为452.5亿元，2022年为495.2亿元。\n4. 计算得出同比下降约8.6%。\n5. 给出两年数据和变化结论。",
+  "reasoning_summary": "年报8页主要会计数据表同时给出了两年营业收入。",
+  "relevant_pages": [8],
+  "final_answer": "- 2023年营业收入：452.5亿元\n- 2022年营业收入：495.2亿元\n\n2023年营业收入同比减少42.7亿元，下降约8.6%。"
+}
+```
+'''
+
+    system_prompt = build_system_prompt(instruction, example)
+    system_prompt_with_schema = build_system_prompt(instruction, example, pydantic_schema)
+
 class RerankingPrompt:
     system_prompt_rerank_single_block = """
 你是一个RAG检索重排专家。
@@ -0,0 +1,211 @@
+"""
+question_router - 问题路由：检索前用规则 + 本地朴素贝叶斯模型（jieba 分词）判断问题类型，
+问候和与知识库无关的问题直接回复，其余问题按类型选择提示词和候选深度
+
+Author: lsy
+Date: 2026/10/18
+"""
+import re
+import math
+import time
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, List
+
+import jieba
+
+import src.config as config
+
+# 需要检索的问题类型（与 APIProcessor._build_rag_context_prompts 一致），以及不检索直接回复的类型
+RAG_KINDS = ("fact", "reasoning", "compare", "summary")
+DIRECT_KINDS = ("greeting", "other")
+KIND_LABELS = {"fact": "事实", "reasoning": "原因", "compare": "对比", "summary": "总结",
+               "greeting": "问候", "other": "无关"}
+
+DIRECT_REPLIES = {
+    "greeting": "你好！我是上市公司年报知识库助手，可以回答年报中的经营数据、业务布局、财务变化原因、公司间对比等问题，"
+                "例如「中芯国际2023年的营业收入是多少？」。",
+    "other": "这个问题似乎与知识库中的上市公司年报无关，我只能基于年报内容回答问题。"
+             "可以试试询问公司的经营业绩、主营业务、研发投入或行业地位等。",
+}
+
+# 去掉空白和标点后整句匹配的问候语
+GREETING_PATTERN = re.compile(
+    r'^(你好|您好|hi|hello|hey|嗨|哈喽|在吗|在不在|早上好|中午好|下午好|晚上好|早安|晚安|谢谢|谢谢你|多谢|感谢|'
+    r'好的|收到|再见|拜拜|bye|你是谁|你叫什么|你能做什么|你会什么|介绍一下你自己|你有什么功能)'
+    r'(啊|呀|呢|哦|吗|啦|~)*$', re.IGNORECASE)
+PUNCTUATION_PATTERN = re.compile(r'[\s,.!?;:，。！？；：、~～…"\'“”‘’()（）]+')
+
+# 高精度的关键词规则，按顺序匹配；对比优先于原因，原因优先于事实
+KIND_RULES = [
+    ("compare", re.compile(r'对比|相比|比较|相较|区别|差异|异同|哪家|哪个(公司)?更|谁更|高于|低于|\bvs\b', re.IGNORECASE)),
+    ("reasoning", re.compile(r'为什么|为何|原因|导致|怎么会|如何影响|什么影响|影响因素|驱动因素|背后')),
+    ("fact", re.compile(r'多少|几[个家项年次]|哪一年|哪年|什么时候|何时|是否|有没有|占比|同比|增长率|金额|数量|排名第几')),
+    ("summary", re.compile(r'总结|概述|概括|介绍|简述|主要内容|有哪些|情况如何|如何|怎样|怎么样')),
+]
+
+# 出现这些年报领域词时不判为无关问题（模型在小语料上训练，宁可多检索也不误拒）
+DOMAIN_PATTERN = re.compile(
+    r'公司|集团|股份|年报|报告期|营收|营业|收入|利润|毛利|净利|成本|费用|资产|负债|现金|股东|分红|股息|'
+    r'研发|专利|产能|产品|业务|客户|市场|行业|战略|子公司|董事|员工|投资|募集|晶圆|芯片|半导体')
+
+# 朴素贝叶斯模型的种子语料
+SEED_EXAMPLES = {
+    "fact": [
+        "中芯国际2023年的营业收入是多少", "公司的研发投入金额是多少", "报告期内净利润同比增长了多少",
+        "公司有多少名员工", "公司的注册地址在哪里", "董事长是谁", "公司在哪一年上市",
+        "第一大股东的持股比例是多少", "公司拥有多少项专利", "每股分红金额是多少",
+        "公司的毛利率是多少", "海外收入占比多少",
+    ],
+    "reasoning": [
+        "公司净利润下降的原因是什么", "为什么毛利率同比下滑", "营业收入增长的主要驱动因素有哪些",
+        "导致经营现金流减少的原因", "研发费用大幅增加的原因是什么", "为何资产减值损失增加",
+        "存货增加对利润有什么影响", "汇率波动如何影响公司业绩", "公司亏损的主要原因",
+        "产能利用率下降的背后原因",
+    ],
+    "compare": [
+        "中芯国际和华虹半导体的营收对比", "两家公司的毛利率相比谁更高", "比较公司近三年的研发投入",
+        "今年和去年的净利润有什么区别", "国内业务与海外业务的收入差异", "哪家公司的研发投入更多",
+        "各业务板块的收入比较", "公司与同行业竞争对手相比有什么优势", "不同产品线的毛利率差异",
+        "2022年与2023年的现金流对比",
+    ],
+    "summary": [
+        "中芯国际在晶圆制造行业中的地位如何", "请总结公司的主营业务", "介绍一下公司的发展战略",
+        "公司的全球布局是怎样的", "概述公司报告期内的经营情况", "公司面临哪些主要风险",
+        "公司的核心竞争力有哪些", "简述公司的研发情况", "公司的客户结构是怎样的",
+        "公司未来的发展规划", "公司的治理结构情况",
+    ],
+    "other": [
+        "今天天气怎么样", "给我讲个笑话", "帮我写一首诗", "推荐几部好看的电影", "明天会下雨吗",
+        "怎么做红烧肉", "帮我翻译这句英文", "写一段python代码", "世界上最高的山是哪座",
+        "周末去哪里玩", "你喜欢什么颜色", "帮我写一封情书", "足球比赛谁赢了", "怎么减肥最快",
+        "附近有什么好吃的餐厅", "去哪里旅游比较好", "这首歌叫什么名字", "怎么学好英语",
+    ],
+}
+
+
+def route_tokens(question: str) -> List[str]:
+    """路由模型的特征：jieba 分词结果去掉空白和标点"""
+    return [token for token in jieba.lcut(question.lower()) if not PUNCTUATION_PATTERN.fullmatch(token)]
+
+
+class NaiveBayesClassifier:
+    """多项式朴素贝叶斯（拉普拉斯平滑），训练和预测都在内存中完成，单次预测为微秒级"""
+    def __init__(self, alpha: float = 1.0):
+        self.alpha = alpha
+        self.classes = []
+        self.vocab = set()
+        self._log_prior = {}
+        self._log_likelihood = {}
+        self._log_unseen = {}
+
+    def fit(self, examples: Dict[str, List[List[str]]]) -> 'NaiveBayesClassifier':
+        """
+        :param examples: 类别 -> 样本分词列表
+        """
+        self.classes = list(examples)
+        counts = {label: Counter(token for tokens in samples for token in tokens)
+                  for label, samples in examples.items()}
+        self.vocab = set().union(*counts.values())
+        total_samples = sum(len(samples) for samples in examples.values())
+        for label in self.classes:
+            total = sum(counts[label].values()) + self.alpha * len(self.vocab)
+            self._log_prior[label] = math.log(len(examples[label]) / total_samples)
+            self._log_likelihood[label] = {token: math.log((count + self.alpha) / total)
+                                           for token, count in counts[label].items()}
+            self._log_unseen[label] = math.log(self.alpha / total)
+        return self
+
+    def predict_proba(self, tokens: List[str]) -> Dict[str, float]:
+        """各类别的后验概率；只使用训练语料中出现过的词，没有已知词时返回先验"""
+        known = [token for token in tokens if token in self.vocab]
+        scores = {}
+        for label in self.classes:
+            likelihood = self._log_likelihood[label]
+            unseen = self._log_unseen[label]
+            scores[label] = self._log_prior[label] + sum(likelihood.get(token, unseen) for token in known)
+        top = max(scores.values())
+        exp_scores = {label: math.exp(score - top) for label, score in scores.items()}
+        norm = sum(exp_scores.values())
+        return {label: value / norm for label, value in exp_scores.items()}
+
+
+class QuestionRouter:
+    """
+    问题路由：
+    1. 去掉标点后整句是问候语 -> greeting
+    2. 问题中没有年报领域词，且朴素贝叶斯模型判为 other（概率最高且 >= other_threshold）-> other
+    3. 关键词规则命中 -> 对应类型
+    4. 取模型在知识库问题类型中概率最高的一类，各类概率接近时默认 summary
+    """
+    def __init__(self, examples: Dict[str, List[str]] = None, other_threshold: float = None):
+        self.examples = examples or SEED_EXAMPLES
+        self.other_threshold = config.ROUTER_OTHER_THRESHOLD if other_threshold is None else other_threshold
+        self.model = None
+        self._lock = threading.Lock()
+        self._counters = defaultdict(int)
+        self._latency_s_total = 0.0
+
+    def fit(self) -> 'QuestionRouter':
+        """训练路由模型（种子语料分词，毫秒级），服务启动时调用，未调用时在第一次路由时训练"""
+        self.model = NaiveBayesClassifier().fit(
+            {kind: [route_tokens(text) for text in texts] for kind, texts in self.examples.items()})
+        return self
+
+    def _classify(self, question: str) -> dict:
+        text = PUNCTUATION_PATTERN.sub('', question)
+        if not text or (len(text) <= 12 and GREETING_PATTERN.match(text)):
+            return {"kind": "greeting", "confidence": 1.0, "source": "rule"}
+
+        if self.model is None:
+            self.fit()
+        proba = self.model.predict_proba(route_tokens(question))
+        # 无关问题里也常有“怎么样/多少”等词，先于类型规则判断
+        other = proba.get("other", 0.0)
+        if other >= self.other_threshold and other == max(proba.values()) and not DOMAIN_PATTERN.search(text):
+            return {"kind": "other", "confidence": round(other, 3), "source": "model"}
+        for kind, pattern in KIND_RULES:
+            if pattern.search(text):
+                return {"kind": kind, "confidence": 1.0, "source": "rule"}
+        kind = max(RAG_KINDS, key=lambda name: proba.get(name, 0.0))
+        confidence = proba[kind] / max(1e-9, sum(proba.get(name, 0.0) for name in RAG_KINDS))
+        # 所有类型概率接近（没有可区分的已知词）时按总结类处理，使用各档位的默认深度
+        if confidence < 0.5:
+            return {"kind": "summary", "confidence": round(confidence, 3), "source": "default"}
+        return {"kind": kind, "confidence": round(confidence, 3), "source": "model"}
+
+    def route(self, question: str) -> dict:
+        """
+        判断问题类型
+        :return: {"kind": 类型, "label": 中文名, "confidence": 置信度, "source": rule/model/default, "latency_us": 耗时微秒}
+        """
+        t0 = time.perf_counter()
+        route = self._classify(question)
+        latency = time.perf_counter() - t0
+        with self._lock:
+            self._counters[route["kind"]] += 1
+            self._counters[route["source"]] += 1
+            self._latency_s_total += latency
+        return {**route, "label": KIND_LABELS[route["kind"]], "latency_us": round(latency * 1e6, 1)}
+
+    def stats(self) -> dict:
+        with self._lock:
+            routed = sum(self._counters[kind] for kind in KIND_LABELS)
+            return {
+                "routed": routed,
+                "kinds": {kind: self._counters[kind] for kind in KIND_LABELS},
+                "sources": {source: self._counters[source] for source in ("rule", "model", "default")},
+                "direct_replies": sum(self._counters[kind] for kind in DIRECT_KINDS),
+                "latency_us_avg": round(self._latency_s_total / routed * 1e6, 1) if routed else None,
+            }
+
+
+def kind_preset(preset: dict, kind: str) -> dict:
+    """按问题类型缩放延迟档位的候选深度（config.KIND_DEPTH_SCALES），事实类更浅、对比类更深"""
+    scale = config.KIND_DEPTH_SCALES.get(kind, 1.0)
+    if scale == 1.0:
+        return preset
+    scaled = dict(preset)
+    for key in ("retrieval_top_n", "rerank_candidates", "context_top_n", "context_token_budget"):
+        scaled[key] = max(1, round(preset[key] * scale))
+    return scaled
@@ -4,10 +4,16 @@ questions_processing - 问题处理器
 Author: lsy
 Date: 2026/1/7
 """
+import copy
 import time
 from pathlib import Path
 
-from src.api_requests import APIProcessor
+import src.config as config
+from src.answer_cache import SemanticAnswerCache, get_answer_cache
+from src.context_packing import ContextPacker, log_packing
+from src.registry import compute_index_version
+from src.api_requests import APIProcessor, TIMEOUT_FINAL_ANSWER
+from src.question_router import QuestionRouter, DIRECT_KINDS, DIRECT_REPLIES
 from src.retrieval import VectorRetriever
 from src.retrieval import HybridRetriever
 
@@ -18,14 +24,21 @@ class QuestionsProcessor:
         api_provider:str="dashscope",
         answering_model:str="qwen-turbo-lastest",
         vector_index_path:Path=None,
-        metadata_path:Path=None,
+        vector_db_dir:Path=None,
+        answer_cache:SemanticAnswerCache=None,
     ):
+        """
+        :param answer_cache: 语义答案缓存，默认 RAG_ANSWER_CACHE=1 时使用进程级共享的缓存，相似问题直接复用答案
+        """
         self.llm_ranking = llm_ranking
         self.api_provider = api_provider
         self.answering_model = answering_model
         self.vector_index_path = vector_index_path
-        self.metadata_path = metadata_path
+        self.vector_db_dir = vector_db_dir
         self.api_processor = APIProcessor(provider=self.api_provider)
+        self.answer_cache = answer_cache or (get_answer_cache() if config.ANSWER_CACHE else None)
+        self.context_packer = ContextPacker() if config.CONTEXT_PACKING else None
+        self.question_router = QuestionRouter() if config.QUESTION_ROUTER else None
 
     # def __format_retrieval_results(self, retrieval_results) -> str:
     #     """将检索结果转化为RAG上下文字符串，优化大模型理解"""
@@ -63,6 +76,12 @@ class QuestionsProcessor:
 
     def __format_retrieval_results(self, retrieval_results) -> str:
         """将检索结果转化为RAG上下文字符串，优化大模型理解"""
+        if self.context_packer is not None:
+            # 打包：合并相邻/重叠块、去重、填入 token 预算
+            packed_text, stats = self.context_packer.pack(retrieval_results)
+            log_packing(stats)
+            return packed_text
+
         context_parts = []
 
         # 遍历检索出的每一个块
@@ -96,14 +115,39 @@ class QuestionsProcessor:
         rag_text = "\n".join(context_parts)
         return rag_text
 
-    def process_single_question(self,question:str,kind:str) -> dict:
-        """单条问题推理，返回结构化答案"""
+    def process_single_question(self,question:str,kind:str=None) -> dict:
+        """
+        单条问题推理，返回结构化答案
+        :param kind: 问题类型，不指定时由问题路由判断（未启用路由时按 summary 处理）；问候和无关问题直接回复，不检索
+        """
         # retrieval=Hybridretrieval()
-        # retrieval=VectorRetriever(vector_index_path=self.vector_index_path,metadata_path=self.metadata_path)
+        # retrieval=VectorRetriever(vector_index_path=self.vector_index_path,vector_db_dir=self.vector_db_dir)
         print(f"{'=' * 20} 开始 RAG 流程 {'=' * 20}")
         print(f"用户问题: {question}\n")
-        retrieval=HybridRetriever(vector_index_path=self.vector_index_path,metadata_path=self.metadata_path)
-        relevant_chunks = retrieval.hybrid_retriever_chunks(question=question,llm_reranking_sample_size=20)
+        if kind is None:
+            kind = self.question_router.route(question)["kind"] if self.question_router else "summary"
+            print(f"[问题路由] 问题类型: {kind}")
+        if kind in DIRECT_KINDS:
+            return {"final_answer": DIRECT_REPLIES[kind], "step_by_step_analysis": "",
+                    "reasoning_summary": "", "relevant_pages": []}
+        retrieval=HybridRetriever(vector_index_path=self.vector_index_path,vector_db_dir=self.vector_db_dir)
+
+        question_vector = None
+        cache_scope = f"{kind}:{self.answering_model}"
+        if self.answer_cache is not None:
+            self.answer_cache.set_version(
+                compute_index_version(retrieval.vector_retriever.chunk_store, self.vector_index_path))
+            question_vector = retrieval.vector_retriever.embedding_cache.embed(question)
+            cached = self.answer_cache.lookup(question_vector, question, scope=cache_scope)
+            if cached is not None:
+                print(f"[答案缓存] 命中相似问题「{cached['question']}」（相似度 {cached['similarity']:.3f}），跳过检索和生成")
+                return copy.deepcopy(cached["payload"]["answer"])
+
+        # 候选深度按问题类型缩放：事实类更浅、对比类更深
+        depth_scale = config.KIND_DEPTH_SCALES.get(kind, 1.0)
+        relevant_chunks = retrieval.hybrid_retriever_chunks(question=question,
+                                                            llm_reranking_sample_size=max(1, round(20 * depth_scale)),
+                                                            top_n=max(1, round(8 * depth_scale)))
 
         rag_context = self.__format_retrieval_results(relevant_chunks)
         print(rag_context)
@@ -117,4 +161,7 @@ class QuestionsProcessor:
         )
         t1 = time.time()
         print(f"  -> 模型调用【耗时： {t1-t0:.2f} 秒】")
+        # 超时的兜底答案不缓存
+        if question_vector is not None and answer_dict.get("final_answer") != TIMEOUT_FINAL_ANSWER:
+            self.answer_cache.add(question_vector, question, {"answer": copy.deepcopy(answer_dict)}, scope=cache_scope)
         return answer_dict
@@ -0,0 +1,56 @@
+"""
+rate_limit - 令牌桶限流，按请求数/秒和token数/分钟双重限制，进程内所有在途请求共享
+
+Author: lsy
+Date: 2026/10/18
+"""
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    线程安全的令牌桶：每秒补充 rate 个令牌，最多累积 capacity 个
+    采用预约方式扣减（余额可以为负），先到的调用先拿到令牌，后到的依次顺延等待
+    """
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float = 1) -> float:
+        """预约 amount 个令牌，返回需要等待的秒数；rate<=0 表示不限流"""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= amount
+            return max(0.0, -self._tokens / self.rate)
+
+    def acquire(self, amount: float = 1) -> float:
+        """阻塞直到拿到令牌，返回实际等待的秒数"""
+        wait = self.reserve(amount)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class RateLimiter:
+    def __init__(self, requests_per_second: float, tokens_per_minute: float):
+        """
+        :param requests_per_second: 每秒最多发起的调用数（QPS），<=0 不限制
+        :param tokens_per_minute: 每分钟最多消耗的token数（TPM），<=0 不限制
+        """
+        self.request_bucket = TokenBucket(requests_per_second, capacity=max(1.0, requests_per_second))
+        self.token_bucket = TokenBucket(tokens_per_minute / 60, capacity=tokens_per_minute)
+
+    def acquire(self, tokens: int = 0) -> float:
+        """为一次调用申请配额（1个请求 + tokens个token），返回等待的秒数"""
+        wait = max(self.request_bucket.reserve(1), self.token_bucket.reserve(tokens))
+        if wait > 0:
+            time.sleep(wait)
+        return wait
@@ -0,0 +1,133 @@
+"""
+registry - 进程级检索器注册表，服务启动时一次性加载索引，请求中只读共享
+
+Author: lsy
+Date: 2026/10/18
+"""
+import os
+import sys
+import time
+import hashlib
+from pathlib import Path
+
+import jieba
+
+import src.config as config
+from src.chunk_store import ChunkStore
+from src.retrieval import HybridRetriever, BM25Retriever, VectorRetriever
+from src.reranking import create_reranker
+
+
+def _current_rss_mb():
+    """当前进程常驻内存(MB)，取不到时返回 None"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    # 非 Linux 平台退化为峰值内存，macOS 单位为字节，其余为 KB
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss / 1024 / 1024 if sys.platform == 'darwin' else max_rss / 1024
+
+
+def compute_index_version(chunk_store: ChunkStore, vector_index_path: Path) -> str:
+    """索引版本：分块语料指纹 + 向量索引文件大小和修改时间，任一索引重建后都会变化，用于缓存失效"""
+    stat = Path(vector_index_path).stat()
+    raw = f"{chunk_store.fingerprint}\0{stat.st_size}\0{stat.st_mtime_ns}"
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:16]
+
+
+class RetrieverRegistry:
+    def __init__(self, vector_index_path: Path, vector_db_dir: Path):
+        """
+        :param vector_index_path: FAISS向量索引文件路径
+        :param vector_db_dir: 向量库目录，包含入库时写入的 chunk_store/ 和 bm25_index/
+        """
+        self.vector_index_path = vector_index_path
+        self.vector_db_dir = vector_db_dir
+
+        self.chunk_store = None
+        self.vector_retriever = None
+        self.bm25_retriever = None
+        self.hybrid_retriever = None
+        self.reranker = None
+        self.load_stats = {}
+        self._index_version = ''
+
+    @property
+    def loaded(self) -> bool:
+        return self.hybrid_retriever is not None
+
+    @property
+    def index_version(self) -> str:
+        """
+        当前加载的索引版本，见 compute_index_version
+        加载时记录一次，磁盘上的索引重建但未重新加载时仍返回正在使用的版本，与重排缓存的版本一致
+        """
+        return self._index_version
+
+    def _timed_load(self, name, factory):
+        """加载单个组件并记录耗时和内存增量"""
+        rss_before = _current_rss_mb()
+        t0 = time.time()
+        component = factory()
+        t1 = time.time()
+        rss_after = _current_rss_mb()
+        self.load_stats[name] = {
+            "load_time_s": round(t1 - t0, 3),
+            "memory_mb": round(rss_after - rss_before, 1) if rss_before is not None else None,
+        }
+        print(f"[Registry] {name} 加载完成，【耗时： {t1 - t0:.2f} 秒】")
+        return component
+
+    def load(self):
+        """加载全部检索组件，只需在进程启动时调用一次"""
+        if self.loaded:
+            return self
+
+        t0 = time.time()
+        # 分块存储只打开一份，向量检索和BM25检索共享
+        self.chunk_store = self._timed_load(
+            'chunk_store', lambda: ChunkStore.from_vector_db_dir(self.vector_db_dir))
+        self.vector_retriever = self._timed_load(
+            'vector', lambda: VectorRetriever(self.vector_index_path, self.vector_db_dir,
+                                              nprobe=config.VECTOR_NPROBE, ef_search=config.VECTOR_EF_SEARCH,
+                                              chunk_store=self.chunk_store))
+        # 向量索引读入内存后立即记录版本，之后不再读取磁盘文件状态
+        self._index_version = compute_index_version(self.chunk_store, self.vector_index_path)
+        self.bm25_retriever = self._timed_load(
+            'bm25', lambda: BM25Retriever(self.vector_db_dir, chunk_store=self.chunk_store))
+        # jieba 词典在第一次分词时才加载（约1秒），启动时预先加载，不计入首个请求的检索耗时
+        self._timed_load('jieba', jieba.initialize)
+        self.reranker = self._timed_load(
+            'reranker', lambda: create_reranker(config.RERANK_BACKEND, chunk_store=self.chunk_store,
+                                                index_version=self.index_version))
+        # 混合检索器直接复用上面的实例，不再重复加载索引
+        self.hybrid_retriever = HybridRetriever(
+            vector_index_path=self.vector_index_path,
+            vector_db_dir=self.vector_db_dir,
+            vector_retriever=self.vector_retriever,
+            bm25_retriever=self.bm25_retriever,
+            reranker=self.reranker,
+        )
+        t1 = time.time()
+        self.load_stats['total'] = {
+            "load_time_s": round(t1 - t0, 3),
+            "rss_mb": round(_current_rss_mb() or 0, 1),
+        }
+        print(f"[Registry] 检索器全部加载完成，【总耗时： {t1 - t0:.2f} 秒】")
+        return self
+
+    def stats(self) -> dict:
+        """加载耗时、内存占用和索引规模"""
+        stats = {"loaded": self.loaded, "load": self.load_stats}
+        if self.loaded:
+            stats["vector_count"] = int(self.vector_retriever._index.ntotal)
+            stats["vector_search_params"] = self.vector_retriever.search_params
+            stats["chunk_count"] = len(self.chunk_store)
+            stats["index_version"] = self.index_version
+        return stats
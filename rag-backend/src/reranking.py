@@ -7,12 +7,217 @@ Date: 2026/1/15
 import os
 import re
 import json
+import time
+import random
+import hashlib
+import threading
+import numpy as np
+import src.config as config
 import src.prompts as prompts
+from src.candidates import Candidates
+from src.cache import TieredCache, normalize_text
+from src.rate_limit import RateLimiter
+from src.hedging import LatencyTracker, DeadlineExceeded, call_all_with_deadline
+from src.token_utils import estimate_tokens, compact_html_table, truncate_to_tokens
 from concurrent.futures import ThreadPoolExecutor
 
-class LLMReranker:
-    def __init__(self):
+# 进程级共享的重排调度资源：所有在途请求的批次共用同一组线程池和限流器，整体不超过 DashScope 的 QPS/TPM 配额
+# 批次调用直接提交到调用线程池，对冲请求使用单独的线程池，每个在途批次最多占用两个线程（原请求 + 对冲）
+_rerank_executor = ThreadPoolExecutor(max_workers=config.RERANK_MAX_CONCURRENCY, thread_name_prefix='rerank')
+_hedge_executor = ThreadPoolExecutor(max_workers=config.RERANK_MAX_CONCURRENCY, thread_name_prefix='rerank-hedge')
+_rate_limiter = RateLimiter(config.RERANK_REQUESTS_PER_SECOND, config.RERANK_TOKENS_PER_MINUTE)
+
+def _create_score_cache() -> TieredCache:
+    """重排分数缓存：值为 (relevance_score, reasoning)，磁盘层以 json 存储"""
+    return TieredCache(
+        name='rerank_scores',
+        maxsize=config.RERANK_CACHE_SIZE,
+        ttl=config.RERANK_CACHE_TTL,
+        sqlite_path=config.RERANK_CACHE_PATH or None,
+        encode=lambda value: json.dumps(value, ensure_ascii=False).encode('utf-8'),
+        decode=lambda data: tuple(json.loads(data)),
+    )
+
+
+# 每个块预估的输出token数（block_idx + reasoning + relevance_score）
+OUTPUT_TOKENS_PER_BLOCK = 80
+# 每个块在提示词中的 json 结构开销（block_idx、content 键名和引号等）
+PROMPT_TOKENS_PER_BLOCK = 12
+
+
+def prepare_block_content(text: str, max_chunk_tokens: int) -> str:
+    """送给 LLM 打分的块正文：HTML 表格压缩为纯文本行，超长的截断到 max_chunk_tokens"""
+    return truncate_to_tokens(compact_html_table(text), max_chunk_tokens)
+
+
+def plan_rerank_batches(contents: dict, token_budget: int, max_batch_size: int = None):
+    """
+    按估算 token 数把待打分的块装箱成批次：先按 token 总量和块数上限算出最少批次数，
+    再从大到小把块放进当前最空的批次，使各批 token 数（即单次调用延迟）尽量均衡
+    :param contents: 候选集位置 -> 送给 LLM 的正文
+    :param token_budget: 每批块正文的 token 上限
+    :param max_batch_size: 每批最多块数，为空不限制
+    :return: (batches, batch_tokens)，batches 为每批的位置列表（批内按位置排序），batch_tokens 为每批估算的块 token 数
+    """
+    if not contents:
+        return [], []
+    sized = sorted(((estimate_tokens(content) + PROMPT_TOKENS_PER_BLOCK, position)
+                    for position, content in contents.items()), reverse=True)
+    total_tokens = sum(tokens for tokens, _ in sized)
+    n_batches = max(-(-total_tokens // token_budget), -(-len(sized) // max_batch_size) if max_batch_size else 1)
+    batches, batch_tokens = [[] for _ in range(n_batches)], [0] * n_batches
+    for tokens, position in sized:
+        open_batches = [i for i in range(len(batches))
+                        if batch_tokens[i] + tokens <= token_budget
+                        and (not max_batch_size or len(batches[i]) < max_batch_size)]
+        if open_batches:
+            i = min(open_batches, key=lambda j: batch_tokens[j])
+        elif not batches[-1]:
+            i = len(batches) - 1
+        else:
+            # 放不下时新开一批；单个块超出预算时独占一批（正文已按 max_chunk_tokens 截断）
+            batches.append([])
+            batch_tokens.append(0)
+            i = len(batches) - 1
+        batches[i].append(position)
+        batch_tokens[i] += tokens
+    # 预估的批次数可能多于实际需要（如单块独占），去掉空批
+    kept = [i for i in range(len(batches)) if batches[i]]
+    return [sorted(batches[i]) for i in kept], [batch_tokens[i] for i in kept]
+
+
+_RANKING_ITEM_PATTERN = re.compile(r'\{[^{}]*"block_idx"[^{}]*\}')
+
+
+def parse_rankings(content: str) -> list:
+    """
+    解析 LLM 返回的评分列表，容忍 markdown 代码块、前后多余文字和被截断的 json：
+    整体解析失败时逐个提取 {"block_idx": ..., "relevance_score": ...} 对象，只保留能解析的部分
+    """
+    content = (content or '').strip()
+    start, end = content.find('['), content.rfind(']')
+    if start != -1 and end > start:
+        try:
+            rankings = json.loads(content[start:end + 1])
+            if isinstance(rankings, list):
+                return [item for item in rankings if isinstance(item, dict)]
+        except json.JSONDecodeError:
+            pass
+    rankings = []
+    for match in _RANKING_ITEM_PATTERN.finditer(content):
+        try:
+            rankings.append(json.loads(match.group()))
+        except json.JSONDecodeError:
+            continue
+    if not rankings:
+        raise ValueError(f"无法解析重排结果: {content[:200]}")
+    return rankings
+
+
+# LLM 打分失败的块使用的中性分数，以及按融合排名逐位递减的步长
+FALLBACK_SCORE = 0.5
+FALLBACK_SCORE_STEP = 1e-4
+
+
+def fallback_scores(retrieved_chunks: Candidates) -> np.ndarray:
+    """
+    LLM 打分失败时的兜底相关性分数：固定的中性分 FALLBACK_SCORE，按融合分数（没有时取第一路检索分数）的排名
+    每名减去 FALLBACK_SCORE_STEP（最多减 100 名，分数不低于 0.49），使兜底块之间保持重排前的顺序
+    不做归一化：兜底块只排在 LLM 明确判为相关（> 0.5）的块之后、判为无关的块之前，不会压过真实评分
+    """
+    key = 'final_score' if 'final_score' in retrieved_chunks.scores else next(iter(retrieved_chunks.scores), None)
+    if key is None:
+        return np.full(len(retrieved_chunks), FALLBACK_SCORE)
+    values = retrieved_chunks.scores[key]
+    # 融合分数从高到低的排名，NaN 排最后；相同分数保持原有顺序
+    order = np.argsort(-np.where(np.isnan(values), -np.inf, values), kind='stable')
+    ranks = np.empty(len(values))
+    ranks[order] = np.arange(len(values))
+    return FALLBACK_SCORE - FALLBACK_SCORE_STEP * np.minimum(ranks, 100)
+
+
+class RerankThrottledError(RuntimeError):
+    """DashScope 返回限流（HTTP 429 / Throttling.*），可退避后重试"""
+
+
+class BaseReranker:
+    """
+    重排器接口：输入候选集，返回增加了 relevance_score 分数（0-1）和 reasoning 字段、
+    按相关性从高到低排序的候选集，main.rerank_chunks 和 HybridRetriever 只依赖这个接口
+    """
+    name = 'base'
+    label = ''
+
+    def rerank_chunks(self, question, retrieved_chunks: Candidates, top_n, rerank_batch_size=None,
+                      cascade=None) -> Candidates:
+        raise NotImplementedError
+
+    def metrics(self) -> dict:
+        return {}
+
+
+class LLMReranker(BaseReranker):
+    name = 'llm'
+    label = 'LLM'
+    model = "qwen-turbo"
+
+    def __init__(self, chunk_store=None, rate_limiter: RateLimiter = None, executor: ThreadPoolExecutor = None,
+                 hedge_executor: ThreadPoolExecutor = None,
+                 max_retries: int = None, backoff_seconds: float = None, cache: TieredCache = None,
+                 index_version: str = '', cascade: bool = None, accept_threshold: float = None,
+                 reject_threshold: float = None, batch_token_budget: int = None, max_chunk_tokens: int = None,
+                 call_timeout: float = None, deadline: float = None, hedge: bool = None):
+        """
+        :param chunk_store: 分块存储，重排时按块id读取正文
+        :param rate_limiter: 限流器，默认使用进程级共享实例
+        :param executor: 批次调用线程池，默认使用进程级共享实例
+        :param hedge_executor: 对冲请求线程池，默认使用进程级共享实例
+        :param max_retries: 被限流时的最大重试次数
+        :param backoff_seconds: 指数退避的初始等待秒数
+        :param cache: 重排分数缓存，默认按配置创建
+        :param index_version: 索引版本，索引重建后缓存自动失效
+        :param cascade: 级联模式，先用本地特征初筛，只把分数落在 (reject_threshold, accept_threshold) 之间的块送 LLM
+        :param accept_threshold: 初筛分数不低于该值直接通过，以初筛分数作为相关性分数
+        :param reject_threshold: 初筛分数不高于该值直接淘汰（排在末尾），不再调用 LLM
+        :param batch_token_budget: 每次调用的输入 token 预算（含系统提示词和问题），按预算装箱批次
+        :param max_chunk_tokens: 单个块送给 LLM 的最大 token 数，超出截断，表格先压缩为纯文本
+        :param call_timeout: 单次 LLM 调用的 HTTP 超时秒数
+        :param deadline: 整个重排阶段的截止秒数（含限流等待和重试），到期未完成的批次按融合分数兜底
+        :param hedge: 调用超过历史 p95 延迟仍未返回时是否补发对冲请求
+        """
+        self.chunk_store = chunk_store
         self.system_prompt_rerank_multiple_blocks = prompts.RerankingPrompt.system_prompt_rerank_multiple_blocks
+        self.rate_limiter = rate_limiter or _rate_limiter
+        self.executor = executor or _rerank_executor
+        self.hedge_executor = hedge_executor or _hedge_executor
+        self.max_retries = config.RERANK_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff_seconds = config.RERANK_BACKOFF_SECONDS if backoff_seconds is None else backoff_seconds
+        self.batch_token_budget = config.RERANK_BATCH_TOKEN_BUDGET if batch_token_budget is None else batch_token_budget
+        self.max_chunk_tokens = config.RERANK_MAX_CHUNK_TOKENS if max_chunk_tokens is None else max_chunk_tokens
+        self.call_timeout = config.RERANK_CALL_TIMEOUT if call_timeout is None else call_timeout
+        self.deadline = config.RERANK_DEADLINE if deadline is None else deadline
+        self.hedge = config.RERANK_HEDGE if hedge is None else hedge
+        self.latency = LatencyTracker('rerank')
+        self.cache = cache or _create_score_cache()
+        self.cache.set_version(index_version)
+        # 模型、提示词和截断长度变化后，旧的打分不再复用
+        self.prompt_version = hashlib.sha1(
+            f"{self.model}\0{self.system_prompt_rerank_multiple_blocks}\0{self.max_chunk_tokens}".encode('utf-8')
+        ).hexdigest()[:12]
+
+        self.cascade = config.RERANK_CASCADE if cascade is None else cascade
+        self.accept_threshold = config.RERANK_CASCADE_ACCEPT if accept_threshold is None else accept_threshold
+        self.reject_threshold = config.RERANK_CASCADE_REJECT if reject_threshold is None else reject_threshold
+        # 级联初筛使用本地特征打分（local_reranking 依赖本模块，延迟导入）
+        from src.local_reranking import FeatureReranker
+        self.first_stage = FeatureReranker(chunk_store=chunk_store)
+
+        # 累计调度指标，多个请求线程同时更新
+        self._metrics_lock = threading.Lock()
+        self._metrics = {"batches": 0, "retries": 0, "throttled": 0, "failed": 0,
+                         "latency_s_total": 0.0, "latency_s_max": 0.0, "rate_limit_wait_s_total": 0.0,
+                         "cascade_accepted": 0, "cascade_rejected": 0, "llm_calls_saved": 0,
+                         "planned_tokens": 0, "truncated_chunks": 0, "fallback_chunks": 0}
 
         import dashscope
         dashscope.api_key=os.getenv("DASHSCOPE_API_KEY")
@@ -29,6 +234,10 @@ class LLMReranker:
         Returns:
             list: [{'block_id': int, 'relevance_score': float}, ...]
         """
+        return self._call_with_retries(*self._build_messages(question, blocks_data))
+
+    def _build_messages(self, question, blocks_data):
+        """构造一批块的打分请求，返回 (messages, 预估 token 数)"""
         blocks_json_str = json.dumps(blocks_data, ensure_ascii=False)
 
         user_prompt = (
@@ -41,90 +250,251 @@ class LLMReranker:
             {"role": "system", "content": self.system_prompt_rerank_multiple_blocks},
             {"role": "user", "content": user_prompt},
         ]
+        estimated_tokens = (estimate_tokens(self.system_prompt_rerank_multiple_blocks) + estimate_tokens(user_prompt)
+                            + OUTPUT_TOKENS_PER_BLOCK * len(blocks_data))
+        return messages, estimated_tokens
+
+    def _call_with_retries(self, messages, estimated_tokens, max_retries: int = None):
+        """
+        在调用线程中执行一批打分：每次调用（含重试）都先向共享限流器申请配额，被限流时指数退避重试
+        :param max_retries: 最大重试次数，默认按实例配置；对冲请求只调用一次
+        """
+        max_retries = self.max_retries if max_retries is None else max_retries
+        for attempt in range(max_retries + 1):
+            self._record(rate_limit_wait_s_total=self.rate_limiter.acquire(estimated_tokens))
+            try:
+                return self._call_llm(messages)
+            except RerankThrottledError:
+                self._record(throttled=1)
+                if attempt == max_retries:
+                    raise
+                # 指数退避 + 随机抖动，避免多个批次同时重试
+                delay = self.backoff_seconds * (2 ** attempt) * (1 + random.random())
+                self._record(retries=1)
+                print(f"  -> 重排请求被限流，{delay:.2f} 秒后第 {attempt + 1} 次重试")
+                time.sleep(delay)
 
-        # 调用 LLM
+    def _call_llm(self, messages):
+        """调用一次 LLM 并解析评分结果"""
         rsp = self.llm.Generation.call(
-            model="qwen-turbo",
+            model=self.model,
             messages=messages,
             temperature=0,
-            result_format='message'
+            result_format='message',
+            request_timeout=self.call_timeout,
         )
 
+        status_code = rsp.get('status_code', 200)
+        if status_code == 429 or str(rsp.get('code') or '').startswith('Throttling'):
+            raise RerankThrottledError(f"DashScope限流: {rsp.get('code')} {rsp.get('message')}")
+
         # 检查返回格式
-        if 'output' in rsp and 'choices' in rsp['output']:
-            content = rsp['output']['choices'][0]['message']['content']
-            # 解析并返回结构化结果
-            return json.loads(content)
+        output = rsp.get('output') or {}
+        if 'choices' in output:
+            content = output['choices'][0]['message']['content']
+            # 解析并返回结构化结果（容忍格式不规范的 json）
+            return parse_rankings(content)
         else:
             raise RuntimeError(f"DashScope返回格式异常: {rsp}")
 
-    def rerank_chunks(self, question, retrieved_chunks, top_n, rerank_batch_size):
+    def _record(self, **increments):
+        with self._metrics_lock:
+            for key, value in increments.items():
+                self._metrics[key] += value
+
+    def metrics(self) -> dict:
+        """重排调度的累计指标：批次数、重试/限流次数、批次平均/最大延迟、限流等待时间"""
+        with self._metrics_lock:
+            metrics = dict(self._metrics)
+        metrics["latency_s_avg"] = metrics["latency_s_total"] / metrics["batches"] if metrics["batches"] else 0.0
+        metrics = {key: round(value, 4) if isinstance(value, float) else value for key, value in metrics.items()}
+        metrics["cache"] = self.cache.stats()
+        metrics["calls"] = self.latency.stats()
+        return metrics
+
+    def _cache_key(self, normalized_question: str, chunk_id: int, text: str) -> str:
+        """缓存键：归一化问题 + 块id + 块内容哈希 + 模型/提示词版本"""
+        content_hash = hashlib.sha1(text.encode('utf-8')).hexdigest()
+        raw = f"{self.prompt_version}\0{normalized_question}\0{chunk_id}\0{content_hash}"
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def _plan_batches(self, question, contents: dict, max_batch_size: int = None):
+        """
+        在扣除系统提示词和问题的开销后，按 token 预算规划批次；
+        输出长度随块数线性增长，每批块数同时受 RERANK_MAX_BATCH_SIZE 限制，保留批次间的并发
+        """
+        overhead = estimate_tokens(self.system_prompt_rerank_multiple_blocks) + estimate_tokens(question) + 50
+        block_budget = max(self.batch_token_budget - overhead, self.max_chunk_tokens + PROMPT_TOKENS_PER_BLOCK)
+        return plan_rerank_batches(contents, block_budget, max_batch_size or config.RERANK_MAX_BATCH_SIZE)
+
+    def rerank_chunks(self, question, retrieved_chunks: Candidates, top_n, rerank_batch_size=None,
+                      cascade=None) -> Candidates:
         """
-        使用多线程并行方式对多个文档进行重排。
+        使用多线程并行方式对多个文档进行重排，批次调用直接在进程级共享线程池中并发执行，
+        每次调用前经过共享限流器，被限流时退避重试。
+        已缓存的 (问题, 块) 直接复用分数，只有未命中的块发给 LLM。
+        级联模式下未命中的块先经本地特征初筛，只有不确定的中间段发给 LLM。
+        批次按估算 token 数装箱（每次调用不超过 batch_token_budget），而不是固定块数。
+        批次超过历史 p95 延迟仍未返回时对冲；失败、超时或未返回评分的块按融合分数兜底，不中断整个重排。
 
         Args:
             question (str): 查询语句
-            retrieved_chunks (list): 待重排的文档列表，每个元素是 {'text': str, 'final_score': float}
+            retrieved_chunks (Candidates): 待重排的候选块（块id + 各阶段分数），正文按需从分块存储读取
             top_n (int): 重排后返回的块个数
-            rerank_batch_size (int): 每批处理的块数量
+            rerank_batch_size (int): 每批最多的块数量，为空时只按 token 预算装箱
+            cascade (bool): 本次调用是否使用级联模式，为空时按实例配置（如 balanced 档位的请求单独开启）
 
         Returns:
-            list: 重排后的块列表，按相关性分数从高到低排序
+            Candidates: 重排后的候选块，增加 relevance_score 分数和 reasoning 字段，按相关性分数从高到低排序
         """
-        if not retrieved_chunks:
-            return []
-
-        # 按批次分组
-        chunk_batches = [retrieved_chunks[i:i+rerank_batch_size]
-                        for i in range(0, len(retrieved_chunks), rerank_batch_size)]
-        batch_counter = [0]
-
-        # 处理每一批
-        def process_chunk(batch):
-            batch_counter[0] += 1
-            current_batch = batch_counter[0]
-            total_batches = len(chunk_batches)
-            print(f"  -> 正在处理批次 {current_batch}/{total_batches} (包含 {len(batch)} 个块)...")
-
-            blocks_data = []
-            for i, chunk in enumerate(batch):
-                # 建议截断文本，防止超出模型单字段长度限制
-                blocks_data.append({
-                    "block_idx": i,
-                    "content": chunk['text']
-                })
-            # 调用 LLM 获取评分
-            rankings = self.get_rank_for_multiple_blocks(question, blocks_data)
-            # 将评分结果关联到原始 chunks
+        if not len(retrieved_chunks):
+            return Candidates.empty()
+
+        # 先查缓存，命中的块不再调用 LLM
+        texts = [self.chunk_store.text(chunk_id) for chunk_id in retrieved_chunks.ids.tolist()]
+        normalized_question = normalize_text(question)
+        cache_keys = [self._cache_key(normalized_question, chunk_id, text)
+                      for chunk_id, text in zip(retrieved_chunks.ids.tolist(), texts)]
+        cached = self.cache.get_many(cache_keys)
+        miss_positions = [i for i, key in enumerate(cache_keys) if key not in cached]
+        if cached:
+            print(f"  -> 重排缓存命中 {len(retrieved_chunks) - len(miss_positions)}/{len(retrieved_chunks)} 个块")
+
+        # 送给 LLM 的正文：表格压缩、超长截断
+        contents = {position: prepare_block_content(texts[position], self.max_chunk_tokens)
+                    for position in miss_positions}
+
+        # 级联初筛：在全部候选上计算本地特征分（保证归一化范围一致），高置信度的直接通过/淘汰
+        first_stage_scores = {}
+        cascade = self.cascade if cascade is None else cascade
+        if cascade and miss_positions:
+            scores, _ = self.first_stage.score(question, retrieved_chunks)
+            uncertain = []
+            for position in miss_positions:
+                if self.reject_threshold < scores[position] < self.accept_threshold:
+                    uncertain.append(position)
+                else:
+                    first_stage_scores[position] = float(scores[position])
+            accepted = sum(score >= self.accept_threshold for score in first_stage_scores.values())
+            rejected = len(first_stage_scores) - accepted
+            calls_saved = (len(self._plan_batches(question, contents, rerank_batch_size)[0])
+                           - len(self._plan_batches(question, {p: contents[p] for p in uncertain}, rerank_batch_size)[0]))
+            self._record(cascade_accepted=accepted, cascade_rejected=rejected, llm_calls_saved=calls_saved)
+            print(f"  -> 级联初筛：直接通过 {accepted} 个，直接淘汰 {rejected} 个，送 LLM {len(uncertain)} 个，"
+                  f"节省 {calls_saved} 次 LLM 调用")
+            miss_positions = uncertain
+
+        # 按 token 预算规划批次（每批是候选集中的位置下标）
+        chunk_batches, batch_tokens = self._plan_batches(
+            question, {position: contents[position] for position in miss_positions}, rerank_batch_size)
+        total_batches = len(chunk_batches)
+        if chunk_batches:
+            original_tokens = sum(estimate_tokens(texts[position]) for position in miss_positions)
+            truncated = sum(contents[position] != texts[position] for position in miss_positions)
+            self._record(planned_tokens=sum(batch_tokens), truncated_chunks=truncated)
+            print(f"  -> 批次规划：{len(miss_positions)} 个块分为 {total_batches} 批，块正文预估 {sum(batch_tokens)} tokens"
+                  f"（每批 {min(batch_tokens)}~{max(batch_tokens)}），压缩/截断 {truncated} 个块，"
+                  f"节省 {original_tokens - sum(batch_tokens) + PROMPT_TOKENS_PER_BLOCK * len(miss_positions)} tokens")
+        # 批次调用直接提交到共享的调用线程池（本线程只负责等待和补发对冲请求），
+        # 并发度和 QPS/TPM 由进程级配置统一控制；整个重排阶段的截止时间到期仍未完成的批次不再等待
+        requests = [self._build_messages(question, [{"block_idx": i, "content": contents[position]}
+                                                    for i, position in enumerate(batch)])
+                    for batch in chunk_batches]
+        for number, batch in enumerate(chunk_batches, 1):
+            print(f"  -> 正在处理批次 {number}/{total_batches} (包含 {len(batch)} 个块)...")
+        def score_batch(request, max_retries=None):
+            # 返回完成时刻，批次延迟从提交时算起（含排队和限流等待）
+            return self._call_with_retries(*request, max_retries=max_retries), time.time()
+
+        t0 = time.time()
+        outcomes = call_all_with_deadline(
+            [lambda request=request: score_batch(request) for request in requests],
+            self.deadline, tracker=self.latency, hedge=self.hedge,
+            hedge_fns=[lambda request=request: score_batch(request, max_retries=0) for request in requests],
+            executor=self.executor, hedge_executor=self.hedge_executor)
+
+        batch_results, failures = [], {}
+        for number, (batch, outcome) in enumerate(zip(chunk_batches, outcomes), 1):
+            if isinstance(outcome, Exception):
+                self._record(failed=1)
+                print(f"  -> 批次 {number}/{total_batches} 打分失败: {outcome!r}")
+                if isinstance(outcome, DeadlineExceeded):
+                    reason = f"超过 {self.deadline:.0f} 秒未返回"
+                else:
+                    reason = f"{type(outcome).__name__}"
+                failures.update((position, reason) for position in batch)
+                continue
+            rankings, finished_at = outcome
+            latency = finished_at - t0
+            with self._metrics_lock:
+                self._metrics["batches"] += 1
+                self._metrics["latency_s_total"] += latency
+                self._metrics["latency_s_max"] = max(self._metrics["latency_s_max"], latency)
+            print(f"  -> 批次 {number}/{total_batches} 完成，【耗时： {latency:.2f} 秒】")
+            # 将评分结果关联回候选集中的位置
             results = []
             for rank_item in rankings:
-                block_idx = rank_item['block_idx']
-                results.append({
-                    "text":batch[block_idx]['text'],
-                    "file_origin":batch[block_idx]['file_origin'],
-                    "vector_score":batch[block_idx]['vector_score'],
-                    "bm25_score":batch[block_idx].get('bm25_score'), # 存在问题
-                    "final_score":batch[block_idx]['final_score'],
-                    "page_range":batch[block_idx]['page_range'],
-                    "relevance_score": rank_item['relevance_score'],
-                    "reasoning": rank_item['reasoning'],
-                })
-
-            return results
-
-        # 使用多线程处理（max_workers=1 串行调用，避免 QPS 超限）
-        with ThreadPoolExecutor(max_workers=1) as executor:
-            batch_results = list(executor.map(process_chunk, chunk_batches))
-
-        # 扁平化所有批次的结果
-        all_results = []
+                block_idx = rank_item.get('block_idx')
+                relevance_score = rank_item.get('relevance_score')
+                if not isinstance(block_idx, int) or not 0 <= block_idx < len(batch):
+                    continue
+                if not isinstance(relevance_score, (int, float)):
+                    continue
+                results.append((batch[block_idx], float(relevance_score), str(rank_item.get('reasoning', ''))))
+            batch_results.append(results)
+
+        # 汇总缓存命中、级联初筛和所有批次的评分
+        relevance_scores = np.full(len(retrieved_chunks), np.nan)
+        reasonings = [''] * len(retrieved_chunks)
+        for position, key in enumerate(cache_keys):
+            if key in cached:
+                relevance_scores[position], reasonings[position] = cached[key]
+        for position, score in first_stage_scores.items():
+            # 初筛分数不是 LLM 打分，不写入缓存
+            relevance_scores[position] = round(score, 4)
+            verdict = '直接通过' if score >= self.accept_threshold else '直接淘汰'
+            reasonings[position] = f"级联初筛{verdict}（本地特征分 {score:.2f}），未调用LLM"
+        new_scores = {}
         for batch in batch_results:
-            all_results.extend(batch)
+            for position, relevance_score, reasoning in batch:
+                relevance_scores[position] = relevance_score
+                reasonings[position] = reasoning
+                new_scores[cache_keys[position]] = (relevance_score, reasoning)
+        self.cache.set_many(new_scores)
+
+        # 兜底：失败/超时批次中的块，以及 LLM 漏评的块，按融合分数排序（不写入缓存）
+        for position in miss_positions:
+            if np.isnan(relevance_scores[position]) and position not in failures:
+                failures[position] = "LLM未返回该块评分"
+        if failures:
+            fallback = fallback_scores(retrieved_chunks)
+            for position, reason in failures.items():
+                relevance_scores[position] = round(float(fallback[position]), 4)
+                reasonings[position] = f"LLM打分失败（{reason}），使用中性分数并按融合分数排序"
+            self._record(fallback_chunks=len(failures))
+            print(f"  -> {len(failures)} 个块未获得 LLM 评分，按融合分数兜底")
+        ranked = np.flatnonzero(~np.isnan(relevance_scores))
+
+        reranked = retrieved_chunks.take(ranked)
+        reranked.scores['relevance_score'] = relevance_scores[ranked]
+        reranked.extras['reasoning'] = [reasonings[i] for i in ranked]
+
+        # 按 relevance_score 从高到低排序，返回 top_n 个结果
+        return reranked.sort_by('relevance_score', top_n=top_n)
+
+
+RERANKER_BACKENDS = ("llm", "feature")
 
-        # 按 relevance_score 从高到低排序
-        if all_results:
-            all_results.sort(key=lambda x: x['relevance_score'], reverse=True)
 
-        # 返回 top_n 个结果
-        return all_results[:top_n]
-        print(all_results)
+def create_reranker(backend: str = None, chunk_store=None, index_version: str = '') -> BaseReranker:
+    """
+    按配置创建重排器
+    :param backend: llm 远程大模型打分 / feature 本地CPU特征打分，默认读取 config.RERANK_BACKEND
+    """
+    backend = backend or config.RERANK_BACKEND
+    if backend == "llm":
+        return LLMReranker(chunk_store=chunk_store, index_version=index_version)
+    if backend == "feature":
+        from src.local_reranking import FeatureReranker
+        return FeatureReranker(chunk_store=chunk_store)
+    raise ValueError(f"不支持的重排后端: {backend}，可选: {RERANKER_BACKENDS}")
@@ -6,6 +6,7 @@ Date: 2026/1/7
 """
 import os
 import time
+import asyncio
 from typing import List,Dict
 from pathlib import Path
 import json
@@ -13,34 +14,45 @@ import faiss
 import dashscope
 import numpy as np
 import glob
-from rank_bm25 import BM25Okapi
-import jieba
-from src.reranking import LLMReranker
+from src.ingestion import set_search_params
+from src.bm25_index import BM25Index, tokenize
+from src.chunk_store import ChunkStore
+from src.candidates import Candidates
+from src.fusion import fuse
+from src.embedding_cache import EmbeddingCache, get_embedding_cache
+from src.reranking import BaseReranker, create_reranker
 
 class BM25Retriever:
-    def __init__(self, metadata_path: Path):
+    def __init__(self, vector_db_dir: Path, bm25_index_dir: Path = None, chunk_store: ChunkStore = None):
         """
         初始化 BM25 检索器
-        :param metadata_path: 存放分块 json 文件的目录路径
+        :param vector_db_dir: 向量库目录，包含入库时写入的 chunk_store/ 和 bm25_index/
+        :param bm25_index_dir: 入库时生成的BM25索引目录，默认为向量库目录下的 bm25_index
+        :param chunk_store: 可传入已打开的分块存储，与向量检索器共享
         """
-        self.documents = []
-        self.corpus_tokens = []
+        self.chunk_store = chunk_store
         self.bm25 = None
+        self.bm25_index_dir = bm25_index_dir or Path(vector_db_dir) / 'bm25_index'
 
-        print(f"[BM25] 正在从 {metadata_path} 加载文档并构建索引...")
-        self._load_and_index(metadata_path)
+        print(f"[BM25] 正在从 {vector_db_dir} 加载分块和索引...")
+        self._load_and_index(vector_db_dir)
 
-    def _load_and_index(self, metadata_path:Path):
-        with open(metadata_path,'r',encoding='utf-8') as f:
-            chunks = json.load(f)
-            for chunk in chunks:
-                self.documents.append(chunk)
+    def _load_and_index(self, vector_db_dir:Path):
+        if self.chunk_store is None:
+            self.chunk_store = ChunkStore.from_vector_db_dir(vector_db_dir)
 
-        # 2. 分词 - 使用jieba将中文文本切成词语列表（构建索引的关键）
-        self.corpus_tokens = [list(jieba.cut(doc['text'])) for doc in self.documents]
+        fingerprint = self.chunk_store.fingerprint
+        # 1. 优先加载入库时预先构建好的索引（内存映射，毫秒级）
+        if (self.bm25_index_dir / 'meta.json').exists():
+            bm25 = BM25Index.load(self.bm25_index_dir)
+            if bm25.n_docs == len(self.chunk_store) and bm25.fingerprint == fingerprint:
+                self.bm25 = bm25
+                return
+            print(f"[BM25] 索引 {self.bm25_index_dir} 与分块存储不一致，改为现场构建，请重新运行入库")
 
-        # 3. 初始化 BM25 模型
-        self.bm25 = BM25Okapi(self.corpus_tokens)
+        # 2. 没有可用索引时，现场分词构建（耗时与语料规模线性相关）
+        corpus_tokens = [tokenize(text) for text in self.chunk_store.texts()]
+        self.bm25 = BM25Index.build(corpus_tokens, fingerprint=fingerprint)
 
     @staticmethod
     def normalize_scores(scores):
@@ -55,42 +67,50 @@ class BM25Retriever:
 
         return (scores - min_score) / (max_score - min_score)
 
+    def search(self, question:str, top_n:int=20) -> Candidates:
+        """检索相关块，只返回块id和归一化后的BM25分数"""
+        question_tokens = tokenize(question) # 问题分词
+        # 只对命中问题词项的文档打分，归一化后部分排序取前k个
+        top_n_indices, normalized_scores = self.bm25.top_k(question_tokens, top_n)
+        # BM25分数越大越好
+        return Candidates(top_n_indices, {"bm25_score": normalized_scores})
+
     def retrieve(self, question:str,top_n:int=20):
-        """检索相关文档"""
-        question_tokens = list(jieba.cut(question)) # 问题分词
-        raw_scores = self.bm25.get_scores(question_tokens) # 获取文档得分（返回的是文档在列表中的索引）
-        normalized_scores = self.normalize_scores(raw_scores) # 归一化
-        top_n_indices = normalized_scores.argsort()[-top_n:][::-1] # 倒序取前k个
-        # 组装结果
-        results = []
-        for index in top_n_indices:
-            doc = self.documents[index].copy()
-            # 将BM25分数添加到文档中（分数越大越好）
-            doc['bm25_score'] = float(normalized_scores[index])
-            results.append(doc)
-        return results
+        """检索相关文档，返回包含正文的完整结果"""
+        return self.search(question, top_n).materialize(self.chunk_store)
 
 class VectorRetriever:
-    def __init__(self,vector_index_path:Path, metadata_path:Path,embedding_provider:str="dashscope"):
+    def __init__(self,vector_index_path:Path, vector_db_dir:Path,embedding_provider:str="dashscope",
+                 nprobe:int=None, ef_search:int=None, chunk_store:ChunkStore=None, mmap:bool=True,
+                 embedding_cache:EmbeddingCache=None):
         """
         :param vector_index_path: FAISS向量索引文件路径
-        :param metadata_path: 文档元数据文件路径
+        :param vector_db_dir: 向量库目录，分块存储在其下的 chunk_store/
+        :param nprobe/ef_search: 覆盖索引文件中保存的检索参数（IVF/HNSW），为 None 时沿用构建时的设置
+        :param chunk_store: 可传入已打开的分块存储，与BM25检索器共享
+        :param mmap: 是否以内存映射方式加载FAISS索引，启动耗时与索引大小无关，多进程共享页缓存
+        :param embedding_cache: 问题向量缓存，默认使用进程级共享的缓存（text-embedding-v1）
         """
         self.vector_index_path=vector_index_path
-        self.metadata_path=metadata_path
+        self.vector_db_dir=vector_db_dir
         self.embedding_provider=embedding_provider
+        self.nprobe=nprobe
+        self.ef_search=ef_search
+        self.search_params={}
+        self.mmap=mmap
         self._set_up_llm() # 设置大模型提供商
+        self.embedding_cache = embedding_cache or get_embedding_cache('text-embedding-v1')
 
         # 定义实例变量但不赋值，用于后续缓存
         self._index = None
-        self._metadata_list = None
+        self._chunk_store = chunk_store
         self.load()
 
     def load(self):
         """显式加载资源，也可以在首次搜索时自动触发"""
         if self._index is None:
             self._load_index()
-        if self._metadata_list is None:
+        if self._chunk_store is None:
             self._load_metadata()
         return self
 
@@ -100,111 +120,92 @@ class VectorRetriever:
             raise FileNotFoundError(f"向量索引文件不存在: {self.vector_index_path}")
 
         # faiss.read_index 是读取磁盘上预训练好的索引的标准方法
-        self._index = faiss.read_index(str(self.vector_index_path))
+        # 内存映射模式下向量数据不拷贝进进程内存，按需从页缓存读取（索引只读）
+        io_flags = getattr(faiss, 'IO_FLAG_MMAP_IFC', faiss.IO_FLAG_MMAP) if self.mmap else 0
+        self._index = faiss.read_index(str(self.vector_index_path), io_flags)
+        # nprobe/efSearch 随索引一起保存，这里读出（或按需覆盖）实际生效的检索参数
+        self.search_params = set_search_params(self._index, nprobe=self.nprobe, ef_search=self.ef_search)
+        if self.search_params:
+            print(f"[VectorRetriever] 索引类型 {type(faiss.downcast_index(self._index)).__name__}，检索参数 {self.search_params}")
 
     def _load_metadata(self):
-        """
-        加载元数据
-        假设元数据是用 pickle 存储的 List[Dict] 或 DataFrame
-        """
-        if not self.metadata_path.exists():
-            raise FileNotFoundError(f"元数据文件不存在: {self.metadata_path}")
-
-        with open(self.metadata_path, 'rb') as f:
-            self._metadata_list = json.load(f)
+        """加载分块存储"""
+        self._chunk_store = ChunkStore.from_vector_db_dir(self.vector_db_dir)
 
     def _set_up_llm(self):
         if self.embedding_provider=="dashscope":
             dashscope.api_key=os.getenv('DASHSCOPE_API_KEY')
 
-    def _get_embedding(self,text:str):
-        resp = dashscope.TextEmbedding.call(
-            model='text-embedding-v1',
-            input=[text],
-        )
-        embedding = resp.output['embeddings'][0]['embedding']  # List[float]
-        vec = np.array(embedding, dtype='float32')
-        # L2 归一化
-        # 这一步让向量长度变为 1，以便与库里同样归一化的向量进行余弦相似度计算
-        norm = np.linalg.norm(vec)
-        if norm > 0:
-            vec = vec / norm
-        return vec
+    def _get_embedding(self,text:str) -> np.ndarray:
+        # 相同问题（归一化后）直接复用缓存的向量，返回 L2 归一化后的 float32 向量
+        return self.embedding_cache.embed(text)
 
-    def get_relevant_chunks(self, question:str, top_n:int = 20) -> List[Dict]:
-        # 检索出与问题相关的块，返回全部块
+    @property
+    def chunk_store(self) -> ChunkStore:
+        return self._chunk_store
 
+    def search(self, question:str, top_n:int = 20) -> Candidates:
+        """检索与问题相关的块，只返回块id和向量分数"""
         # 获取query的embedding，支持dashscope
         embedding_question = self._get_embedding(question)
-        # print(embedding_question,len(embedding_question),f'{question}的向量表表示')
+        return self._search_embedding(embedding_question, top_n)
+
+    async def asearch(self, question:str, top_n:int = 20, executor=None) -> Candidates:
+        """
+        异步检索：embedding 先查缓存，未命中时通过异步客户端（连接池）获取，不占用线程；FAISS 检索在 executor 中执行
+        """
+        embedding_question = await self.embedding_cache.aembed(question)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, self._search_embedding, embedding_question, top_n)
+
+    def _search_embedding(self, embedding_question:np.ndarray, top_n:int) -> Candidates:
         embedding_array = embedding_question.reshape(1, -1) # 变为二维
         k = min(top_n, self._index.ntotal)
-        # print(self._metadata_list,'元数据')
         distances, indices = self._index.search(x=embedding_array,k=k)
 
-        retrieval_results = []
-        # print('distances:',distances)
-        # print('indices:',indices)
-        for distance, index in zip(distances[0], indices[0]):
-            distance = float(distance)
-            chunk=self._metadata_list[index]
-
-            result = {
-                "vector_score": distance,
-                "page_range": chunk["page_range"],
-                "file_origin": chunk["file_origin"],
-                "text": chunk["text"],
-            }
-            retrieval_results.append(result)
-        return retrieval_results
+        # 近似索引（如IVF的nprobe较小时）可能凑不满k个结果，空位返回 -1
+        valid = indices[0] >= 0
+        return Candidates(indices[0][valid], {"vector_score": distances[0][valid]})
+
+    def get_relevant_chunks(self, question:str, top_n:int = 20) -> List[Dict]:
+        # 检索出与问题相关的块，返回包含正文的完整结果
+        return self.search(question, top_n).materialize(self._chunk_store)
 
 class HybridRetriever:
-    def __init__(self,vector_index_path:Path, metadata_path:Path):
-        self.vector_retriever = VectorRetriever(vector_index_path,metadata_path)
-        self.bm25_retriever = BM25Retriever(metadata_path)
-        self.reranker=LLMReranker()
+    def __init__(
+            self,
+            vector_index_path:Path,
+            vector_db_dir:Path,
+            vector_retriever:VectorRetriever=None,
+            bm25_retriever:BM25Retriever=None,
+            reranker:BaseReranker=None,
+    ):
+        """
+        :param vector_retriever/bm25_retriever/reranker: 可传入已加载好的实例（如注册表中的共享实例），避免重复加载索引
+        """
+        self.vector_retriever = vector_retriever or VectorRetriever(vector_index_path,vector_db_dir)
+        self.bm25_retriever = bm25_retriever or BM25Retriever(vector_db_dir)
+        # 未传入时按配置（RAG_RERANK_BACKEND）创建重排器
+        self.reranker = reranker or create_reranker(chunk_store=self.vector_retriever.chunk_store)
 
-    def _merge_hybrid_results(self,vector_results, bm25_results, x=0.6):
+    def _merge_hybrid_results(self,vector_results:Candidates, bm25_results:Candidates, x=0.6,
+                              method:str="weighted", policy:str="union", top_n:int=None) -> Candidates:
         """
-        融合向量检索和BM25检索的结果
+        融合向量检索和BM25检索的结果，以整数块id对齐
         :param vector_results: 向量检索的结果
         :param bm25_results: BM25检索的结果
         :param x: 向量占比的权重
-        :return: 融合后的结果
+        :param method/policy: 融合方式与候选保留策略，见 src.fusion
+        :param top_n: 融合后保留的候选数量
+        :return: 融合后的结果，按 final_score 从高到低排序
         """
-
-        bm25_by_id = {}
-        for res in bm25_results:
-            chunk_id = res['text'][:50]
-            bm25_by_id[chunk_id] = res
-
-        # 建立映射（用text内容作为id进行去重和叠加）
-        merged_map = {}
-
-        for i, res in enumerate(vector_results):
-            chunk_id = res['text'][:50]
-            vector_score = float(res.get('vector_score', 0.0))
-
-            bm25_res = bm25_by_id.get(chunk_id)
-            bm25_score = float(bm25_res.get('bm25_score')) if bm25_res and bm25_res.get(
-                'bm25_score') is not None else 0.0
-
-            # 基于向量结果为主构造条目
-            merged_item = dict(res)
-            if bm25_res is not None and bm25_res.get('bm25_score') is not None:
-                merged_item['bm25_score'] = bm25_res['bm25_score']
-
-            final_score = x * vector_score + (1-x) * bm25_score
-            merged_item['final_score'] = final_score
-
-            merged_map[chunk_id] = merged_item
-
-        final_list = [item for item in merged_map.values()]
-        # 把总分写回到字典里
-        for i, item in enumerate(merged_map.values()):
-            final_list[i]['final_score'] = item['final_score']
-        final_list.sort(key=lambda x: x['final_score'], reverse=True)
-        return final_list
+        return fuse(
+            {"vector_score": vector_results, "bm25_score": bm25_results},
+            method=method,
+            policy=policy,
+            weights={"vector_score": x, "bm25_score": 1 - x},
+            top_n=top_n,
+        )
 
     def __format_retrieval_results(self, retrieval_results) -> str:
         """将检索结果转化为RAG上下文字符串，优化大模型理解"""
@@ -244,7 +245,7 @@ class HybridRetriever:
             self,
             question:str,
             llm_reranking_sample_size:int=8,
-            rerank_batch_size:int=4,
+            rerank_batch_size:int=None,
             top_n:int=8,
             llm_weight:float=0.6,
     ) -> List[Dict]:
@@ -259,21 +260,20 @@ class HybridRetriever:
         """
         t0 = time.time()
         print(f"[阶段 1/3] 混合检索中...")
-        vector_results = self.vector_retriever.get_relevant_chunks(question,top_n=llm_reranking_sample_size)
+        vector_results = self.vector_retriever.search(question,top_n=llm_reranking_sample_size)
         print(f"  -> 向量检索到 {len(vector_results)} 个片段")
-        bm25_results = self.bm25_retriever.retrieve(question,top_n=llm_reranking_sample_size)
+        bm25_results = self.bm25_retriever.search(question,top_n=llm_reranking_sample_size)
         print(f"  -> BM25检索到 {len(bm25_results)} 个片段")
         x = llm_weight # (向量检索的占比)
-        hybrid_results = self._merge_hybrid_results(vector_results,bm25_results,x)
-        hybrid_results_format=self.__format_retrieval_results(hybrid_results)
-        # print(hybrid_results_format)
+        # 并集融合后可能多于单路候选数，截断以保持重排开销不变
+        hybrid_results = self._merge_hybrid_results(vector_results,bm25_results,x,top_n=llm_reranking_sample_size)
         print(f"  -> 融合合并出 {len(hybrid_results)} 个相关片段")
         t1 = time.time()
         print(f'[HybridRetriever] 混合检索完成，【耗时： {t1-t0:.2f} 秒】')
 
         t2 = time.time()
-        print(f"\n[阶段 2/3] LLM 重排中...")
-        print(f"  -> 准备对 {len(hybrid_results)} 个候选块进行重排，批次大小: {rerank_batch_size}")
+        print(f"\n[阶段 2/3] {self.reranker.label} 重排中...")
+        print(f"  -> 准备对 {len(hybrid_results)} 个候选块进行重排，批次大小: {rerank_batch_size or '按token预算'}")
         reranked_results=self.reranker.rerank_chunks(
             question=question,
             retrieved_chunks=hybrid_results,
@@ -282,7 +282,8 @@ class HybridRetriever:
         )
         t3 = time.time()
         print(f"  -> 重排完成，最终选取 Top {len(reranked_results)} 个块")
-        print(f'[rerank] LLM重排完成，【耗时： {t3 - t2:.2f} 秒】')
-        return reranked_results
+        print(f'[rerank] {self.reranker.label}重排完成，【耗时： {t3 - t2:.2f} 秒】')
+        # 只有最终选中的块才读取正文和元数据
+        return reranked_results.materialize(self.vector_retriever.chunk_store)
 
 
@@ -0,0 +1,126 @@
+"""
+single_flight - 在途请求合并：相同键的并发请求只执行一次，后到的请求先回放已产生的事件，再实时接收后续事件
+
+Author: lsy
+Date: 2026/10/18
+"""
+import asyncio
+from typing import AsyncIterator, Callable, Dict, Optional
+
+
+class _Flight:
+    """一次正在执行的流：已产生的事件、订阅者数量和执行任务"""
+    def __init__(self):
+        self.events = []
+        self.done = False
+        self.error = None
+        self.subscribers = 0
+        self.task = None
+        self.changed = asyncio.Event()
+
+    def notify(self):
+        # 唤醒当前所有等待者，之后的等待使用新的 Event
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+
+class Subscription:
+    """
+    一个请求对在途流的订阅：events() 回放已有事件并等待新事件
+    close() 可重复调用，events() 结束时自动调用；最后一个订阅者退出且流未结束时取消执行
+    """
+    def __init__(self, owner: 'SingleFlight', key: str, flight: _Flight, leader: bool):
+        self.owner = owner
+        self.key = key
+        self.flight = flight
+        self.leader = leader
+        self.closed = False
+        flight.subscribers += 1
+
+    @property
+    def task(self) -> asyncio.Task:
+        """执行流的后台任务，所有订阅者共享"""
+        return self.flight.task
+
+    async def events(self) -> AsyncIterator:
+        flight = self.flight
+        position = 0
+        try:
+            while True:
+                while position < len(flight.events):
+                    yield flight.events[position]
+                    position += 1
+                if flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                await flight.changed.wait()
+        finally:
+            self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        flight = self.flight
+        flight.subscribers -= 1
+        if flight.subscribers == 0 and not flight.done:
+            flight.task.cancel()
+            self.owner._discard(self.key, flight)
+
+
+class SingleFlight:
+    """
+    按键合并在途的异步事件流（只在同一个事件循环中使用）
+    - 第一个请求在后台任务中执行 factory() 产生的事件流，事件按顺序记录
+    - 执行期间相同键的请求订阅同一个流，先回放已有事件再等待新事件
+    - 流结束（或出错）后移除，之后的相同请求重新执行；所有订阅者都断开时取消执行
+    - join/subscribe 是同步调用，判断是否在途和登记订阅之间不会让出事件循环
+    """
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self._stats = {"leaders": 0, "followers": 0, "replayed_events": 0, "cancelled": 0}
+
+    async def _run(self, key: str, flight: _Flight, events: AsyncIterator):
+        try:
+            async for event in events:
+                flight.events.append(event)
+                flight.notify()
+        except asyncio.CancelledError:
+            self._stats["cancelled"] += 1
+            raise
+        except Exception as e:
+            flight.error = e
+        finally:
+            flight.done = True
+            flight.notify()
+            self._discard(key, flight)
+
+    def _discard(self, key: str, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def join(self, key: str) -> Optional[Subscription]:
+        """键对应的流正在执行时订阅它，否则返回 None"""
+        flight = self._flights.get(key)
+        if flight is None:
+            return None
+        self._stats["followers"] += 1
+        self._stats["replayed_events"] += len(flight.events)
+        return Subscription(self, key, flight, leader=False)
+
+    def subscribe(self, key: str, factory: Callable[[], AsyncIterator]) -> Subscription:
+        """订阅键对应的流，没有在途的流时用 factory() 创建并执行（subscription.leader 为 True）"""
+        subscription = self.join(key)
+        if subscription is not None:
+            return subscription
+        flight = _Flight()
+        self._flights[key] = flight
+        flight.task = asyncio.ensure_future(self._run(key, flight, factory()))
+        self._stats["leaders"] += 1
+        return Subscription(self, key, flight, leader=True)
+
+    def stats(self) -> dict:
+        stats = dict(self._stats)
+        stats["in_flight"] = len(self._flights)
+        return stats
@@ -0,0 +1,68 @@
+"""
+streaming - 流式答案的增量合并：按时间窗口或字符数把模型返回的多个增量合并成一次输出，减少 SSE 事件的序列化和写入次数
+
+Author: lsy
+Date: 2026/10/18
+"""
+import asyncio
+from typing import AsyncIterator
+
+import src.config as config
+
+
+async def coalesce_deltas(deltas: AsyncIterator[str], flush_ms: float = None,
+                          max_chars: int = None) -> AsyncIterator[str]:
+    """
+    合并流式增量文本
+    :param deltas: 模型返回的增量文本
+    :param flush_ms: 时间窗口毫秒数，缓冲区中最早的文本等待超过该时间即发送，<=0 时原样透传
+    :param max_chars: 缓冲字符数达到该值立即发送
+    """
+    flush_ms = config.STREAM_FLUSH_MS if flush_ms is None else flush_ms
+    max_chars = max_chars or config.STREAM_FLUSH_CHARS
+    iterator = deltas.__aiter__()
+    # 下一个增量的读取任务，等待超时后不取消，下一轮继续等待同一个任务
+    next_delta = None
+    try:
+        if flush_ms <= 0:
+            async for delta in iterator:
+                if delta:
+                    yield delta
+            return
+
+        loop = asyncio.get_running_loop()
+        buffer, buffered_at = [], None
+        size = 0
+        while True:
+            if next_delta is None:
+                next_delta = asyncio.ensure_future(iterator.__anext__())
+            timeout = None
+            if buffer:
+                timeout = max(0.0, buffered_at + flush_ms / 1000 - loop.time())
+            done, _ = await asyncio.wait({next_delta}, timeout=timeout)
+            if done:
+                task, next_delta = next_delta, None
+                try:
+                    delta = task.result()
+                except StopAsyncIteration:
+                    break
+                if delta:
+                    if not buffer:
+                        buffered_at = loop.time()
+                    buffer.append(delta)
+                    size += len(delta)
+            # 模型停顿时窗口到期也发送，不等下一个增量
+            if buffer and (size >= max_chars or loop.time() - buffered_at >= flush_ms / 1000):
+                yield ''.join(buffer)
+                buffer, size = [], 0
+        if buffer:
+            yield ''.join(buffer)
+    finally:
+        if next_delta is not None and not next_delta.done():
+            next_delta.cancel()
+            # 读取任务结束后上游生成器才能关闭
+            await asyncio.gather(next_delta, return_exceptions=True)
+        # 提前结束（客户端断开、下游报错）时关闭上游生成器，释放 HTTP 连接和生成并发名额
+        aclose = getattr(iterator, 'aclose', None)
+        if aclose is not None:
+            await aclose()
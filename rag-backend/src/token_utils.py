@@ -0,0 +1,51 @@
+"""
+token_utils - 文本token数估算，用于限流和提示词预算
+
+Author: lsy
+Date: 2026/10/18
+"""
+import re
+
+_CJK_PATTERN = re.compile(r'[　-〿一-鿿＀-￯]')
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估算 Qwen 系列模型的 token 数：中文字符及全角标点约 1 个字符 1 个 token，
+    其余（英文、数字、HTML标签等）约 4 个字符 1 个 token
+    """
+    if not text:
+        return 0
+    cjk_count = len(_CJK_PATTERN.findall(text))
+    return cjk_count + (len(text) - cjk_count + 3) // 4
+
+
+_TABLE_PATTERN = re.compile(r'<table', re.IGNORECASE)
+_CELL_END_PATTERN = re.compile(r'</t[dh]\s*>', re.IGNORECASE)
+_ROW_END_PATTERN = re.compile(r'</tr\s*>', re.IGNORECASE)
+_TAG_PATTERN = re.compile(r'<[^>]+>')
+_INLINE_SPACE_PATTERN = re.compile(r'[ \t]+')
+
+
+def compact_html_table(text: str) -> str:
+    """把 HTML 表格压缩成 "单元格 | 单元格" 的纯文本行，去掉标签和属性，非表格文本原样返回"""
+    if not _TABLE_PATTERN.search(text):
+        return text
+    text = _CELL_END_PATTERN.sub(' | ', text)
+    text = _ROW_END_PATTERN.sub('\n', text)
+    text = _TAG_PATTERN.sub('', text)
+    lines = [_INLINE_SPACE_PATTERN.sub(' ', line).strip(' |') for line in text.split('\n')]
+    return '\n'.join(line for line in lines if line)
+
+
+def truncate_to_tokens(text: str, max_tokens: int, suffix: str = '…（已截断）') -> str:
+    """按估算的 token 数截断文本，未超出时原样返回"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    budget = max_tokens - estimate_tokens(suffix)
+    used = 0.0
+    for i, char in enumerate(text):
+        used += 1 if _CJK_PATTERN.match(char) else 0.25
+        if used > budget:
+            return text[:i] + suffix
+    return text
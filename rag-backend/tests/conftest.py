@@ -0,0 +1,10 @@
+"""
+conftest - 测试公共配置：把 rag-backend 目录加入导入路径，测试中按 src.xxx 导入
+
+Author: lsy
+Date: 2026/10/18
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
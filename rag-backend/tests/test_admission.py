@@ -0,0 +1,90 @@
+"""
+test_admission - 带优先级等待队列的并发限制器的测试
+
+Author: lsy
+Date: 2026/10/18
+"""
+import asyncio
+
+import pytest
+
+from src.admission import PriorityLimiter
+
+
+def test_try_acquire_up_to_limit():
+    limiter = PriorityLimiter("test", 2)
+    assert limiter.try_acquire() and limiter.try_acquire()
+    assert not limiter.try_acquire()
+    limiter.release()
+    assert limiter.active == 1 and limiter.try_acquire()
+
+
+def test_unlimited_when_limit_not_positive():
+    limiter = PriorityLimiter("test", 0)
+    assert all(limiter.try_acquire() for _ in range(100))
+
+
+def test_hands_over_by_priority_then_arrival():
+    async def run():
+        limiter = PriorityLimiter("test", 1)
+        await limiter.acquire()
+        order = []
+
+        async def request(name, priority):
+            await limiter.acquire(priority)
+            order.append(name)
+            limiter.release()
+
+        tasks = []
+        for name, priority in [("low", "low"), ("normal-1", "normal"), ("high", "high"), ("normal-2", "normal")]:
+            tasks.append(asyncio.ensure_future(request(name, priority)))
+            await asyncio.sleep(0)
+        assert limiter.waiting == 4
+        limiter.release()
+        await asyncio.gather(*tasks)
+        return order, limiter.active
+
+    order, active = asyncio.run(run())
+    assert order == ["high", "normal-1", "normal-2", "low"]
+    assert active == 0
+
+
+def test_new_arrivals_cannot_jump_the_queue():
+    async def run():
+        limiter = PriorityLimiter("test", 1)
+        await limiter.acquire()
+        waiter = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        limiter.release()
+        # 名额已移交给排队者，新请求即使此时到达也拿不到
+        jumped = limiter.try_acquire()
+        await waiter
+        return jumped, limiter.active
+
+    assert asyncio.run(run()) == (False, 1)
+
+
+def test_timeout_leaves_queue():
+    async def run():
+        limiter = PriorityLimiter("test", 1)
+        await limiter.acquire()
+        with pytest.raises(asyncio.TimeoutError):
+            await limiter.acquire(timeout=0.01)
+        return limiter.waiting, limiter.active, limiter.stats()["cancelled"]
+
+    assert asyncio.run(run()) == (0, 1, 1)
+
+
+def test_cancel_after_handover_returns_slot():
+    async def run():
+        limiter = PriorityLimiter("test", 1)
+        await limiter.acquire()
+        task = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        # 名额移交和取消发生在同一轮事件循环中
+        limiter.release()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return limiter.active, limiter.waiting
+
+    assert asyncio.run(run()) == (0, 0)
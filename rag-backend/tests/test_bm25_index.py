@@ -0,0 +1,62 @@
+"""
+test_bm25_index - BM25倒排索引的测试：打分与 rank_bm25.BM25Okapi 一致，top_k 只返回命中查询词的文档
+
+Author: lsy
+Date: 2026/10/18
+"""
+import numpy as np
+import pytest
+from rank_bm25 import BM25Okapi
+
+from src.bm25_index import BM25Index
+
+CORPUS = [
+    ["中芯国际", "营收", "增长", "营收"],
+    ["晶圆", "制造", "产能"],
+    ["中芯国际", "晶圆", "代工", "全球", "布局"],
+    ["净利润", "下降"],
+    ["营收", "净利润", "毛利率", "营收", "增长", "季度"],
+    ["研发", "投入"],
+]
+QUERIES = [["中芯国际", "营收"], ["晶圆"], ["净利润", "增长", "不存在的词"], ["营收", "营收"]]
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_scores_match_bm25okapi(query):
+    index, okapi = BM25Index.build(CORPUS), BM25Okapi(CORPUS)
+    np.testing.assert_allclose(index.get_scores(query), okapi.get_scores(query), rtol=1e-6, atol=1e-9)
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_top_k_matches_full_ranking(query):
+    index = BM25Index.build(CORPUS)
+    full = index.get_scores(query)
+    ids, scores = index.top_k(query, 3, normalize=False)
+    hits = np.flatnonzero(full != 0)
+    # 只返回命中查询词的文档，不用0分文档补足
+    assert set(ids.tolist()) <= set(hits.tolist())
+    assert len(ids) == min(3, len(hits))
+    np.testing.assert_allclose(scores, np.sort(full[hits])[::-1][:len(ids)])
+
+
+def test_top_k_normalizes_over_full_corpus():
+    index = BM25Index.build(CORPUS)
+    query = ["中芯国际", "营收"]
+    full = index.get_scores(query)
+    ids, scores = index.top_k(query, len(CORPUS))
+    expected = (full - full.min()) / (full.max() - full.min())
+    np.testing.assert_allclose(scores, expected[ids])
+
+
+def test_no_hits_returns_empty():
+    ids, scores = BM25Index.build(CORPUS).top_k(["不存在的词"], 5)
+    assert len(ids) == 0 and len(scores) == 0
+
+
+def test_save_and_load_round_trip(tmp_path):
+    index = BM25Index.build(CORPUS)
+    index.save(tmp_path / "bm25_index")
+    loaded = BM25Index.load(tmp_path / "bm25_index")
+    assert loaded.n_docs == len(CORPUS)
+    for query in QUERIES:
+        np.testing.assert_allclose(loaded.get_scores(query), index.get_scores(query))
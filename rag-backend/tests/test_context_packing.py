@@ -0,0 +1,53 @@
+"""
+test_context_packing - 上下文打包的测试：相邻块合并、近似重复去重、按 token 预算填充
+
+Author: lsy
+Date: 2026/10/18
+"""
+from src.context_packing import ContextPacker, merge_overlap
+from src.token_utils import estimate_tokens
+
+LONG_A = "中芯国际2023年营业收入为452.5亿元，同比下降8.6%，主要受智能手机和消费电子需求疲软影响。" * 3
+LONG_B = "公司在上海、北京、天津和深圳拥有多座晶圆厂，并持续扩充12英寸成熟制程产能，服务全球客户。" * 3
+
+
+def _chunk(chunk_id, text, file_origin="中芯国际.pdf", page=1):
+    return {"chunk_id": chunk_id, "file_origin": file_origin, "page_range": [page], "text": text}
+
+
+def test_merge_overlap_drops_repeated_text():
+    left, right = "中芯国际2023年营业收入同比下降", "2023年营业收入同比下降，净利润下降"
+    assert merge_overlap(left, right) == "中芯国际2023年营业收入同比下降，净利润下降"
+    assert merge_overlap("中芯国际", "晶圆代工") == "中芯国际\n晶圆代工"
+
+
+def test_adjacent_chunks_merged_in_rank_order():
+    chunks = [_chunk(11, LONG_B[-60:] + "净利润下降。", page=4), _chunk(20, LONG_A, file_origin="华虹.pdf"),
+              _chunk(10, LONG_B, page=3)]
+    context, stats = ContextPacker(token_budget=5000).pack(chunks)
+    assert stats["merged"] == 1 and stats["passages"] == 2
+    # 合并后的段落排名取其中最靠前的块（第 0 名），页码取并集
+    assert context.index("中芯国际.pdf") < context.index("华虹.pdf")
+    assert "页码: P3-4" in context
+    assert context.count(LONG_B[-60:]) == 1
+
+
+def test_near_duplicates_removed():
+    chunks = [_chunk(1, LONG_A), _chunk(50, LONG_A + "。", file_origin="转载.pdf")]
+    _, stats = ContextPacker(token_budget=5000, duplicate_threshold=0.9).pack(chunks)
+    assert stats["duplicates"] == 1 and stats["passages"] == 1
+
+
+def test_respects_token_budget():
+    chunks = [_chunk(i * 10, f"第{i}份报告：" + "".join(f"{i}季度指标{j}为{i * j}亿元。" for j in range(60)),
+                     file_origin=f"报告{i}.pdf") for i in range(6)]
+    context, stats = ContextPacker(token_budget=300).pack(chunks)
+    assert stats["tokens_after"] <= 300
+    assert estimate_tokens(context) <= 300 + stats["passages"]
+    assert stats["truncated"] + stats["dropped"] > 0
+    assert stats["tokens_before"] == ContextPacker.baseline_tokens(chunks)
+
+
+def test_first_passage_always_included():
+    context, stats = ContextPacker(token_budget=10).pack([_chunk(1, LONG_A)])
+    assert stats["passages"] == 1 and "参考文档 1" in context
@@ -0,0 +1,88 @@
+"""
+test_deadline - 请求截止时间的测试：阶段截止时刻、上下文预算缩减、降级记录
+
+Author: lsy
+Date: 2026/10/18
+"""
+import time
+import asyncio
+
+import pytest
+
+import src.config as config
+from src.deadline import RequestDeadline, wait_within, deadline_stats
+
+SHARES = {"retrieval": 0.15, "rerank": 0.35, "generation": 0.5}
+
+
+def test_stage_ends_are_cumulative_shares():
+    deadline = RequestDeadline(20, shares=SHARES, start=1000.0)
+    assert deadline.stage_ends == pytest.approx({"retrieval": 1003.0, "rerank": 1010.0, "generation": 1020.0})
+
+
+def test_remaining_counts_down_from_start():
+    deadline = RequestDeadline(10, shares=SHARES, start=time.time() - 2)
+    assert deadline.remaining("retrieval") == 0.0
+    assert deadline.remaining("rerank") == pytest.approx(3.0, abs=0.05)
+    assert deadline.remaining() == pytest.approx(8.0, abs=0.05)
+
+
+def test_disabled_deadline():
+    deadline = RequestDeadline(0, shares=SHARES)
+    assert not deadline.enabled
+    assert deadline.remaining("rerank") is None
+    assert deadline.context_budget(3000) == 3000
+
+
+def test_context_budget_scales_with_time_left():
+    # 总共 10 秒、生成份额 5 秒，只剩 2.5 秒时预算减半
+    deadline = RequestDeadline(10, shares=SHARES, start=time.time() - 7.5)
+    assert deadline.context_budget(4000) == pytest.approx(2000, abs=50)
+    # 不低于最小上下文
+    late = RequestDeadline(10, shares=SHARES, start=time.time() - 9.99)
+    assert late.context_budget(4000) == config.DEADLINE_MIN_CONTEXT_TOKENS
+    # 剩余时间充足时不缩减
+    assert RequestDeadline(10, shares=SHARES).context_budget(4000) == 4000
+
+
+def test_degrade_records_and_counts():
+    before = deadline_stats()
+    deadline = RequestDeadline(10, shares=SHARES)
+    assert not deadline.degraded
+    record = deadline.degrade("retrieval", "bm25_only", "向量检索超时")
+    deadline.degrade("rerank", "fused_order", "重排超时")
+    assert record["stage"] == "retrieval" and record["action"] == "bm25_only"
+    assert deadline.degraded and len(deadline.degradations) == 2
+    after = deadline_stats()
+    assert after["degraded_requests"] - before.get("degraded_requests", 0) == 1
+    assert after["bm25_only"] - before.get("bm25_only", 0) == 1
+
+
+def test_wait_within():
+    async def slow(seconds, value):
+        await asyncio.sleep(seconds)
+        return value
+
+    async def run():
+        assert await wait_within(slow(0, 1), 1.0) == 1
+        assert await wait_within(slow(0, 2), None) == 2
+        inner = asyncio.ensure_future(slow(1, 3))
+        with pytest.raises(asyncio.TimeoutError):
+            await wait_within(inner, 0.01)
+        await asyncio.sleep(0)
+        return inner.cancelled()
+
+    assert asyncio.run(run())
+
+
+def test_wait_within_propagates_outer_cancel():
+    async def run():
+        inner = asyncio.ensure_future(asyncio.sleep(1))
+        outer = asyncio.ensure_future(wait_within(inner, None))
+        await asyncio.sleep(0)
+        outer.cancel()
+        await asyncio.gather(outer, return_exceptions=True)
+        await asyncio.sleep(0)
+        return outer.cancelled(), inner.cancelled()
+
+    assert asyncio.run(run()) == (True, True)
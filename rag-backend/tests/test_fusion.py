@@ -0,0 +1,54 @@
+"""
+test_fusion - 多路检索结果融合的测试
+
+Author: lsy
+Date: 2026/10/18
+"""
+import numpy as np
+import pytest
+
+from src.candidates import Candidates
+from src.fusion import fuse
+
+
+def _results():
+    vector = Candidates([1, 2, 3], {"vector_score": np.array([0.9, 0.5, 0.1])})
+    bm25 = Candidates([3, 4], {"bm25_score": np.array([8.0, 2.0])})
+    return {"vector_score": vector, "bm25_score": bm25}
+
+
+def test_weighted_union_normalizes_each_route():
+    fused = fuse(_results(), method="weighted", weights={"vector_score": 0.6, "bm25_score": 0.4})
+    scores = dict(zip(fused.ids.tolist(), fused.scores["final_score"].tolist()))
+    # 每路先做 Min-Max 归一化：向量 [1, 0.5, 0]，BM25 [1, 0]
+    assert scores == pytest.approx({1: 0.6, 2: 0.3, 3: 0.4, 4: 0.0})
+    assert fused.ids.tolist() == [1, 3, 2, 4]
+    # 未命中的一路分数为 NaN
+    assert np.isnan(fused.scores["bm25_score"][fused.ids.tolist().index(1)])
+
+
+def test_rrf_uses_ranks_not_scores():
+    fused = fuse(_results(), method="rrf", weights={"vector_score": 1.0, "bm25_score": 1.0}, rrf_k=60)
+    scores = dict(zip(fused.ids.tolist(), fused.scores["final_score"].tolist()))
+    assert scores[3] == pytest.approx(1 / 63 + 1 / 61)
+    assert scores[1] == pytest.approx(1 / 61)
+    assert fused.ids.tolist()[0] == 3
+
+
+@pytest.mark.parametrize("policy, expected", [("union", {1, 2, 3, 4}), ("intersection", {3}), ("primary", {1, 2, 3})])
+def test_policies(policy, expected):
+    assert set(fuse(_results(), policy=policy).ids.tolist()) == expected
+
+
+def test_top_n_and_empty_route():
+    results = _results()
+    results["bm25_score"] = Candidates.empty()
+    fused = fuse(results, top_n=2)
+    assert fused.ids.tolist() == [1, 2]
+    empty = fuse({"vector_score": Candidates.empty(), "bm25_score": Candidates.empty()})
+    assert len(empty) == 0 and "final_score" in empty.scores
+
+
+def test_rejects_unknown_method():
+    with pytest.raises(ValueError):
+        fuse(_results(), method="max")
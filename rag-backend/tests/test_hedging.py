@@ -0,0 +1,100 @@
+"""
+test_hedging - 重排结果解析、调用截止时间与对冲请求的测试
+
+Author: lsy
+Date: 2026/10/18
+"""
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.hedging import LatencyTracker, DeadlineExceeded, call_with_deadline, call_all_with_deadline
+from src.reranking import parse_rankings
+
+
+@pytest.mark.parametrize("content", [
+    '[{"block_idx": 0, "relevance_score": 0.9}, {"block_idx": 1, "relevance_score": 0.2}]',
+    '```json\n[{"block_idx": 0, "relevance_score": 0.9}, {"block_idx": 1, "relevance_score": 0.2}]\n```',
+    '评分如下：[{"block_idx": 0, "relevance_score": 0.9}, {"block_idx": 1, "relevance_score": 0.2}] 以上',
+])
+def test_parse_rankings_tolerates_wrapping(content):
+    assert [item["block_idx"] for item in parse_rankings(content)] == [0, 1]
+
+
+def test_parse_rankings_keeps_complete_items_of_truncated_json():
+    content = '[{"block_idx": 0, "relevance_score": 0.9}, {"block_idx": 1, "relevance_score": 0.2}, {"block_idx": 2, "rel'
+    assert [item["block_idx"] for item in parse_rankings(content)] == [0, 1]
+
+
+def test_parse_rankings_rejects_garbage():
+    with pytest.raises(ValueError):
+        parse_rankings("无法评分")
+
+
+def test_returns_result_within_deadline():
+    assert call_with_deadline(lambda: 42, 1.0) == 42
+
+
+def test_deadline_exceeded():
+    tracker = LatencyTracker("test", default_delay=10)
+    t0 = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        call_with_deadline(lambda: time.sleep(0.5), 0.1, tracker=tracker)
+    assert time.monotonic() - t0 < 0.4
+    assert tracker.stats()["deadline_exceeded"] == 1
+
+
+def test_hedge_wins_when_primary_is_slow():
+    tracker = LatencyTracker("test", default_delay=0.05)
+    calls = []
+    lock = threading.Lock()
+
+    def slow_first():
+        with lock:
+            calls.append(None)
+            first = len(calls) == 1
+        time.sleep(1.0 if first else 0.01)
+        return "primary" if first else "hedge"
+
+    executor = ThreadPoolExecutor(max_workers=2)
+    assert call_with_deadline(slow_first, 2.0, tracker=tracker, executor=executor) == "hedge"
+    stats = tracker.stats()
+    assert stats["hedged"] == 1 and stats["hedge_wins"] == 1
+
+
+def test_errors_are_raised_without_hedging():
+    tracker = LatencyTracker("test", default_delay=0.05)
+
+    def fail():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        call_with_deadline(fail, 1.0, tracker=tracker)
+    assert tracker.stats()["hedged"] == 0 and tracker.stats()["errors"] == 1
+
+
+def test_call_all_returns_results_and_errors_in_order():
+    def fail():
+        raise ValueError("bad json")
+
+    results = call_all_with_deadline([lambda: 1, fail, lambda: time.sleep(0.5)], 0.1, hedge=False)
+    assert results[0] == 1
+    assert isinstance(results[1], ValueError)
+    assert isinstance(results[2], DeadlineExceeded)
+
+
+def test_call_all_cancels_abandoned_queued_calls():
+    executor = ThreadPoolExecutor(max_workers=1)
+    started = []
+
+    def slow():
+        started.append(None)
+        time.sleep(0.3)
+
+    results = call_all_with_deadline([slow, slow, slow], 0.1, hedge=False, executor=executor)
+    assert all(isinstance(result, DeadlineExceeded) for result in results)
+    executor.shutdown(wait=True)
+    # 只有已开始执行的一个调用占用了线程，排队中的两个被取消
+    assert len(started) == 1
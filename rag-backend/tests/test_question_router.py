@@ -0,0 +1,62 @@
+"""
+test_question_router - 问题路由的测试
+
+Author: lsy
+Date: 2026/10/18
+"""
+import pytest
+
+import src.config as config
+from src.question_router import QuestionRouter, KIND_LABELS, kind_preset
+
+
+@pytest.fixture(scope="module")
+def router():
+    return QuestionRouter().fit()
+
+
+@pytest.mark.parametrize("question", ["你好", "您好！", "谢谢", "你是谁？", "hello~"])
+def test_greetings(router, question):
+    route = router.route(question)
+    assert route["kind"] == "greeting" and route["source"] == "rule"
+
+
+@pytest.mark.parametrize("question, kind", [
+    ("中芯国际和华虹半导体的毛利率相比如何？", "compare"),
+    ("中芯国际2023年净利润为什么下降？", "reasoning"),
+    ("中芯国际2023年的营业收入是多少？", "fact"),
+    ("请总结一下中芯国际的主营业务", "summary"),
+])
+def test_keyword_rules(router, question, kind):
+    route = router.route(question)
+    assert route["kind"] == kind and route["source"] == "rule"
+    assert route["label"] == KIND_LABELS[kind]
+
+
+@pytest.mark.parametrize("question", ["帮我写一首关于春天的诗", "明天北京会下雨吗"])
+def test_unrelated_question_answered_directly(router, question):
+    assert router.route(question)["kind"] == "other"
+
+
+def test_domain_words_are_never_rejected(router):
+    # 含年报领域词的问题宁可检索也不误判为无关
+    assert router.route("公司今天天气怎么样")["kind"] != "other"
+
+
+def test_stats_count_routes():
+    router = QuestionRouter().fit()
+    router.route("你好")
+    router.route("中芯国际2023年的营业收入是多少？")
+    stats = router.stats()
+    assert stats["routed"] == 2 and stats["direct_replies"] == 1
+    assert stats["kinds"]["greeting"] == 1 and stats["kinds"]["fact"] == 1
+
+
+def test_kind_preset_scales_depth():
+    preset = config.MODE_PRESETS["accurate"]
+    for kind, scale in config.KIND_DEPTH_SCALES.items():
+        scaled = kind_preset(preset, kind)
+        if scale == 1.0:
+            assert scaled is preset
+        else:
+            assert scaled["context_top_n"] == max(1, round(preset["context_top_n"] * scale))
@@ -0,0 +1,46 @@
+"""
+test_rerank_batches - 重排批次按 token 预算装箱的测试
+
+Author: lsy
+Date: 2026/10/18
+"""
+from src.reranking import plan_rerank_batches, PROMPT_TOKENS_PER_BLOCK
+from src.token_utils import estimate_tokens
+
+
+def _contents(n, length):
+    return {position: "营收增长" * length for position in range(n)}
+
+
+def test_every_block_planned_once_within_budget():
+    contents = {position: "营收增长" * (10 + position * 7) for position in range(20)}
+    budget = 600
+    batches, batch_tokens = plan_rerank_batches(contents, budget)
+    assert sorted(p for batch in batches for p in batch) == list(range(20))
+    for batch, tokens in zip(batches, batch_tokens):
+        assert batch == sorted(batch)
+        assert tokens == sum(estimate_tokens(contents[p]) + PROMPT_TOKENS_PER_BLOCK for p in batch)
+        assert tokens <= budget
+
+
+def test_batches_are_balanced():
+    batches, batch_tokens = plan_rerank_batches(_contents(12, 20), token_budget=10000, max_batch_size=4)
+    assert len(batches) == 3
+    assert [len(batch) for batch in batches] == [4, 4, 4]
+    assert max(batch_tokens) - min(batch_tokens) == 0
+
+
+def test_max_batch_size_limits_blocks():
+    batches, _ = plan_rerank_batches(_contents(9, 1), token_budget=10000, max_batch_size=2)
+    assert len(batches) == 5 and max(len(batch) for batch in batches) == 2
+
+
+def test_oversized_block_gets_its_own_batch():
+    contents = {0: "营收增长" * 500, 1: "净利润", 2: "毛利率"}
+    batches, batch_tokens = plan_rerank_batches(contents, token_budget=100)
+    assert [0] in batches
+    assert all(batch for batch in batches)
+
+
+def test_empty():
+    assert plan_rerank_batches({}, 1000) == ([], [])
@@ -0,0 +1,87 @@
+"""
+test_single_flight - 在途请求合并的测试
+
+Author: lsy
+Date: 2026/10/18
+"""
+import asyncio
+
+
+from src.single_flight import SingleFlight
+
+
+def _counting_factory(runs, n=5, interval=0.01):
+    async def events():
+        runs.append(None)
+        for i in range(n):
+            await asyncio.sleep(interval)
+            yield i
+    return events
+
+
+async def _collect(subscription):
+    return [event async for event in subscription.events()]
+
+
+def test_concurrent_subscribers_share_one_run():
+    async def run():
+        flights, runs = SingleFlight(), []
+        leader = flights.subscribe("q", _counting_factory(runs))
+        first = asyncio.ensure_future(_collect(leader))
+        await asyncio.sleep(0.025)
+        # 后到的请求先回放已有事件，再接收后续事件
+        follower = flights.subscribe("q", _counting_factory(runs))
+        results = await asyncio.gather(first, _collect(follower))
+        return leader.leader, follower.leader, results, runs, flights.stats()
+
+    leader, follower, results, runs, stats = asyncio.run(run())
+    assert (leader, follower) == (True, False)
+    assert results == [[0, 1, 2, 3, 4], [0, 1, 2, 3, 4]]
+    assert len(runs) == 1
+    assert stats["leaders"] == 1 and stats["followers"] == 1 and stats["in_flight"] == 0
+
+
+def test_join_only_while_in_flight():
+    async def run():
+        flights, runs = SingleFlight(), []
+        assert flights.join("q") is None
+        await _collect(flights.subscribe("q", _counting_factory(runs, n=1)))
+        # 流结束后移除，相同请求重新执行
+        assert flights.join("q") is None
+        await _collect(flights.subscribe("q", _counting_factory(runs, n=1)))
+        return runs
+
+    assert len(asyncio.run(run())) == 2
+
+
+def test_errors_reach_every_subscriber():
+    async def failing():
+        yield 1
+        await asyncio.sleep(0.01)
+        raise RuntimeError("生成失败")
+
+    async def run():
+        flights = SingleFlight()
+        subscriptions = [flights.subscribe("q", failing), flights.subscribe("q", failing)]
+        return await asyncio.gather(*(_collect(s) for s in subscriptions), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_last_subscriber_leaving_cancels_run():
+    async def run():
+        flights, runs = SingleFlight(), []
+        first = flights.subscribe("q", _counting_factory(runs, n=100))
+        second = flights.subscribe("q", _counting_factory(runs, n=100))
+        await asyncio.sleep(0.02)
+        first.close()
+        cancelled_early = first.task.cancelled()
+        second.close()
+        second.close()
+        await asyncio.gather(second.task, return_exceptions=True)
+        return cancelled_early, second.task.cancelled(), flights.stats()
+
+    cancelled_early, cancelled, stats = asyncio.run(run())
+    assert not cancelled_early and cancelled
+    assert stats["in_flight"] == 0 and stats["cancelled"] == 1
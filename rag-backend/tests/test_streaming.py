@@ -0,0 +1,81 @@
+"""
+test_streaming - 流式答案增量合并的测试
+
+Author: lsy
+Date: 2026/10/18
+"""
+import asyncio
+
+from src.streaming import coalesce_deltas
+
+
+async def _deltas(n, interval, stall_at=None, closed=None):
+    try:
+        for i in range(n):
+            await asyncio.sleep(0.3 if i == stall_at else interval)
+            yield f"字{i:02d}"
+    finally:
+        if closed is not None:
+            closed.append(True)
+
+
+async def _collect(deltas, **kwargs):
+    loop = asyncio.get_running_loop()
+    start, pieces = loop.time(), []
+    async for piece in coalesce_deltas(deltas, **kwargs):
+        pieces.append((loop.time() - start, piece))
+    return pieces
+
+
+def test_pass_through_when_disabled():
+    pieces = asyncio.run(_collect(_deltas(5, 0), flush_ms=0))
+    assert [piece for _, piece in pieces] == [f"字{i:02d}" for i in range(5)]
+
+
+def test_coalesces_without_losing_text():
+    pieces = asyncio.run(_collect(_deltas(40, 0.002), flush_ms=30, max_chars=10000))
+    assert "".join(piece for _, piece in pieces) == "".join(f"字{i:02d}" for i in range(40))
+    assert len(pieces) < 40
+
+
+def test_max_chars_flushes_early():
+    pieces = asyncio.run(_collect(_deltas(20, 0), flush_ms=10000, max_chars=9))
+    assert all(len(piece) <= 9 for _, piece in pieces[:-1])
+    assert len(pieces) >= 6
+
+
+def test_flushes_buffer_when_upstream_stalls():
+    pieces = asyncio.run(_collect(_deltas(10, 0.001, stall_at=5), flush_ms=50, max_chars=10000))
+    # 停顿前缓冲的内容在窗口到期时发出，不等停顿结束
+    emitted_at = next(t for t, piece in pieces if "字04" in piece)
+    assert emitted_at < 0.2
+
+
+def test_early_close_closes_upstream():
+    async def run(flush_ms):
+        closed = []
+        stream = coalesce_deltas(_deltas(100, 0.005, closed=closed), flush_ms=flush_ms)
+        async for _ in stream:
+            break
+        await stream.aclose()
+        return closed
+
+    assert asyncio.run(run(0)) == [True]
+    assert asyncio.run(run(30)) == [True]
+
+
+def test_cancel_closes_upstream():
+    async def run():
+        closed = []
+
+        async def consume():
+            async for _ in coalesce_deltas(_deltas(100, 0.005, closed=closed), flush_ms=1000, max_chars=10 ** 6):
+                pass
+
+        task = asyncio.ensure_future(consume())
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return closed
+
+    assert asyncio.run(run()) == [True]
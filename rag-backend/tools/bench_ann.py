@@ -0,0 +1,109 @@
+"""
+bench_ann - 各类FAISS索引的召回率/延迟/内存对比，以Flat精确检索为基准
+
+用法（在 rag-backend 目录下）：
+    # 使用已有向量库中的向量（需为 flat 索引，可还原出原始向量）
+    python -m tools.bench_ann --index ../data/stock_data/databases/vector_dbs/all_reports.faiss
+    # 使用随机生成的聚簇向量
+    python -m tools.bench_ann --n 200000 --dim 1536
+
+Author: lsy
+Date: 2026/10/18
+"""
+import argparse
+import time
+
+import faiss
+import numpy as np
+
+from src.ingestion import build_faiss_index, set_search_params
+
+# (索引类型, 构建参数, 检索参数扫描)
+DEFAULT_CONFIGS = [
+    ("ivf_flat", {}, [{"nprobe": p} for p in (1, 4, 16, 64)]),
+    ("hnsw", {"hnsw_m": 32}, [{"ef_search": e} for e in (16, 64, 256)]),
+    ("ivf_pq", {}, [{"nprobe": p} for p in (4, 16, 64)]),
+    ("opq_ivf_pq", {}, [{"nprobe": p} for p in (4, 16, 64)]),
+]
+
+
+def load_vectors(args):
+    """读取基准向量和查询向量，查询为库内向量加噪声，模拟相近的问题"""
+    rng = np.random.default_rng(args.seed)
+    if args.index:
+        index = faiss.read_index(args.index)
+        vectors = index.reconstruct_n(0, index.ntotal).astype(np.float32)
+    else:
+        # 高斯混合的聚簇数据比纯随机向量更接近真实文本向量的分布
+        centers = rng.standard_normal((max(1, args.n // 500), args.dim)).astype(np.float32)
+        labels = rng.integers(len(centers), size=args.n)
+        vectors = centers[labels] + 0.3 * rng.standard_normal((args.n, args.dim)).astype(np.float32)
+    faiss.normalize_L2(vectors)
+
+    query_ids = rng.integers(len(vectors), size=args.queries)
+    queries = vectors[query_ids] + args.noise * rng.standard_normal((args.queries, vectors.shape[1])).astype(np.float32)
+    faiss.normalize_L2(queries)
+    return vectors, queries
+
+
+def index_memory_mb(index) -> float:
+    """以序列化后的字节数近似索引占用内存"""
+    return faiss.serialize_index(index).nbytes / 1024 / 1024
+
+
+def measure(index, queries, k, ground_truth):
+    """逐条查询（与线上一致），统计 recall@k 与 p50/p99 延迟"""
+    latencies, hits = [], 0
+    for i in range(len(queries)):
+        t0 = time.perf_counter()
+        _, ids = index.search(queries[i:i + 1], k)
+        latencies.append(time.perf_counter() - t0)
+        hits += len(np.intersect1d(ids[0], ground_truth[i]))
+    return {
+        "recall": hits / ground_truth.size,
+        "p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "p99_ms": float(np.percentile(latencies, 99) * 1000),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FAISS ANN 索引召回率/延迟基准")
+    parser.add_argument("--index", help="已有的 flat 索引文件，不传则使用随机聚簇向量")
+    parser.add_argument("--n", type=int, default=100000, help="随机向量数量")
+    parser.add_argument("--dim", type=int, default=1536, help="随机向量维度（text-embedding-v1 为1536）")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--noise", type=float, default=0.05)
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--threads", type=int, default=1, help="FAISS OpenMP 线程数")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    faiss.omp_set_num_threads(args.threads)
+    vectors, queries = load_vectors(args)
+    print(f"向量 {vectors.shape[0]} x {vectors.shape[1]}，查询 {len(queries)} 条，k={args.k}")
+
+    flat = build_faiss_index(vectors, "flat")
+    _, ground_truth = flat.search(queries, args.k)
+    result = measure(flat, queries, args.k, ground_truth)
+    print(f"{'flat':<12} {'-':<16} build {0:>6.1f}s mem {index_memory_mb(flat):>8.1f}MB "
+          f"recall@{args.k} {result['recall']:.3f} p50 {result['p50_ms']:.2f}ms p99 {result['p99_ms']:.2f}ms")
+
+    for index_type, build_params, search_sweep in DEFAULT_CONFIGS:
+        t0 = time.perf_counter()
+        try:
+            index = build_faiss_index(vectors, index_type, **build_params)
+        except RuntimeError as e:
+            print(f"{index_type:<12} 构建失败: {e}")
+            continue
+        build_s = time.perf_counter() - t0
+        memory_mb = index_memory_mb(index)
+        for search_params in search_sweep:
+            applied = set_search_params(index, **search_params)
+            result = measure(index, queries, args.k, ground_truth)
+            params = ",".join(f"{key}={value}" for key, value in applied.items())
+            print(f"{index_type:<12} {params:<16} build {build_s:>6.1f}s mem {memory_mb:>8.1f}MB "
+                  f"recall@{args.k} {result['recall']:.3f} p50 {result['p50_ms']:.2f}ms p99 {result['p99_ms']:.2f}ms")
+
+
+if __name__ == '__main__':
+    main()
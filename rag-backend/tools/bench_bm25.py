@@ -0,0 +1,116 @@
+"""
+bench_bm25 - BM25倒排索引与 rank_bm25.BM25Okapi 的检索耗时对比
+
+用法（在 rag-backend 目录下）：
+    python -m tools.bench_bm25 --sizes 10000,100000,1000000
+
+语料为按 Zipf 分布随机生成的词项序列，BM25Okapi 在百万规模下构建需要数GB内存，
+可用 --okapi-max-docs 限制参与对比的最大规模。
+
+Author: lsy
+Date: 2026/10/18
+"""
+import argparse
+import time
+
+import numpy as np
+from rank_bm25 import BM25Okapi
+
+from src.bm25_index import BM25Index
+
+
+def make_corpus(n_docs, vocab_size, mean_len, seed=0):
+    """生成服从 Zipf 分布的随机语料，词项用字符串表示"""
+    rng = np.random.default_rng(seed)
+    lengths = rng.poisson(mean_len, n_docs) + 1
+    token_ids = (rng.zipf(1.2, lengths.sum()) - 1) % vocab_size
+    terms = [f"t{i}" for i in range(vocab_size)]
+    corpus, pos = [], 0
+    for length in lengths:
+        corpus.append([terms[i] for i in token_ids[pos:pos + length]])
+        pos += length
+    return corpus
+
+
+def make_queries(corpus, n_queries, query_len, seed=1):
+    """从语料中随机抽词组成问题，保证问题词项命中索引"""
+    rng = np.random.default_rng(seed)
+    queries = []
+    for _ in range(n_queries):
+        doc = corpus[rng.integers(len(corpus))]
+        queries.append([doc[i] for i in rng.integers(len(doc), size=query_len)])
+    return queries
+
+
+def percentile_ms(latencies, q):
+    return float(np.percentile(latencies, q) * 1000)
+
+
+def bench_size(n_docs, args):
+    corpus = make_corpus(n_docs, args.vocab_size, args.mean_len)
+    queries = make_queries(corpus, args.queries, args.query_len)
+
+    t0 = time.perf_counter()
+    index = BM25Index.build(corpus)
+    build_s = time.perf_counter() - t0
+
+    index_latencies = []
+    for query in queries:
+        t0 = time.perf_counter()
+        index.top_k(query, args.top_n)
+        index_latencies.append(time.perf_counter() - t0)
+    row = {
+        "n_docs": n_docs,
+        "index_build_s": build_s,
+        "index_p50_ms": percentile_ms(index_latencies, 50),
+        "index_p99_ms": percentile_ms(index_latencies, 99),
+    }
+
+    if n_docs <= args.okapi_max_docs:
+        t0 = time.perf_counter()
+        okapi = BM25Okapi(corpus)
+        row["okapi_build_s"] = time.perf_counter() - t0
+
+        okapi_latencies, max_diff = [], 0.0
+        for query in queries[:args.okapi_queries]:
+            t0 = time.perf_counter()
+            scores = okapi.get_scores(query)
+            top = np.argsort(scores)[-args.top_n:][::-1]
+            okapi_latencies.append(time.perf_counter() - t0)
+
+            # 校验：同一问题的候选分数与 BM25Okapi 全量打分逐位一致
+            doc_ids, index_scores = index.top_k(query, args.top_n, normalize=False)
+            max_diff = max(max_diff, float(np.abs(scores[doc_ids] - index_scores).max()))
+            max_diff = max(max_diff, float(abs(scores[top[0]] - index_scores[0])))
+        row["okapi_p50_ms"] = percentile_ms(okapi_latencies, 50)
+        row["okapi_p99_ms"] = percentile_ms(okapi_latencies, 99)
+        row["speedup_p50"] = row["okapi_p50_ms"] / row["index_p50_ms"]
+        row["max_score_diff"] = max_diff
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BM25Index vs BM25Okapi 基准测试")
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="语料规模，逗号分隔")
+    parser.add_argument("--vocab-size", type=int, default=50000)
+    parser.add_argument("--mean-len", type=int, default=120, help="平均每块词数")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--okapi-queries", type=int, default=20, help="BM25Okapi 较慢，只跑前若干个问题")
+    parser.add_argument("--query-len", type=int, default=8)
+    parser.add_argument("--top-n", type=int, default=20)
+    parser.add_argument("--okapi-max-docs", type=int, default=1000000)
+    args = parser.parse_args()
+
+    for n_docs in [int(size) for size in args.sizes.split(',')]:
+        row = bench_size(n_docs, args)
+        line = (f"[{row['n_docs']:>8} 块] BM25Index 构建 {row['index_build_s']:.1f}s "
+                f"p50 {row['index_p50_ms']:.2f}ms p99 {row['index_p99_ms']:.2f}ms")
+        if "okapi_p50_ms" in row:
+            line += (f" | BM25Okapi 构建 {row['okapi_build_s']:.1f}s "
+                     f"p50 {row['okapi_p50_ms']:.2f}ms p99 {row['okapi_p99_ms']:.2f}ms "
+                     f"| 加速 {row['speedup_p50']:.1f}x 分数最大偏差 {row['max_score_diff']:.2e}")
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+bench_fusion - 融合引擎耗时基准：向量化 fuse 与按字典逐条合并的对比
+
+用法（在 rag-backend 目录下）：
+    python -m tools.bench_fusion --depths 20,200,2000,10000
+
+Author: lsy
+Date: 2026/10/18
+"""
+import argparse
+import time
+
+import numpy as np
+
+from src.candidates import Candidates
+from src.fusion import fuse
+
+
+def make_results(depth, corpus_size, overlap, rng):
+    """生成两路检索结果，约 overlap 比例的块同时被两路命中"""
+    vector_ids = rng.choice(corpus_size, size=depth, replace=False)
+    n_shared = int(depth * overlap)
+    others = np.setdiff1d(rng.choice(corpus_size, size=depth * 2, replace=False), vector_ids)
+    bm25_ids = np.concatenate([rng.permutation(vector_ids)[:n_shared], others[:depth - n_shared]])
+    vector_scores = np.sort(rng.random(depth))[::-1]
+    bm25_scores = np.sort(rng.random(depth))[::-1]
+    return (Candidates(vector_ids, {"vector_score": vector_scores}),
+            Candidates(bm25_ids, {"bm25_score": bm25_scores}))
+
+
+def dict_merge(vector_results, bm25_results, x=0.6):
+    """按块id用字典逐条合并（原 _merge_hybrid_results 的实现方式），作为对比基线"""
+    merged = {}
+    for chunk_id, score in zip(vector_results.ids.tolist(), vector_results.scores["vector_score"].tolist()):
+        merged[chunk_id] = {"vector_score": score, "bm25_score": None}
+    for chunk_id, score in zip(bm25_results.ids.tolist(), bm25_results.scores["bm25_score"].tolist()):
+        merged.setdefault(chunk_id, {"vector_score": None})["bm25_score"] = score
+    for item in merged.values():
+        item["final_score"] = x * (item["vector_score"] or 0.0) + (1 - x) * (item["bm25_score"] or 0.0)
+    return sorted(merged.items(), key=lambda kv: kv[1]["final_score"], reverse=True)
+
+
+def time_us(fn, repeat):
+    fn()
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t0) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="融合引擎耗时基准")
+    parser.add_argument("--depths", default="20,200,2000,10000", help="每路候选数量，逗号分隔")
+    parser.add_argument("--corpus-size", type=int, default=1000000)
+    parser.add_argument("--overlap", type=float, default=0.3)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--top-n", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    weights = {"vector_score": 0.6, "bm25_score": 0.4}
+    for depth in [int(depth) for depth in args.depths.split(',')]:
+        vector_results, bm25_results = make_results(depth, args.corpus_size, args.overlap, rng)
+        results = {"vector_score": vector_results, "bm25_score": bm25_results}
+        row = {
+            "weighted": time_us(lambda: fuse(results, "weighted", "union", weights), args.repeat),
+            "rrf": time_us(lambda: fuse(results, "rrf", "union", weights), args.repeat),
+            "intersection": time_us(lambda: fuse(results, "weighted", "intersection", weights), args.repeat),
+            # 线上只取融合后前 top_n 个送入重排
+            f"top{args.top_n}": time_us(lambda: fuse(results, "weighted", "union", weights, top_n=args.top_n), args.repeat),
+            "dict": time_us(lambda: dict_merge(vector_results, bm25_results), args.repeat),
+        }
+        print(f"每路 {depth:>6} 个候选: " + "  ".join(f"{name} {us:>9.1f}us" for name, us in row.items()))
+
+
+if __name__ == '__main__':
+    main()
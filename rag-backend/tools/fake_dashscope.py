@@ -0,0 +1,173 @@
+"""
+fake_dashscope - 本地模拟 DashScope HTTP 接口（文本生成/流式生成/文本向量），可注入延迟、限流、错误和格式错误的 json，
+用于在不访问真实服务的情况下测试截止时间、对冲请求和兜底逻辑
+
+用法（在 rag-backend 目录下）：
+    python -m tools.fake_dashscope --port 8001 --latency-ms 300 --slow-rate 0.1 --slow-ms 5000 --bad-json-rate 0.1
+    # 另一个终端中让 dashscope SDK 指向本地服务
+    DASHSCOPE_HTTP_BASE_URL=http://127.0.0.1:8001/api/v1 DASHSCOPE_API_KEY=fake uvicorn main:app
+    # 运行中调整故障注入参数
+    curl -X POST http://127.0.0.1:8001/_faults -H 'Content-Type: application/json' -d '{"error_rate": 0.5}'
+
+Author: lsy
+Date: 2026/10/18
+"""
+import re
+import json
+import uuid
+import random
+import asyncio
+import hashlib
+import argparse
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI()
+
+# 故障注入参数，命令行设置，运行中可通过 /_faults 修改
+faults = {
+    "latency_ms": 200,       # 基础延迟
+    "jitter_ms": 100,        # 延迟随机抖动
+    "slow_rate": 0.0,        # 慢请求（长尾）比例
+    "slow_ms": 5000,         # 慢请求的额外延迟
+    "error_rate": 0.0,       # 返回 500 的比例
+    "throttle_rate": 0.0,    # 返回 429 Throttling 的比例
+    "bad_json_rate": 0.0,    # 重排结果返回不规范 json 的比例
+    "token_interval_ms": 20, # 流式输出每个数据块的间隔
+    "dim": 1536,             # 向量维度
+}
+stats = {"generation": 0, "stream": 0, "embedding": 0, "errors": 0, "throttled": 0, "slow": 0, "bad_json": 0}
+
+
+async def _inject_faults():
+    """按配置注入延迟和错误，需要返回错误时给出错误响应"""
+    delay = faults["latency_ms"] + random.uniform(0, faults["jitter_ms"])
+    if random.random() < faults["slow_rate"]:
+        stats["slow"] += 1
+        delay += faults["slow_ms"]
+    await asyncio.sleep(delay / 1000)
+    if random.random() < faults["throttle_rate"]:
+        stats["throttled"] += 1
+        return JSONResponse(status_code=429, content={
+            "code": "Throttling.RateQuota", "message": "Requests rate limit exceeded.", "request_id": str(uuid.uuid4())})
+    if random.random() < faults["error_rate"]:
+        stats["errors"] += 1
+        return JSONResponse(status_code=500, content={
+            "code": "InternalError", "message": "Injected error.", "request_id": str(uuid.uuid4())})
+    return None
+
+
+def _rerank_content(user_prompt: str) -> str:
+    """模拟重排打分：按问题中的字符在块中出现的比例给分"""
+    question = re.search(r'查询问题："(.*?)"', user_prompt)
+    question = set(question.group(1)) if question else set()
+    start, end = user_prompt.find('['), user_prompt.rfind(']')
+    blocks = json.loads(user_prompt[start:end + 1])
+    rankings = []
+    for block in blocks:
+        overlap = len(question & set(block["content"])) / max(1, len(question))
+        rankings.append({"block_idx": block["block_idx"], "reasoning": "模拟打分",
+                         "relevance_score": round(overlap, 1)})
+    content = json.dumps(rankings, ensure_ascii=False)
+    if random.random() < faults["bad_json_rate"]:
+        stats["bad_json"] += 1
+        # 随机返回 markdown 包裹、带多余文字或被截断的 json
+        content = random.choice([
+            f"```json\n{content}\n```",
+            f"评分结果如下：{content}，以上。",
+            content[:len(content) * 2 // 3],
+        ])
+    return content
+
+
+def _answer_content(messages: list) -> str:
+    return json.dumps({
+        "step_by_step_analysis": "这是本地模拟服务生成的回答。",
+        "reasoning_summary": "模拟",
+        "relevant_pages": [1],
+        "final_answer": f"模拟回答：{messages[-1]['content'][-30:]}",
+    }, ensure_ascii=False)
+
+
+def _message_output(content: str, finish_reason: str = "stop") -> dict:
+    return {"choices": [{"finish_reason": finish_reason, "message": {"role": "assistant", "content": content}}]}
+
+
+@app.post("/api/v1/services/aigc/text-generation/generation")
+async def generation(request: Request):
+    body = await request.json()
+    messages = body.get("input", {}).get("messages", [])
+    stream = request.headers.get("X-DashScope-SSE") == "enable"
+    stats["stream" if stream else "generation"] += 1
+
+    error = await _inject_faults()
+    if error is not None:
+        return error
+
+    user_prompt = messages[-1]["content"] if messages else ""
+    content = _rerank_content(user_prompt) if '"block_idx"' in user_prompt else _answer_content(messages)
+    request_id = str(uuid.uuid4())
+    usage = {"input_tokens": sum(len(m["content"]) for m in messages), "output_tokens": len(content)}
+    if not stream:
+        return {"output": _message_output(content), "usage": usage, "request_id": request_id}
+
+    async def events():
+        pieces = [content[i:i + 4] for i in range(0, len(content), 4)]
+        for i, piece in enumerate(pieces):
+            await asyncio.sleep(faults["token_interval_ms"] / 1000)
+            finish_reason = "stop" if i == len(pieces) - 1 else "null"
+            data = {"output": _message_output(piece, finish_reason), "usage": usage, "request_id": request_id}
+            yield f"id:{i + 1}\nevent:result\n:HTTP_STATUS/200\ndata:{json.dumps(data, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.post("/api/v1/services/embeddings/text-embedding/text-embedding")
+async def embedding(request: Request):
+    body = await request.json()
+    texts = body.get("input", {}).get("texts", [])
+    stats["embedding"] += 1
+    error = await _inject_faults()
+    if error is not None:
+        return error
+    embeddings = []
+    for i, text in enumerate(texts):
+        # 由文本哈希决定的固定向量，同一文本每次结果相同
+        seed = int(hashlib.sha1(text.encode("utf-8")).hexdigest()[:8], 16)
+        vector = np.random.default_rng(seed).standard_normal(faults["dim"])
+        embeddings.append({"text_index": i, "embedding": vector.round(6).tolist()})
+    return {"output": {"embeddings": embeddings}, "usage": {"total_tokens": sum(len(t) for t in texts)},
+            "request_id": str(uuid.uuid4())}
+
+
+@app.get("/_faults")
+async def get_faults():
+    return {"faults": faults, "stats": stats}
+
+
+@app.post("/_faults")
+async def set_faults(request: Request):
+    updates = await request.json()
+    unknown = set(updates) - set(faults)
+    if unknown:
+        return JSONResponse(status_code=400, content={"message": f"未知参数: {sorted(unknown)}"})
+    faults.update(updates)
+    return {"faults": faults}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟 DashScope 服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    for key, value in faults.items():
+        parser.add_argument(f"--{key.replace('_', '-')}", type=type(value), default=value)
+    args = parser.parse_args()
+    faults.update({key: getattr(args, key) for key in faults})
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == '__main__':
+    main()